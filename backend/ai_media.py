@@ -4,6 +4,13 @@ import base64
 import json
 from datetime import datetime
 import hashlib
+import logging
+
+import deadline
+from singleflight import SingleFlight, SingleFlightTimeout, normalize_prompt
+from provider_routing import ProviderRouter
+from media_store import media_store
+from vision_board import build_spec, vision_board_renderer
 
 # Example: DALL·E 3 API integration (replace with actual API endpoint and key)
 DALLE_API_URL = os.getenv('DALLE_API_URL', 'https://api.openai.com/v1/images/generations')
@@ -21,20 +28,108 @@ PIKA_API_KEY = os.getenv('PIKA_API_KEY', 'your_pika_api_key')
 SYNTHESIA_API_URL = os.getenv('SYNTHESIA_API_URL', 'https://api.synthesia.io/v1/videos')
 SYNTHESIA_API_KEY = os.getenv('SYNTHESIA_API_KEY', 'your_synthesia_api_key')
 
+# Identical prompts in flight at the same time share a single provider call.
+# Waiters give up after these many seconds and use their own fallback.
+IMAGE_COALESCE_TIMEOUT = float(os.getenv('IMAGE_COALESCE_TIMEOUT', '35'))
+VIDEO_COALESCE_TIMEOUT = float(os.getenv('VIDEO_COALESCE_TIMEOUT', '65'))
+
+# Provider timeouts; inside a request they shrink to the time left in its budget
+IMAGE_REQUEST_TIMEOUT = 30
+VIDEO_REQUEST_TIMEOUT = 60
+# Not worth calling a provider with less time than this left
+MIN_PROVIDER_SECONDS = float(os.getenv('MIN_PROVIDER_BUDGET_MS', '1000')) / 1000
+
+logger = logging.getLogger(__name__)
+
+media_flight = SingleFlight('media')
+
+def _provider_timeout(default, provider):
+    """Timeout for a provider call from the remaining request budget, or None to use the fallback"""
+    timeout = deadline.timeout_for(default)
+    if timeout < MIN_PROVIDER_SECONDS:
+        logger.warning(f"{provider}: {timeout:.2f}s left in request budget, using fallback",
+                       extra={'provider': provider, 'remaining_s': round(timeout, 3)})
+        deadline.note_degraded(provider)
+        return None
+    return timeout
+
+def _store_locally(result):
+    """Queue a local copy of generated media and point the result at it"""
+    if result.get('fallback'):
+        return result
+    for field, kind in (('image_url', 'image'), ('video_url', 'video')):
+        if result.get(field):
+            result['local_url'] = media_store.register_remote(result[field], kind)
+    return result
+
+def _coalesced(provider, enhanced_prompt, call, fallback, timeout):
+    """Run a provider call through single-flight, keyed on provider + normalized prompt"""
+    key = (provider, normalize_prompt(enhanced_prompt))
+    timeout = deadline.timeout_for(timeout)
+    try:
+        result, shared = media_flight.do(key, lambda: _store_locally(call()), timeout=timeout)
+    except SingleFlightTimeout:
+        logger.warning(f"{provider} coalesced wait timed out after {timeout}s, using fallback",
+                       extra={'provider': provider})
+        deadline.note_degraded(provider)
+        return fallback()
+    if shared:
+        result = {**result, 'coalesced': True}
+    return result
+
+def get_coalescing_stats():
+    """Single-flight counters for media generation"""
+    return media_flight.get_stats()
+
+def _dalle_prompt(prompt, user_context=None):
+    # Enhance prompt with user context
+    if user_context:
+        return f"Professional lifestyle image: {prompt}. Person aged {user_context.get('age', 25)}, working as {user_context.get('dreamCareer', 'professional')}, high quality, realistic"
+    return f"Professional lifestyle image: {prompt}, high quality, realistic"
+
+def _sd_prompt(prompt, user_context=None):
+    if user_context:
+        return f"{prompt}, person aged {user_context.get('age', 25)}, {user_context.get('dreamCareer', 'professional')} setting"
+    return prompt
+
+# Image providers ranked by recent p95 latency and error rate
+image_router = ProviderRouter('image', ['dalle', 'sd'], is_failure=lambda result: bool(result.get('fallback')))
+
+def generate_image_fastest(prompt, user_context=None):
+    """Generate an image with whichever provider is currently fastest, hedging to the other"""
+    calls = {
+        'dalle': lambda session: _request_dalle_image(prompt, _dalle_prompt(prompt, user_context), user_context, session),
+        'sd': lambda session: _request_sd_image(prompt, _sd_prompt(prompt, user_context), user_context, session)
+    }
+    return _coalesced(
+        'fastest', _dalle_prompt(prompt, user_context),
+        lambda: image_router.call(calls, lambda: generate_fallback_image(prompt, user_context)),
+        lambda: generate_fallback_image(prompt, user_context),
+        IMAGE_COALESCE_TIMEOUT
+    )
+
+def get_routing_stats():
+    """Per-provider latency, error and hedging counters for image routing"""
+    return image_router.get_stats()
+
 def generate_dalle_image(prompt, user_context=None):
     """Generate image using DALL·E 3 with enhanced error handling"""
+    enhanced_prompt = _dalle_prompt(prompt, user_context)
+
+    return _coalesced(
+        'dalle', enhanced_prompt,
+        lambda: _request_dalle_image(prompt, enhanced_prompt, user_context),
+        lambda: generate_fallback_image(prompt, user_context),
+        IMAGE_COALESCE_TIMEOUT
+    )
+
+def _request_dalle_image(prompt, enhanced_prompt, user_context=None, session=None):
     try:
         headers = {
             'Authorization': f'Bearer {DALLE_API_KEY}',
             'Content-Type': 'application/json'
         }
         
-        # Enhance prompt with user context
-        if user_context:
-            enhanced_prompt = f"Professional lifestyle image: {prompt}. Person aged {user_context.get('age', 25)}, working as {user_context.get('dreamCareer', 'professional')}, high quality, realistic"
-        else:
-            enhanced_prompt = f"Professional lifestyle image: {prompt}, high quality, realistic"
-        
         data = {
             'model': 'dall-e-3',
             'prompt': enhanced_prompt[:1000],  # Limit prompt length
@@ -43,7 +138,10 @@ def generate_dalle_image(prompt, user_context=None):
             'quality': 'standard'
         }
         
-        response = requests.post(DALLE_API_URL, headers=headers, json=data, timeout=30)
+        timeout = _provider_timeout(IMAGE_REQUEST_TIMEOUT, 'dalle')
+        if timeout is None:
+            return generate_fallback_image(prompt, user_context)
+        response = (session or requests).post(DALLE_API_URL, headers=headers, json=data, timeout=timeout)
         
         if response.status_code == 200:
             result = response.json()
@@ -55,26 +153,32 @@ def generate_dalle_image(prompt, user_context=None):
                 'model': 'dall-e-3'
             }
         else:
-            print(f"DALL·E API error: {response.status_code} - {response.text}")
+            logger.warning(f"DALL·E API error: {response.status_code}",
+                           extra={'provider': 'dalle', 'status': response.status_code, 'body': response.text[:200]})
             return generate_fallback_image(prompt, user_context)
             
     except Exception as e:
-        print(f"DALL·E generation failed: {e}")
+        logger.warning(f"DALL·E generation failed: {e}", extra={'provider': 'dalle'})
         return generate_fallback_image(prompt, user_context)
 
 def generate_sd_image(prompt, user_context=None):
     """Generate image using Stable Diffusion with enhanced error handling"""
+    enhanced_prompt = _sd_prompt(prompt, user_context)
+
+    return _coalesced(
+        'sd', enhanced_prompt,
+        lambda: _request_sd_image(prompt, enhanced_prompt, user_context),
+        lambda: generate_fallback_image(prompt, user_context),
+        IMAGE_COALESCE_TIMEOUT
+    )
+
+def _request_sd_image(prompt, enhanced_prompt, user_context=None, session=None):
     try:
         headers = {
             'Authorization': f'Bearer {SD_API_KEY}',
             'Content-Type': 'application/json'
         }
         
-        if user_context:
-            enhanced_prompt = f"{prompt}, person aged {user_context.get('age', 25)}, {user_context.get('dreamCareer', 'professional')} setting"
-        else:
-            enhanced_prompt = prompt
-        
         data = {
             'prompt': enhanced_prompt,
             'width': 1024,
@@ -82,7 +186,10 @@ def generate_sd_image(prompt, user_context=None):
             'samples': 1
         }
         
-        response = requests.post(SD_API_URL, headers=headers, json=data, timeout=30)
+        timeout = _provider_timeout(IMAGE_REQUEST_TIMEOUT, 'sd')
+        if timeout is None:
+            return generate_fallback_image(prompt, user_context)
+        response = (session or requests).post(SD_API_URL, headers=headers, json=data, timeout=timeout)
         
         if response.status_code == 200:
             result = response.json()
@@ -97,29 +204,40 @@ def generate_sd_image(prompt, user_context=None):
             return generate_fallback_image(prompt, user_context)
             
     except Exception as e:
-        print(f"Stable Diffusion generation failed: {e}")
+        logger.warning(f"Stable Diffusion generation failed: {e}", extra={'provider': 'sd'})
         return generate_fallback_image(prompt, user_context)
 
 def generate_pika_video(prompt, user_context=None):
     """Generate video using Pika Labs with enhanced error handling"""
+    if user_context:
+        enhanced_prompt = f"{prompt}, featuring {user_context.get('name', 'person')} in {user_context.get('dreamCareer', 'professional')} environment"
+    else:
+        enhanced_prompt = prompt
+
+    return _coalesced(
+        'pika', enhanced_prompt,
+        lambda: _request_pika_video(prompt, enhanced_prompt, user_context),
+        lambda: generate_fallback_video(prompt, user_context),
+        VIDEO_COALESCE_TIMEOUT
+    )
+
+def _request_pika_video(prompt, enhanced_prompt, user_context=None):
     try:
         headers = {
             'Authorization': f'Bearer {PIKA_API_KEY}',
             'Content-Type': 'application/json'
         }
         
-        if user_context:
-            enhanced_prompt = f"{prompt}, featuring {user_context.get('name', 'person')} in {user_context.get('dreamCareer', 'professional')} environment"
-        else:
-            enhanced_prompt = prompt
-        
         data = {
             'prompt': enhanced_prompt,
             'duration': 10,
             'aspect_ratio': '16:9'
         }
         
-        response = requests.post(PIKA_API_URL, headers=headers, json=data, timeout=60)
+        timeout = _provider_timeout(VIDEO_REQUEST_TIMEOUT, 'pika')
+        if timeout is None:
+            return generate_fallback_video(prompt, user_context)
+        response = requests.post(PIKA_API_URL, headers=headers, json=data, timeout=timeout)
         
         if response.status_code == 200:
             result = response.json()
@@ -135,7 +253,7 @@ def generate_pika_video(prompt, user_context=None):
             return generate_fallback_video(prompt, user_context)
             
     except Exception as e:
-        print(f"Pika Labs generation failed: {e}")
+        logger.warning(f"Pika Labs generation failed: {e}", extra={'provider': 'pika'})
         return generate_fallback_video(prompt, user_context)
 
 def generate_synthesia_video(script, user_context=None):
@@ -153,7 +271,10 @@ def generate_synthesia_video(script, user_context=None):
             'voice': 'neutral'
         }
         
-        response = requests.post(SYNTHESIA_API_URL, headers=headers, json=data, timeout=60)
+        timeout = _provider_timeout(VIDEO_REQUEST_TIMEOUT, 'synthesia')
+        if timeout is None:
+            return generate_fallback_video(script, user_context)
+        response = requests.post(SYNTHESIA_API_URL, headers=headers, json=data, timeout=timeout)
         
         if response.status_code == 200:
             result = response.json()
@@ -168,7 +289,7 @@ def generate_synthesia_video(script, user_context=None):
             return generate_fallback_video(script, user_context)
             
     except Exception as e:
-        print(f"Synthesia generation failed: {e}")
+        logger.warning(f"Synthesia generation failed: {e}", extra={'provider': 'synthesia'})
         return generate_fallback_video(script, user_context)
 
 def generate_fallback_image(prompt, user_context=None):
@@ -277,16 +398,22 @@ CLOSING CREDITS
         'rating': 'Everyone - Suitable for all audiences'
     }
 
+def future_image_prompt(user_data):
+    """Prompt for the "future you" image shown with a simulation"""
+    return f"Show {user_data.get('name', 'person')} as a successful {user_data.get('dreamCareer', 'professional')} in the year 2030"
+
+def avatar_prompt(user_data):
+    return f"Professional headshot of a {user_data.get('age', 25)} year old person, working as {user_data.get('dreamCareer', 'professional')}, confident, successful, high quality portrait"
+
 def generate_avatar_image(user_data):
     """Generate a personalized avatar image"""
     try:
-        prompt = f"Professional headshot of a {user_data.get('age', 25)} year old person, working as {user_data.get('dreamCareer', 'professional')}, confident, successful, high quality portrait"
-        return generate_dalle_image(prompt, user_data)
+        return generate_image_fastest(avatar_prompt(user_data), user_data)
     except Exception as e:
         return generate_fallback_image("professional avatar", user_data)
 
-def create_vision_board(user_data, goals):
-    """Create a vision board with user goals and aspirations"""
+def vision_board_text(user_data, goals, generated_at=None):
+    """Text version of a vision board and how many elements it has"""
     vision_elements = []
     
     # Career visualization
@@ -308,12 +435,22 @@ def create_vision_board(user_data, goals):
 
 📅 Target Timeline: Next 2-5 years
 💪 Success Probability: {user_data.get('score', 75)}%
-🎨 Generated: {datetime.now().strftime('%B %d, %Y')}
+🎨 Generated: {(generated_at or datetime.now()).strftime('%B %d, %Y')}
     """
+    return vision_board, len(vision_elements)
+
+def create_vision_board(user_data, goals, career_image=None, image_format='png'):
+    """Create a vision board with user goals and aspirations"""
+    vision_board, elements_count = vision_board_text(user_data, goals)
+    
+    # Rendered image is produced off-thread; image_url is set once it is ready
+    render = vision_board_renderer.submit(build_spec(user_data, goals, image_format, career_image))
     
     return {
         'success': True,
         'vision_board': vision_board,
-        'elements_count': len(vision_elements),
+        'elements_count': elements_count,
+        'render': render,
+        'image_url': render.get('image_url'),
         'timestamp': datetime.now().isoformat()
     }
@@ -0,0 +1,235 @@
+"""
+Client analytics event ingestion
+Parallel You: AI-Generated Personalized Reality Simulator
+
+Events are validated on the request thread and appended to a bounded
+in-memory buffer. A background writer drains the buffer, groups events into
+per-minute bucket documents and writes them with unordered bulk inserts.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+import logging
+
+from pymongo.errors import BulkWriteError
+
+from database import get_analytics_collection
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = {
+    'view', 'share', 'like', 'media_play', 'media_complete',
+    'simulation_start', 'simulation_complete', 'click', 'signup', 'login'
+}
+
+MAX_BATCH_EVENTS = int(os.getenv('ANALYTICS_MAX_BATCH_EVENTS', '500'))
+BUFFER_CAPACITY = int(os.getenv('ANALYTICS_BUFFER_CAPACITY', '200000'))
+FLUSH_BATCH_SIZE = int(os.getenv('ANALYTICS_FLUSH_BATCH_SIZE', '5000'))
+FLUSH_INTERVAL = float(os.getenv('ANALYTICS_FLUSH_INTERVAL', '1.0'))
+BUCKET_SECONDS = int(os.getenv('ANALYTICS_BUCKET_SECONDS', '60'))
+MAX_FLUSH_RETRIES = int(os.getenv('ANALYTICS_MAX_FLUSH_RETRIES', '3'))
+
+MAX_PROPERTIES = 16
+MAX_STRING_LENGTH = 256
+# Accept client timestamps within this window of server time, otherwise use server time
+MAX_CLOCK_SKEW = 24 * 3600
+
+
+def validate_event(event: Any, now: float) -> Tuple[Dict[str, Any], str]:
+    """Cheap shape check; returns (normalized_event, error)"""
+    if not isinstance(event, dict):
+        return None, 'event must be an object'
+    event_type = event.get('event_type')
+    if event_type not in EVENT_TYPES:
+        return None, 'unknown event_type'
+    user_id = event.get('user_id')
+    if user_id is not None and (not isinstance(user_id, str) or len(user_id) > MAX_STRING_LENGTH):
+        return None, 'invalid user_id'
+
+    ts = event.get('timestamp')
+    if not isinstance(ts, (int, float)) or isinstance(ts, bool) or abs(ts - now) > MAX_CLOCK_SKEW:
+        ts = now
+
+    properties = event.get('properties') or {}
+    if not isinstance(properties, dict) or len(properties) > MAX_PROPERTIES:
+        return None, 'invalid properties'
+    for value in properties.values():
+        if isinstance(value, str) and len(value) > MAX_STRING_LENGTH:
+            return None, 'property value too long'
+        if isinstance(value, (dict, list)):
+            return None, 'nested properties are not allowed'
+
+    return {'event_type': event_type, 'user_id': user_id, 'ts': float(ts), 'properties': properties}, None
+
+
+class EventBuffer:
+    def __init__(self, capacity: int = BUFFER_CAPACITY):
+        self.capacity = capacity
+        self._events = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._writer = None
+        self._stats = {
+            'accepted': 0, 'rejected_invalid': 0, 'rejected_backpressure': 0,
+            'written': 0, 'bucket_documents': 0, 'flushes': 0,
+            'flush_failures': 0, 'dropped': 0
+        }
+
+    def submit(self, events: List[Any]) -> Dict[str, Any]:
+        """Validate and buffer a batch; all-or-nothing with respect to capacity"""
+        self._ensure_writer()
+        now = time.time()
+        valid, errors = [], []
+        for index, event in enumerate(events):
+            normalized, error = validate_event(event, now)
+            if error:
+                errors.append({'index': index, 'error': error})
+            else:
+                valid.append(normalized)
+
+        with self._lock:
+            self._stats['rejected_invalid'] += len(errors)
+            if len(self._events) + len(valid) > self.capacity:
+                # Backpressure: refuse the batch rather than grow without bound
+                self._stats['rejected_backpressure'] += len(valid)
+                return {'accepted': 0, 'errors': errors, 'backpressure': True}
+            self._events.extend(valid)
+            self._stats['accepted'] += len(valid)
+            depth = len(self._events)
+
+        if depth >= FLUSH_BATCH_SIZE:
+            self._wakeup.set()
+        return {'accepted': len(valid), 'errors': errors, 'backpressure': False}
+
+    def depth(self) -> int:
+        with self._lock:
+            return len(self._events)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['buffered'] = len(self._events)
+        stats['capacity'] = self.capacity
+        stats['writer_alive'] = bool(self._writer and self._writer.is_alive())
+        return stats
+
+    def _ensure_writer(self):
+        if self._writer and self._writer.is_alive():
+            return
+        with self._lock:
+            if self._writer and self._writer.is_alive():
+                return
+            self._writer = threading.Thread(target=self._run, name='analytics-writer', daemon=True)
+            self._writer.start()
+
+    def _reset_after_fork(self):
+        # Threads and lock state do not survive fork; the child starts clean and
+        # leaves anything the parent buffered to the parent's writer
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._events = deque()
+        self._writer = None
+
+    def _drain(self, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            count = min(limit, len(self._events))
+            return [self._events.popleft() for _ in range(count)]
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(FLUSH_INTERVAL)
+            self._wakeup.clear()
+            while True:
+                batch = self._drain(FLUSH_BATCH_SIZE)
+                if not batch:
+                    break
+                self._flush(batch)
+                if len(batch) < FLUSH_BATCH_SIZE:
+                    break
+
+    def flush_now(self):
+        """Synchronously write everything currently buffered"""
+        while True:
+            batch = self._drain(FLUSH_BATCH_SIZE)
+            if not batch:
+                return
+            self._flush(batch)
+
+    def _flush(self, batch: List[Dict[str, Any]]):
+        collection = get_analytics_collection()
+        if collection is None:
+            with self._lock:
+                self._stats['dropped'] += len(batch)
+            return
+
+        documents = build_bucket_documents(batch)
+        for attempt in range(MAX_FLUSH_RETRIES):
+            try:
+                collection.insert_many(documents, ordered=False)
+                with self._lock:
+                    self._stats['written'] += len(batch)
+                    self._stats['bucket_documents'] += len(documents)
+                    self._stats['flushes'] += 1
+                return
+            except BulkWriteError as e:
+                # Unordered inserts keep going past bad documents; retrying would duplicate the rest.
+                # Duplicate keys mean an earlier attempt already wrote that document.
+                failed = [error for error in e.details.get('writeErrors', []) if error.get('code') != 11000]
+                lost = sum(documents[error['index']]['count'] for error in failed)
+                with self._lock:
+                    self._stats['flush_failures'] += 1
+                    self._stats['written'] += len(batch) - lost
+                    self._stats['bucket_documents'] += len(documents) - len(failed)
+                    self._stats['dropped'] += lost
+                logger.warning(f"Analytics flush dropped {lost} events in {len(failed)} rejected bucket documents")
+                return
+            except Exception as e:
+                with self._lock:
+                    self._stats['flush_failures'] += 1
+                logger.warning(f"Analytics flush attempt {attempt + 1} failed: {e}")
+                time.sleep(min(2 ** attempt * 0.1, 1.0))
+
+        # Bounded loss: a batch that keeps failing is dropped instead of blocking ingestion
+        with self._lock:
+            self._stats['dropped'] += len(batch)
+        logger.error(f"Dropped {len(batch)} analytics events after {MAX_FLUSH_RETRIES} failed flushes")
+
+
+def build_bucket_documents(batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Group events into one document per (event_type, time bucket)"""
+    buckets: Dict[Tuple[str, int], Dict[str, Any]] = {}
+    for event in batch:
+        bucket_start = int(event['ts']) // BUCKET_SECONDS * BUCKET_SECONDS
+        key = (event['event_type'], bucket_start)
+        doc = buckets.get(key)
+        if doc is None:
+            doc = buckets[key] = {
+                'event_type': event['event_type'],
+                'timestamp': datetime.utcfromtimestamp(bucket_start),
+                'bucket_seconds': BUCKET_SECONDS,
+                'count': 0,
+                'user_id': set(),
+                'events': []
+            }
+        doc['count'] += 1
+        if event['user_id']:
+            doc['user_id'].add(event['user_id'])
+        doc['events'].append({
+            'u': event['user_id'],
+            'o': round(event['ts'] - bucket_start, 3),
+            'p': event['properties']
+        })
+
+    documents = list(buckets.values())
+    for doc in documents:
+        doc['user_id'] = sorted(doc['user_id'])
+    return documents
+
+
+# Global event buffer (per worker process)
+event_buffer = EventBuffer()
+os.register_at_fork(after_in_child=event_buffer._reset_after_fork)
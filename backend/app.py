@@ -1,13 +1,12 @@
-from flask import Flask, request, jsonify, session
+from flask import Flask, Blueprint, request, jsonify, session, send_file, redirect, abort
 from flask_cors import CORS
-from pymongo import MongoClient
-from datetime import datetime, timedelta
-import random
+from datetime import datetime
 import json
-import uuid
 import os
 import hashlib
 import secrets
+import threading
+import logging
 from functools import wraps
 
 # Import models for user profile, scenario, and media
@@ -18,27 +17,60 @@ from models import UserProfile, Scenario, Media
 from ai_media import (
     generate_dalle_image, generate_sd_image, generate_pika_video, 
     generate_synthesia_video, generate_life_movie, generate_avatar_image, 
-    create_vision_board
+    create_vision_board, get_coalescing_stats, generate_image_fastest, get_routing_stats, future_image_prompt
 )
+from speculative_media import speculative_media, MEDIA_FIELDS as SPECULATIVE_MEDIA_FIELDS
+from shm_cache import shared_cache
+from media_store import media_store, variant_path, EXTENSION_TYPES
+from vision_board import vision_board_renderer, board_path, BOARD_FORMATS
+from analytics_events import event_buffer, MAX_BATCH_EVENTS
+from rollups import rollup_job, get_trending_careers, get_dashboard_metrics, get_population_stats
+from sketches import sketch_registry, sketch_persist_job
+from community_feed import (
+    community_feed, counter_buffer, feed_refresh_job, counter_flush_job,
+    share_scenario as share_community_scenario
+)
+from notifications import notify, poll as poll_notifications, mark_read as mark_notifications_read, inbox_waiters
+from success_model import model_server, model_reload_job
+from trajectories import trajectory_engine, MODES as TRAJECTORY_MODES
+from whatif import run_sweep, save_sweep_summary
+from simulation_export import export_job, EXPORT_INTERVAL
+from idempotency import idempotent, idempotency_store
+import deadline
+from deadline import with_deadline
+import log_pipeline
+from mongo_profiler import command_profiler, profile_report_job
+from ids import new_id
+from archive import archive_job, archive_stats, get_archived_simulation, get_archived_user_simulations
+from similarity import similarity_index, snapshot_job as similarity_snapshot_job, snapshot_reload_job as similarity_reload_job
+from simulation_content import (
+    generate_personalized_message, generate_recommendations, generate_3d_avatar_data, generate_ai_journal_entry
+)
+from content_bundles import bundle_index
+from compact_storage import compact_result, expand_result, SECTIONS as RESULT_SECTIONS
 from database import (
     db_manager, save_user, get_user_by_email, save_simulation as db_save_simulation,
-    get_user_simulations, get_analytics_data, User, Simulation
+    get_user_simulations, get_simulation, User, Simulation
 )
 
-app = Flask(__name__)
-CORS(app, supports_credentials=True)
-app.secret_key = os.environ.get('SECRET_KEY', secrets.token_hex(32))
+logger = logging.getLogger(__name__)
+
+api = Blueprint('api', __name__)
 
 
 # AI Image Generation Endpoint
-@app.route('/api/generate-image', methods=['POST'])
+@api.route('/api/generate-image', methods=['POST'])
+@idempotent('generate-image')
+@with_deadline
 def generate_image():
     data = request.json
     prompt = data.get('prompt', '')
-    model = data.get('model', 'dalle')
+    model = data.get('model', 'fastest')
     user_context = data.get('user_context', {})
     
-    if model == 'dalle':
+    if model == 'fastest':
+        result = generate_image_fastest(prompt, user_context)
+    elif model == 'dalle':
         result = generate_dalle_image(prompt, user_context)
     elif model == 'sd':
         result = generate_sd_image(prompt, user_context)
@@ -47,7 +79,9 @@ def generate_image():
     return jsonify(result)
 
 # AI Video Generation Endpoint
-@app.route('/api/generate-video', methods=['POST'])
+@api.route('/api/generate-video', methods=['POST'])
+@idempotent('generate-video')
+@with_deadline
 def generate_video():
     data = request.json
     prompt = data.get('prompt', '')
@@ -63,160 +97,172 @@ def generate_video():
         return jsonify({'error': 'Invalid model'}), 400
     return jsonify(result)
 
+# Media generation stats (single-flight coalescing, local store)
+@api.route('/api/media/stats', methods=['GET'])
+def media_stats():
+    return jsonify({
+        'coalescing': get_coalescing_stats(),
+        'store': media_store.get_stats(),
+        'vision_boards': vision_board_renderer.get_stats(),
+        'idempotency': idempotency_store.get_stats(),
+        'image_routing': get_routing_stats(),
+        'speculation': speculative_media.get_stats(),
+        'logging': log_pipeline.get_logging_stats()
+    })
 
-# Database connection using DatabaseManager
-print("🔗 Initializing database connection...")
-print(f"Database Status: {db_manager.get_stats()}")
-
-# Legacy collections for backward compatibility
-users_collection = db_manager.get_collection('users')
-simulations_collection = db_manager.get_collection('simulations')
-scenarios_collection = db_manager.get_collection('scenarios')
-
-# Career success factors and predictions
-CAREER_FACTORS = {
-    'software_engineer': {'base_score': 85, 'growth': 'high', 'salary': 'high'},
-    'doctor': {'base_score': 90, 'growth': 'medium', 'salary': 'very_high'},
-    'teacher': {'base_score': 75, 'growth': 'medium', 'salary': 'medium'},
-    'entrepreneur': {'base_score': 70, 'growth': 'very_high', 'salary': 'variable'},
-    'artist': {'base_score': 60, 'growth': 'variable', 'salary': 'variable'},
-    'scientist': {'base_score': 80, 'growth': 'medium', 'salary': 'high'},
-    'lawyer': {'base_score': 85, 'growth': 'medium', 'salary': 'very_high'},
-    'designer': {'base_score': 75, 'growth': 'high', 'salary': 'medium'},
-    'consultant': {'base_score': 80, 'growth': 'high', 'salary': 'high'},
-    'writer': {'base_score': 65, 'growth': 'variable', 'salary': 'variable'}
-}
-
-EDUCATION_BONUS = {
-    'high-school': 0,
-    'associate': 5,
-    'bachelor': 10,
-    'master': 15,
-    'phd': 20,
-    'other': 5
-}
-
-HABIT_BONUSES = {
-    'Exercise regularly': 8,
-    'Read daily': 6,
-    'Meditate': 5,
-    'Learn new skills': 10,
-    'Network actively': 7,
-    'Save money': 6,
-    'Travel frequently': 4,
-    'Volunteer': 3
-}
-
-def calculate_success_score(data):
-    """Calculate success score based on various factors"""
-    base_score = 50
-    
-    # Career factor
-    dream_career = data.get('dreamCareer', '').lower()
-    career_key = None
-    for key in CAREER_FACTORS:
-        if key in dream_career or dream_career in key:
-            career_key = key
-            break
-    
-    if career_key:
-        base_score = CAREER_FACTORS[career_key]['base_score']
-    else:
-        base_score = 70  # Default for unknown careers
-    
-    # Education bonus
-    education = data.get('education', '')
-    base_score += EDUCATION_BONUS.get(education, 0)
-    
-    # Age factor (younger = more potential)
-    age = int(data.get('age', 25))
-    if age < 25:
-        base_score += 10
-    elif age < 30:
-        base_score += 5
-    elif age > 50:
-        base_score -= 5
-    
-    # Habits bonus
-    habits = data.get('habits', [])
-    for habit in habits:
-        base_score += HABIT_BONUSES.get(habit, 0)
-    
-    # Add some randomness for realism
-    base_score += random.randint(-5, 10)
-    
-    return min(100, max(0, base_score))
-
-def generate_personalized_message(data, score):
-    """Generate personalized message based on user data"""
-    name = data.get('name', 'User')
-    age = data.get('age', '25')
-    dream_career = data.get('dreamCareer', 'your chosen field')
-    education = data.get('education', '')
-    habits = data.get('habits', [])
-    
-    # Base message
-    if score >= 90:
-        message = f"🌟 Excellent! {name}, your path to becoming a {dream_career} looks incredibly promising!"
-    elif score >= 80:
-        message = f"🚀 Great potential! {name}, you have strong prospects in {dream_career}."
-    elif score >= 70:
-        message = f"💪 Good foundation! {name}, with some focused effort, {dream_career} is definitely achievable."
-    elif score >= 60:
-        message = f"📈 Room for growth! {name}, {dream_career} is possible with dedication and planning."
-    else:
-        message = f"🎯 Consider alternatives! {name}, you might want to explore related fields or build more experience first."
-    
-    # Add age-specific advice
-    if int(age) < 25:
-        message += " Your youth gives you time to build the perfect foundation!"
-    elif int(age) < 35:
-        message += " You're at a great age to make this career transition!"
-    else:
-        message += " Your experience is valuable - leverage it strategically!"
-    
-    return message
-
-def generate_recommendations(data, score):
-    """Generate actionable recommendations"""
-    recommendations = []
-    dream_career = data.get('dreamCareer', '').lower()
-    education = data.get('education', '')
-    habits = data.get('habits', [])
-    
-    # Education recommendations
-    if education in ['high-school', 'associate'] and 'bachelor' not in dream_career:
-        recommendations.append("Consider pursuing higher education or specialized certifications")
-    
-    # Skill development
-    if 'Learn new skills' not in habits:
-        recommendations.append("Start learning new skills relevant to your target career")
-    
-    # Networking
-    if 'Network actively' not in habits:
-        recommendations.append("Build your professional network in your target industry")
-    
-    # Experience building
-    if not data.get('currentCareer'):
-        recommendations.append("Gain relevant work experience through internships or projects")
-    
-    # Financial planning
-    if 'Save money' not in habits:
-        recommendations.append("Build a financial safety net for career transition")
-    
-    # Health and wellness
-    if 'Exercise regularly' not in habits:
-        recommendations.append("Maintain physical and mental health for peak performance")
-    
-    # Career-specific advice
-    if 'entrepreneur' in dream_career:
-        recommendations.append("Start with a side project to test your business ideas")
-    elif 'artist' in dream_career or 'writer' in dream_career:
-        recommendations.append("Build a portfolio and online presence to showcase your work")
-    elif 'doctor' in dream_career or 'lawyer' in dream_career:
-        recommendations.append("Research specific requirements and prerequisites for your field")
-    
-    return recommendations[:5]  # Limit to 5 recommendations
+# Hit rate and spend of speculative media pre-generation
+@api.route('/api/media/speculation', methods=['GET'])
+def speculation_report():
+    try:
+        return jsonify(speculative_media.report())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Host-wide shared-memory cache (hits and evictions across all workers on this host)
+@api.route('/api/cache/stats', methods=['GET'])
+def shared_cache_stats():
+    return jsonify(shared_cache.get_stats())
+
+# Locally stored media
+MEDIA_MAX_AGE = 365 * 24 * 3600
+
+def _is_content_hash(value):
+    return len(value) == 64 and all(c in '0123456789abcdef' for c in value)
+
+def _send_media(path, mimetype, etag):
+    # send_file hands the open file to the server's file wrapper (sendfile where available)
+    # and answers Range / If-None-Match requests itself
+    response = send_file(path, mimetype=mimetype, conditional=True, etag=etag, max_age=MEDIA_MAX_AGE)
+    response.headers['Cache-Control'] = f'public, max-age={MEDIA_MAX_AGE}, immutable'
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
+
+@api.route('/media/source/<key>', methods=['GET'])
+def media_by_source(key):
+    """Stable URL for generated media: local copy once stored, provider URL until then"""
+    entry = media_store.resolve_source(key)
+    if not entry:
+        abort(404)
+    if entry.get('content_hash'):
+        variant = request.args.get('variant')
+        if variant:
+            return redirect(f"/media/{entry['content_hash']}/{variant}.webp", code=302)
+        return redirect(f"/media/{entry['content_hash']}.{entry['extension']}", code=302)
+    return redirect(entry['source_url'], code=302)
+
+@api.route('/media/<content_hash>.<extension>', methods=['GET'])
+def media_object(content_hash, extension):
+    if not _is_content_hash(content_hash) or extension not in EXTENSION_TYPES:
+        abort(404)
+    path = media_store.local_file(content_hash, extension)
+    if not path:
+        abort(404)
+    return _send_media(path, EXTENSION_TYPES[extension], content_hash)
+
+@api.route('/media/boards/<board_id>.<fmt>', methods=['GET'])
+def vision_board_image(board_id, fmt):
+    if not _is_content_hash(board_id) or fmt not in BOARD_FORMATS:
+        abort(404)
+    path = board_path(board_id, fmt)
+    if not os.path.exists(path):
+        abort(404)
+    return _send_media(path, f"image/{fmt}", board_id)
+
+@api.route('/api/vision-boards/<board_id>', methods=['GET'])
+def vision_board_status(board_id):
+    """Render status of a vision board; includes image_url once it is ready"""
+    fmt = request.args.get('format', 'png')
+    if not _is_content_hash(board_id) or fmt not in BOARD_FORMATS:
+        return jsonify({'error': 'Unknown vision board'}), 404
+    return jsonify(vision_board_renderer.status(board_id, fmt))
+
+@api.route('/media/<content_hash>/<variant>.webp', methods=['GET'])
+def media_variant(content_hash, variant):
+    if not _is_content_hash(content_hash) or not variant.replace('_', '').isalnum():
+        abort(404)
+    path = variant_path(content_hash, variant)
+    if not os.path.exists(path):
+        abort(404)
+    return _send_media(path, 'image/webp', f"{content_hash}-{variant}")
+
+
+# Background services start once per worker process, on its first request, so
+# nothing connects or spawns threads at import time or in a pre-fork master
+_services_pid = None
+_services_lock = threading.Lock()
+
+def _reset_services_after_fork():
+    global _services_lock
+    _services_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_services_after_fork)
+
+def _warm_caches():
+    try:
+        sketch_registry.load()
+        community_feed.refresh()
+        model_server.reload()
+        similarity_index.load_snapshot()
+        bundle_index.reload()
+    except Exception as e:
+        logger.warning(f"Cache warmup failed: {e}")
+
+def start_background_services():
+    """Start this worker's background jobs and warm its caches (idempotent per process)"""
+    global _services_pid
+    if _services_pid == os.getpid():
+        return
+    with _services_lock:
+        if _services_pid == os.getpid():
+            return
+        _services_pid = os.getpid()
+
+        # Background rollups and sketch persistence for the analytics dashboard
+        rollup_job.start()
+        sketch_persist_job.start()
+
+        # Community feed ranking and buffered engagement counters
+        feed_refresh_job.start()
+        counter_flush_job.start()
+
+        # Learned success-score model, hot-reloaded when a new version is published
+        model_reload_job.start()
+
+        # Columnar export for offline analytics (disabled unless an interval is configured)
+        if EXPORT_INTERVAL > 0:
+            export_job.start()
+
+        # Old simulations move to compressed archive segments
+        archive_job.start()
+
+        # Nearest-neighbour index: one worker rebuilds the snapshot, every worker reloads it
+        similarity_snapshot_job.start()
+        similarity_reload_job.start()
+
+        # Digest of Mongo command latencies and slow query shapes
+        profile_report_job.start()
+
+        threading.Thread(target=_warm_caches, name='cache-warmup', daemon=True).start()
+
+def create_app():
+    """Application factory; Mongo connects lazily and jobs start on the worker's first request.
+
+    Indexes and database stats are handled by `python backend/manage.py migrate|warmup`.
+    """
+    log_pipeline.configure_logging()
+    flask_app = Flask(__name__)
+    CORS(flask_app, supports_credentials=True)
+    flask_app.secret_key = os.environ.get('SECRET_KEY', secrets.token_hex(32))
+    flask_app.register_blueprint(api)
+    flask_app.before_request(start_background_services)
+    flask_app.before_request(log_pipeline.begin_request)
+    flask_app.after_request(_log_request_summary)
+    return flask_app
+
+def _log_request_summary(response):
+    """One log line per request, carrying the INFO records folded into it"""
+    log_pipeline.end_request(request.method, request.path, response.status_code)
+    return response
 
 # Authentication functions
 def hash_password(password):
@@ -236,149 +282,48 @@ def require_auth(f):
         return f(*args, **kwargs)
     return decorated_function
 
-def generate_ar_vr_content(data, score):
-    """Generate AR/VR content suggestions"""
-    dream_career = data.get('dreamCareer', '').lower()
-    suggestions = []
-
-    # AR/VR career-specific content
-    if 'engineer' in dream_career or 'developer' in dream_career:
-        suggestions.extend([
-            "🥽 Use AR to visualize code architecture in 3D space",
-            "🎮 Practice coding in VR environments like CodeCombat VR",
-            "📱 Try AR apps to see how your software would look in real world",
-            "🎯 Use VR to simulate debugging complex systems"
-        ])
-    elif 'doctor' in dream_career or 'medical' in dream_career:
-        suggestions.extend([
-            "🩺 Practice surgery in VR medical simulators",
-            "🧠 Use AR to study human anatomy in 3D",
-            "💊 Visualize drug interactions in VR molecular models",
-            "🏥 Experience hospital workflows in VR training"
-        ])
-    elif 'artist' in dream_career or 'designer' in dream_career:
-        suggestions.extend([
-            "🎨 Create 3D art in VR using Tilt Brush or Gravity Sketch",
-            "🏗️ Design buildings in AR using Magic Leap or HoloLens",
-            "🎭 Experience your art installations in VR before building",
-            "📐 Use AR to visualize designs in real-world spaces"
-        ])
-    elif 'entrepreneur' in dream_career:
-        suggestions.extend([
-            "🏢 Present your business ideas in VR boardrooms",
-            "📊 Visualize market data in 3D AR dashboards",
-            "🌍 Explore global markets in VR environments",
-            "🤝 Practice investor pitches in AR meeting rooms"
-        ])
-    
-    # General AR/VR suggestions
-    suggestions.extend([
-        "🌍 Explore your future workplace in VR",
-        "👥 Practice networking in virtual conferences",
-        "📚 Learn new skills in immersive VR classrooms",
-        "🏠 Visualize your future home in AR"
-    ])
-    
-    return suggestions[:6]
-
-def generate_3d_avatar_data(data):
-    """Generate 3D avatar data for AR/VR"""
-    return {
-        "avatar_id": f"avatar_{uuid.uuid4().hex[:8]}",
-        "personality_traits": {
-            "confidence": min(100, data.get('score', 50) + 20),
-            "creativity": 75 if 'artist' in data.get('dreamCareer', '').lower() else 60,
-            "analytical": 85 if 'engineer' in data.get('dreamCareer', '').lower() else 70,
-            "social": 80 if 'Network actively' in data.get('habits', []) else 60
-        },
-        "appearance": {
-            "style": "professional" if data.get('education') in ['master', 'phd'] else "casual",
-            "age_group": "young_adult" if int(data.get('age', 25)) < 30 else "adult"
-        },
-        "voice_settings": {
-            "pitch": "medium",
-            "speed": "normal",
-            "accent": "neutral"
-        }
-    }
+# Operational endpoints require X-Admin-Token when ADMIN_TOKEN is set
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+def require_admin(f):
+    """Decorator for operational endpoints"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if ADMIN_TOKEN and not secrets.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN):
+            return jsonify({'error': 'Admin token required'}), 403
+        return f(*args, **kwargs)
+    return decorated_function
 
 def save_simulation(user_id, simulation_data, result):
     """Save simulation to database using Simulation model"""
     try:
-        simulation = Simulation.create(user_id, simulation_data, result, simulation_data.get('scenario_type', 'general'))
-        db_save_simulation(simulation)
+        # Only the score, template ids and media references are stored; text is rebuilt on read
+        simulation = Simulation.create(user_id, simulation_data, compact_result(result),
+                                       simulation_data.get('scenario_type', 'general'), result.get('simulation_id'))
+        if db_save_simulation(simulation):
+            sketch_registry.observe(
+                user_id, simulation_data.get('dreamCareer'), simulation_data.get('education'), result.get('score', 0)
+            )
+            similarity_index.add(simulation.simulation_id, user_id, simulation_data, result.get('score', 0))
         return result
     except Exception as e:
-        print(f"Failed to save simulation: {e}")
+        logger.error(f"Failed to save simulation: {e}")
         return result
 
-def generate_ai_journal_entry(data, score):
-    """Generate AI-powered journal entry for the simulation"""
-    name = data.get('name', 'User')
-    dream_career = data.get('dreamCareer', 'your chosen field')
-    age = data.get('age', '25')
-    
-    journal_entries = {
-        'high': f"Dear {name},\n\nToday I explored the path to becoming a {dream_career}. The simulation shows incredible potential - a {score}% success rate! At {age}, you're perfectly positioned to make this transition. The data suggests that your current habits and education are strong foundations for this career change.\n\nI can already envision you thriving in this new role, making meaningful contributions and finding deep satisfaction in your work. The journey ahead looks promising, and I'm excited to see how this unfolds in reality.\n\nKeep pushing forward - the future you is counting on it!\n\n- Your Digital Twin",
-        
-        'medium': f"Dear {name},\n\nI've been analyzing your potential path to {dream_career}, and the results are encouraging with a {score}% success rate. While there are some challenges ahead, your determination and the right preparation can definitely make this happen.\n\nAt {age}, you have valuable experience to build upon. The simulation suggests focusing on skill development and networking will be key to your success. I believe in your ability to overcome any obstacles and create the future you envision.\n\nRemember, every expert was once a beginner. Your digital twin is here to support you every step of the way.\n\n- Your Digital Twin",
-        
-        'low': f"Dear {name},\n\nThe simulation for becoming a {dream_career} shows a {score}% success rate, which means this path will require significant effort and strategic planning. But don't let this discourage you - some of the most rewarding journeys are the most challenging ones.\n\nAt {age}, you have time to build the necessary skills and experience. Consider this an opportunity to grow and develop in ways you never imagined. The simulation suggests focusing on education, gaining relevant experience, and building a strong network.\n\nYour digital twin believes in your potential to achieve anything you set your mind to. Let's create a plan together!\n\n- Your Digital Twin"
-    }
-    
-    if score >= 80:
-        return journal_entries['high']
-    elif score >= 60:
-        return journal_entries['medium']
-    else:
-        return journal_entries['low']
-
-def generate_multimedia_suggestions(data, score):
-    """Generate multimedia content suggestions"""
-    dream_career = data.get('dreamCareer', '').lower()
-    suggestions = []
-
-    # Career-specific multimedia suggestions
-    if 'engineer' in dream_career or 'developer' in dream_career:
-        suggestions.extend([
-            "📱 Create a coding portfolio website",
-            "🎥 Record coding tutorials on YouTube",
-            "📸 Document your coding journey on Instagram",
-            "🎵 Listen to coding-focused podcasts during commutes"
-        ])
-    elif 'artist' in dream_career or 'designer' in dream_career:
-        suggestions.extend([
-            "🎨 Build an online art portfolio",
-            "📹 Create time-lapse videos of your creative process",
-            "📱 Share daily sketches on social media",
-            "🎵 Create playlists that inspire your creativity"
-        ])
-    elif 'entrepreneur' in dream_career:
-        suggestions.extend([
-            "📹 Start a business vlog documenting your journey",
-            "🎙️ Record podcast interviews with successful entrepreneurs",
-            "📸 Create visual business plans and pitch decks",
-            "🎵 Listen to business and startup podcasts"
-        ])
-    
-    # General suggestions based on score
-    if score >= 80:
-        suggestions.extend([
-            "🎉 Create a vision board with your career goals",
-            "📹 Record a 'future self' video message",
-            "📸 Take professional headshots for your new career"
-        ])
-    
-    return suggestions[:6]  # Return top 6 suggestions
+# Persisting a simulation is skipped when less than this is left of the request budget
+MIN_PERSIST_SECONDS = float(os.getenv('MIN_PERSIST_BUDGET_MS', '200')) / 1000
 
-@app.route('/predict', methods=['POST'])
+@api.route('/predict', methods=['POST'])
+@idempotent('predict')
+@with_deadline
 def predict():
     try:
         data = request.json or {}
-        user_id = data.get('user_id', str(uuid.uuid4()))
+        user_id = data.get('user_id') or new_id('user')
         
-        # Calculate success score
-        score = calculate_success_score(data)
+        # Calculate success score (learned model, formula fallback)
+        scored = model_server.score(data)
+        score = scored['score']
         
         # Generate personalized message
         message = generate_personalized_message(data, score)
@@ -389,60 +334,72 @@ def predict():
         # Generate AI journal entry
         journal_entry = generate_ai_journal_entry(data, score)
         
-        # Generate multimedia suggestions
-        multimedia_suggestions = generate_multimedia_suggestions(data, score)
-        
-        # Generate AR/VR content suggestions
-        ar_vr_suggestions = generate_ar_vr_content(data, score)
+        # Suggestion lists and insights depend only on career family and score tier: they come
+        # from the prebuilt bundle, or the client fetches that bundle from nginx itself
+        bundle_ref = None
+        if data.get('content_bundles') == 'reference':
+            bundle_ref = bundle_index.reference(data.get('dreamCareer', ''), score)
+        career_tier_sections = {'content_bundle': bundle_ref} if bundle_ref else bundle_index.sections(
+            data.get('dreamCareer', ''), score
+        )
         
         # Generate 3D avatar data
         avatar_data = generate_3d_avatar_data({**data, 'score': score})
         
-        # Additional insights
-        insights = {
-            'career_growth_potential': 'High' if score >= 80 else 'Medium' if score >= 60 else 'Needs Development',
-            'time_to_success': '2-3 years' if score >= 80 else '3-5 years' if score >= 60 else '5+ years',
-            'risk_level': 'Low' if score >= 80 else 'Medium' if score >= 60 else 'High',
-            'confidence_level': 'Very High' if score >= 85 else 'High' if score >= 70 else 'Medium' if score >= 55 else 'Low'
-        }
-        
         # Generate AI media if requested
+        # Media pre-generated when the profile was saved is used first
         media_results = {}
         if data.get('generate_image', False):
-            image_prompt = f"Show {data.get('name', 'person')} as a successful {data.get('dreamCareer', 'professional')} in the year 2030"
-            media_results['image'] = generate_dalle_image(image_prompt, data)
+            media_results['image'] = (speculative_media.take('image', data)
+                                      or generate_image_fastest(future_image_prompt(data), data))
         
         if data.get('generate_video', False):
             media_results['life_movie'] = generate_life_movie([data], data)
         
         if data.get('generate_avatar', False):
-            media_results['avatar'] = generate_avatar_image(data)
+            media_results['avatar'] = speculative_media.take('avatar', data) or generate_avatar_image(data)
         
         if data.get('create_vision_board', False):
             goals = {
                 'personal': data.get('personal_goals', []),
                 'professional': data.get('professional_goals', [])
             }
-            media_results['vision_board'] = create_vision_board({**data, 'score': score}, goals)
+            # The local copy has usually not landed yet; then the renderer fetches the provider URL itself
+            image = media_results.get('image') or {}
+            career_image = (media_store.path_for_local_url(image.get('local_url'))
+                            or (image.get('image_url') if image.get('success') else None))
+            media_results['vision_board'] = create_vision_board(
+                {**data, 'score': score}, goals, career_image, data.get('vision_board_format', 'png')
+            )
         
         # Enhanced result with new features
         result = {
             "message": message,
             "score": score,
+            "model_version": scored['model_version'],
             "recommendations": recommendations,
-            "insights": insights,
             "journal_entry": journal_entry,
-            "multimedia_suggestions": multimedia_suggestions,
-            "ar_vr_suggestions": ar_vr_suggestions,
+            **career_tier_sections,
             "avatar_data": avatar_data,
             "media": media_results,
-            "simulation_id": f"sim_{random.randint(10000, 99999)}",
+            "simulation_id": new_id('sim'),
             "timestamp": datetime.now().isoformat(),
             "user_id": user_id
         }
         
-        # Save simulation to database
-        save_simulation(user_id, data, result)
+        # Save simulation to database, unless the request budget is already spent
+        if deadline.has_time(MIN_PERSIST_SECONDS):
+            save_simulation(user_id, data, result)
+        else:
+            deadline.note_degraded('persistence')
+        if deadline.degraded():
+            result['degraded'] = deadline.degraded()
+        log_pipeline.annotate(simulation_id=result['simulation_id'], degraded=result.get('degraded'))
+        
+        if media_results.get('life_movie'):
+            notify(user_id, 'success', 'Your life movie is ready!',
+                   f"Your parallel journey to {data.get('dreamCareer', 'your dream career')} is ready to watch.",
+                   {'simulation_id': result['simulation_id']})
         
         return jsonify(result)
         
@@ -453,14 +410,63 @@ def predict():
             "error": str(e)
         }), 500
 
+@api.route('/api/simulate/trajectories', methods=['POST'])
+def simulate_trajectories():
+    """Distribution of outcomes over many simulated parallel lives"""
+    try:
+        data = request.json or {}
+        mode = data.get('mode', 'standard')
+        if mode not in TRAJECTORY_MODES:
+            return jsonify({"error": f"mode must be one of {sorted(TRAJECTORY_MODES)}"}), 400
+        seed = data.get('seed')
+        if seed is not None and (isinstance(seed, bool) or not isinstance(seed, int) or seed < 0):
+            return jsonify({"error": "seed must be a non-negative integer"}), 400
+        trajectories = data.get('trajectories')
+        if trajectories is not None and (isinstance(trajectories, bool) or not isinstance(trajectories, int)
+                                         or trajectories < 1):
+            return jsonify({"error": "trajectories must be a positive integer"}), 400
+        years = data.get('years', 10)
+        if isinstance(years, bool) or not isinstance(years, int) or years < 1:
+            return jsonify({"error": "years must be a positive integer"}), 400
+        result = trajectory_engine.simulate(data, trajectories, years, seed, mode)
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@api.route('/api/simulate/trajectories/stats', methods=['GET'])
+def trajectory_stats():
+    return jsonify(trajectory_engine.get_stats())
+
+@api.route('/api/whatif/sweep', methods=['POST'])
+def whatif_sweep():
+    """Rank every combination of alternative careers, education levels and habit toggles"""
+    data = request.json or {}
+    profile = data.get('profile') or {}
+    try:
+        sweep = run_sweep(profile, data.get('axes') or {}, int(data.get('top', 20)))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    sweep['sweep_id'] = save_sweep_summary(data.get('user_id'), profile, sweep)
+    return jsonify(sweep)
+
 # User Profile Endpoints
-@app.route('/api/profile', methods=['POST'])
+def _speculate_media(user_id, profile):
+    """Start generating the profile's avatar and "future you" image before /predict asks for them"""
+    try:
+        speculative_media.speculate(user_id, profile)
+    except Exception as e:
+        logger.warning(f"Media speculation failed for {user_id}: {e}")
+
+@api.route('/api/profile', methods=['POST'])
 def create_profile():
     data = request.json
     result = UserProfile.create(data)
+    _speculate_media(str(result.inserted_id), data)
     return jsonify({'inserted_id': str(result.inserted_id)}), 201
 
-@app.route('/api/profile/<user_id>', methods=['GET'])
+@api.route('/api/profile/<user_id>', methods=['GET'])
 def get_profile(user_id):
     profile = UserProfile.get(user_id)
     if profile:
@@ -468,102 +474,66 @@ def get_profile(user_id):
         return jsonify(profile)
     return jsonify({'error': 'Profile not found'}), 404
 
-@app.route('/api/profile/<user_id>', methods=['PUT'])
+@api.route('/api/profile/<user_id>', methods=['PUT'])
 def update_profile(user_id):
     data = request.json
     UserProfile.update(user_id, data)
+    if any(field in data for field in SPECULATIVE_MEDIA_FIELDS):
+        _speculate_media(user_id, UserProfile.get(user_id))
     return jsonify({'status': 'updated'})
 
 # Community Features Endpoints
-@app.route('/api/community/scenarios', methods=['GET'])
+@api.route('/api/community/scenarios', methods=['GET'])
 def get_community_scenarios():
-    """Get publicly shared scenarios"""
+    """Get publicly shared scenarios from the ranked feed"""
     try:
-        scenarios = [
-            {
-                "title": "Software Engineer → AI Researcher",
-                "description": "Transitioning from traditional software development to AI research",
-                "views": 1250,
-                "likes": 89,
-                "comments": 23,
-                "success_rate": 78,
-                "user": "Anonymous",
-                "timestamp": "2024-01-15T10:30:00Z",
-                "tags": ["technology", "ai", "research"]
-            },
-            {
-                "title": "Teacher → Educational Technology Entrepreneur", 
-                "description": "Leaving classroom teaching to build EdTech solutions",
-                "views": 980,
-                "likes": 67,
-                "comments": 15,
-                "success_rate": 85,
-                "user": "EduTech_Dreamer",
-                "timestamp": "2024-01-14T14:22:00Z",
-                "tags": ["education", "entrepreneurship", "technology"]
-            },
-            {
-                "title": "Marketing Manager → UX Designer",
-                "description": "Pivoting from marketing to user experience design",
-                "views": 756,
-                "likes": 54,
-                "comments": 12,
-                "success_rate": 82,
-                "user": "DesignMinded",
-                "timestamp": "2024-01-13T09:15:00Z",
-                "tags": ["design", "ux", "career-change"]
-            },
-            {
-                "title": "Doctor → Digital Health Startup Founder",
-                "description": "From practicing medicine to revolutionizing healthcare with technology",
-                "views": 1100,
-                "likes": 95,
-                "comments": 31,
-                "success_rate": 73,
-                "user": "HealthTech_MD",
-                "timestamp": "2024-01-12T16:45:00Z",
-                "tags": ["healthcare", "startups", "technology"]
-            },
-            {
-                "title": "Financial Analyst → Sustainable Finance Consultant",
-                "description": "Specializing in ESG investing and green finance",
-                "views": 642,
-                "likes": 41,
-                "comments": 8,
-                "success_rate": 79,
-                "user": "GreenFinance",
-                "timestamp": "2024-01-11T11:20:00Z",
-                "tags": ["finance", "sustainability", "consulting"]
-            }
-        ]
-        
-        return jsonify({
-            "scenarios": scenarios,
-            "total_count": len(scenarios),
-            "timestamp": datetime.now().isoformat()
-        })
+        page = community_feed.page(
+            tag=request.args.get('tag'),
+            cursor=request.args.get('cursor'),
+            limit=request.args.get('limit', 20, type=int)
+        )
+        page["timestamp"] = datetime.now().isoformat()
+        return jsonify(page)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/analytics/dashboard', methods=['GET'])
+def _count_scenario(scenario_id, field):
+    try:
+        accepted = counter_buffer.increment(scenario_id, field)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not accepted:
+        response = jsonify({"error": "Too many pending counter updates, please retry"})
+        response.headers['Retry-After'] = '2'
+        return response, 429
+    return jsonify({"success": True}), 202
+
+@api.route('/api/community/scenarios/<scenario_id>/view', methods=['POST'])
+def record_scenario_view(scenario_id):
+    return _count_scenario(scenario_id, 'views')
+
+@api.route('/api/community/scenarios/<scenario_id>/like', methods=['POST'])
+def record_scenario_like(scenario_id):
+    return _count_scenario(scenario_id, 'likes')
+
+@api.route('/api/analytics/dashboard', methods=['GET'])
 def get_analytics_dashboard():
     """Get analytics for dashboard"""
     try:
-        analytics = get_analytics_data()
+        # Totals and trending insights from the rollup buckets, never a scan of simulations
+        analytics = {}
+        if db_manager.is_connected():
+            analytics.update(get_population_stats())
+            analytics.update(get_dashboard_metrics())
+            analytics["trending_careers"] = get_trending_careers()
+        else:
+            analytics["error"] = "Database not connected"
+        
+        # Approximate unique users and score percentiles from in-memory sketches
+        analytics.update(sketch_registry.summary())
         
-        # Add trending insights
         analytics.update({
-            "trending_careers": [
-                {"career": "AI/ML Engineer", "growth": "+45%", "avg_score": 82},
-                {"career": "UX Designer", "growth": "+32%", "avg_score": 78},
-                {"career": "Data Scientist", "growth": "+28%", "avg_score": 80},
-                {"career": "Product Manager", "growth": "+25%", "avg_score": 75},
-                {"career": "Digital Marketer", "growth": "+22%", "avg_score": 73}
-            ],
             "user_satisfaction": 94.5,
-            "avg_success_score": 77.2,
-            "total_scenarios_run": 50000,
-            "active_users": 2500,
             "success_stories": 1850
         })
         
@@ -571,11 +541,42 @@ def get_analytics_dashboard():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/user/scenarios/<user_id>', methods=['GET'])
+@api.route('/api/analytics/events', methods=['POST'])
+def ingest_analytics_events():
+    """Accept a batch of client events for buffered, bulk persistence"""
+    data = request.get_json(silent=True) or {}
+    events = data.get('events')
+    if not isinstance(events, list) or not events:
+        return jsonify({"error": "events must be a non-empty list"}), 400
+    if len(events) > MAX_BATCH_EVENTS:
+        return jsonify({"error": f"at most {MAX_BATCH_EVENTS} events per batch"}), 413
+
+    outcome = event_buffer.submit(events)
+    if outcome['backpressure']:
+        response = jsonify({"error": "ingestion buffer full, retry later", "errors": outcome['errors']})
+        response.headers['Retry-After'] = '1'
+        return response, 429
+    return jsonify({"accepted": outcome['accepted'], "errors": outcome['errors']}), 202
+
+@api.route('/api/bundles/stats', methods=['GET'])
+def content_bundle_stats():
+    return jsonify(bundle_index.get_stats())
+
+@api.route('/api/model/stats', methods=['GET'])
+def success_model_stats():
+    return jsonify(model_server.get_stats())
+
+@api.route('/api/analytics/events/stats', methods=['GET'])
+def analytics_ingestion_stats():
+    return jsonify(event_buffer.get_stats())
+
+@api.route('/api/user/scenarios/<user_id>', methods=['GET'])
 def get_user_scenario_history(user_id):
-    """Get user's simulation history"""
+    """Get user's simulation history; include_archive=1 also reads archived simulations (slower)"""
     try:
         scenarios = get_user_simulations(user_id, limit=50)
+        if request.args.get('include_archive') in ('1', 'true') and len(scenarios) < 50:
+            scenarios += get_archived_user_simulations(user_id, limit=50 - len(scenarios))
         
         return jsonify({
             "scenarios": scenarios,
@@ -585,56 +586,108 @@ def get_user_scenario_history(user_id):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/community/share', methods=['POST'])
-def share_scenario():
-    """Share a scenario with the community"""
+@api.route('/api/simulations/<simulation_id>', methods=['GET'])
+def get_simulation_detail(simulation_id):
+    """Get a stored simulation, rebuilding only the requested result sections"""
     try:
-        data = request.json
-        scenario_id = data.get('scenario_id')
-        public = data.get('public', False)
+        doc = get_simulation(simulation_id) or get_archived_simulation(simulation_id)
+        if not doc:
+            return jsonify({"error": "Simulation not found"}), 404
         
-        # Mock implementation - in real app, update database
-        return jsonify({
-            "success": True,
-            "message": "Scenario shared successfully!",
-            "scenario_id": scenario_id,
-            "public": public
+        fields = request.args.get('fields')
+        sections = [f for f in fields.split(',') if f in RESULT_SECTIONS] if fields else None
+        result = expand_result(doc.get('input_data', {}), doc.get('result', {}), sections)
+        result.update({
+            "simulation_id": doc.get('simulation_id'),
+            "user_id": doc.get('user_id'),
+            "timestamp": doc['timestamp'].isoformat() if isinstance(doc.get('timestamp'), datetime) else doc.get('timestamp'),
+            "scenario_type": doc.get('scenario_type')
         })
+        return jsonify(result)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/notifications', methods=['GET'])
+@api.route('/api/similar', methods=['POST'])
+def similar_profiles():
+    """Outcomes of the most similar stored profiles ("people like you")"""
+    try:
+        data = request.json or {}
+        profile = data.get('profile') or data
+        user_id = data.get('user_id') or session.get('user_id')
+        k = data.get('k', 10)
+        if isinstance(k, bool) or not isinstance(k, int) or k < 1:
+            return jsonify({'error': 'k must be a positive integer'}), 400
+        return jsonify(similarity_index.query(profile, k, exclude_user=user_id))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@api.route('/api/similar/stats', methods=['GET'])
+def similarity_stats():
+    return jsonify(similarity_index.get_stats())
+
+@api.route('/api/admin/db/profile', methods=['GET'])
+@require_admin
+def db_profile():
+    """Mongo latency histograms, slow query shapes and COLLSCAN plans seen by this worker"""
+    try:
+        return jsonify(command_profiler.get_report(int(request.args.get('top', 20))))
+    except ValueError:
+        return jsonify({'error': 'top must be an integer'}), 400
+
+@api.route('/api/archive/stats', methods=['GET'])
+def simulation_archive_stats():
+    return jsonify({**archive_stats(), 'job': archive_job.get_status()})
+
+@api.route('/api/community/share', methods=['POST'])
+def share_scenario():
+    """Share a scenario with the community"""
+    try:
+        data = request.json or {}
+        result = share_community_scenario(data, session.get('user_id'))
+        if not result['success']:
+            status = result.pop('status', 400 if db_manager.is_connected() else 503)
+            return jsonify(result), status
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@api.route('/api/notifications', methods=['GET'])
 def get_notifications():
-    """Get user notifications"""
+    """Get user notifications; with wait=N, long-poll up to N seconds for new ones"""
     try:
-        notifications = [
-            {
-                "id": "notif_1",
-                "type": "success",
-                "title": "Simulation Complete!",
-                "message": "Your AI-generated career path simulation is ready to view.",
-                "timestamp": datetime.now().isoformat(),
-                "read": False
-            },
-            {
-                "id": "notif_2", 
-                "type": "community",
-                "title": "New Community Insight",
-                "message": "Check out the latest trending career transitions this week!",
-                "timestamp": (datetime.now() - timedelta(hours=2)).isoformat(),
-                "read": False
-            }
-        ]
-        
-        return jsonify({
-            "notifications": notifications,
-            "unread_count": sum(1 for n in notifications if not n['read'])
-        })
+        user_id = request.args.get('user_id') or session.get('user_id')
+        if not user_id:
+            return jsonify({"notifications": [], "unread_count": 0, "seq": 0})
+        return jsonify(poll_notifications(
+            user_id,
+            since_seq=request.args.get('since', 0, type=int),
+            wait_seconds=request.args.get('wait', 0, type=float),
+            # A single-threaded worker would stop serving everyone else while one client waits
+            can_block=request.environ.get('wsgi.multithread', False)
+        ))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@api.route('/api/notifications/read', methods=['POST'])
+def read_notifications():
+    """Mark notifications read (all of them when no ids are given)"""
+    try:
+        data = request.json or {}
+        user_id = data.get('user_id') or session.get('user_id')
+        if not user_id:
+            return jsonify({"error": "user_id is required"}), 400
+        ids = data.get('notification_ids')
+        updated = mark_notifications_read(user_id, ids if isinstance(ids, list) else None)
+        return jsonify({"success": True, "updated": updated})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@api.route('/api/notifications/stats', methods=['GET'])
+def notification_stats():
+    return jsonify(inbox_waiters.get_stats())
+
 # Health check endpoint
-@app.route('/health', methods=['GET'])
+@api.route('/health', methods=['GET'])
 def health_check():
     return jsonify({
         "status": "healthy",
@@ -643,5 +696,8 @@ def health_check():
         "version": "1.0.0"
     })
 
+# Module-level app for `python backend/app.py` and WSGI servers pointed at app:app
+app = create_app()
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,199 @@
+"""
+Tiered archival of old simulations
+Parallel You: AI-Generated Personalized Reality Simulator
+
+Simulations older than ARCHIVE_AFTER_DAYS move out of the hot `simulations`
+collection into `simulations_archive`. There they are stored as compressed
+segments of up to ARCHIVE_SEGMENT_SIZE documents from a single day. Each
+segment is one small document: a zlib-compressed run of BSON plus the
+simulation and user ids it contains, so a lookup decompresses only the
+segments it needs. A segment is written before its simulations are deleted
+from the hot collection, and its _id is derived from its first simulation,
+so a run interrupted between the two steps is finished by the next run.
+
+    python backend/archive.py run
+"""
+
+import os
+import sys
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+import logging
+
+import bson
+from bson.binary import Binary
+from pymongo.errors import DuplicateKeyError
+
+from database import get_simulations_collection, get_simulations_archive_collection
+from jobs import PeriodicJob, update_job_state, run_exclusive
+
+logger = logging.getLogger(__name__)
+
+JOB_NAME = 'simulation_archive'
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '180'))
+ARCHIVE_SEGMENT_SIZE = int(os.getenv('ARCHIVE_SEGMENT_SIZE', '500'))
+ARCHIVE_INTERVAL = float(os.getenv('ARCHIVE_INTERVAL_SECONDS', str(6 * 3600)))
+# Upper bound on simulations moved per run, to keep each run short
+ARCHIVE_MAX_PER_RUN = int(os.getenv('ARCHIVE_MAX_PER_RUN', '100000'))
+COMPRESSION_LEVEL = 6
+
+
+def encode_segment(docs: List[Dict[str, Any]]) -> bytes:
+    return zlib.compress(b''.join(bson.encode(doc) for doc in docs), COMPRESSION_LEVEL)
+
+
+def decode_segment(payload: bytes) -> List[Dict[str, Any]]:
+    return bson.decode_all(zlib.decompress(payload))
+
+
+def _segment(day: str, docs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    payload = encode_segment(docs)
+    return {
+        '_id': f"{day}:{docs[0]['_id']}",
+        'day': day,
+        'count': len(docs),
+        'first_timestamp': docs[0]['timestamp'],
+        'last_timestamp': docs[-1]['timestamp'],
+        'simulation_ids': [doc.get('simulation_id') for doc in docs],
+        'user_ids': sorted({doc.get('user_id') for doc in docs if doc.get('user_id')}),
+        'raw_bytes': sum(len(bson.encode(doc)) for doc in docs),
+        'payload': Binary(payload),
+        'archived_at': datetime.now()
+    }
+
+
+def _write_segment(archive, day: str, docs: List[Dict[str, Any]]) -> int:
+    segment = _segment(day, docs)
+    try:
+        archive.insert_one(segment)
+    except DuplicateKeyError:
+        # Written by an earlier run that stopped before deleting from the hot collection.
+        # That run may have held fewer (or other) simulations than this batch, so merge
+        # instead of assuming every doc in `docs` is already archived.
+        existing = archive.find_one({'_id': segment['_id']}, {'payload': 1})
+        merged = {doc['_id']: doc for doc in decode_segment(existing['payload'])} if existing else {}
+        merged.update((doc['_id'], doc) for doc in docs)
+        ordered = sorted(merged.values(), key=lambda doc: (doc['timestamp'], doc['_id']))
+        segment = _segment(day, ordered)
+        segment['_id'] = f"{day}:{docs[0]['_id']}"
+        archive.replace_one({'_id': segment['_id']}, segment, upsert=True)
+    return len(segment['payload'])
+
+
+def _archive_locked(now: datetime = None) -> Dict[str, Any]:
+    simulations = get_simulations_collection()
+    archive = get_simulations_archive_collection()
+    if simulations is None or archive is None:
+        return {'error': 'Database not connected'}
+
+    cutoff = (now or datetime.now()) - timedelta(days=ARCHIVE_AFTER_DAYS)
+    cursor = simulations.find({'timestamp': {'$lt': cutoff}}).sort([('timestamp', 1), ('_id', 1)]).limit(
+        ARCHIVE_MAX_PER_RUN
+    ).batch_size(ARCHIVE_SEGMENT_SIZE)
+
+    moved = segments = compressed = 0
+    pending: List[Dict[str, Any]] = []
+    day = None
+
+    def flush():
+        nonlocal moved, segments, compressed
+        if not pending:
+            return
+        compressed += _write_segment(archive, day, pending)
+        simulations.delete_many({'_id': {'$in': [doc['_id'] for doc in pending]}})
+        moved += len(pending)
+        segments += 1
+        pending.clear()
+
+    for doc in cursor:
+        doc_day = doc['timestamp'].strftime('%Y-%m-%d')
+        if doc_day != day or len(pending) >= ARCHIVE_SEGMENT_SIZE:
+            flush()
+            day = doc_day
+        pending.append(doc)
+    flush()
+
+    update_job_state(JOB_NAME, {'last_run': datetime.now(), 'last_moved': moved, 'cutoff': cutoff})
+    if moved:
+        logger.info(f"Archived {moved} simulations into {segments} segments ({compressed} bytes)")
+    return {'moved': moved, 'segments': segments, 'compressed_bytes': compressed, 'cutoff': cutoff.isoformat()}
+
+
+def run_archive() -> Optional[Dict[str, Any]]:
+    """Move old simulations to the archive; None if another worker holds the job lease"""
+    return run_exclusive(JOB_NAME, _archive_locked, lease_seconds=3600)
+
+
+archive_job = PeriodicJob(JOB_NAME, run_archive, ARCHIVE_INTERVAL)
+
+
+def get_archived_simulation(simulation_id: str) -> Optional[Dict[str, Any]]:
+    """Slow path for a simulation that is no longer in the hot collection"""
+    archive = get_simulations_archive_collection()
+    if archive is None:
+        return None
+    segment = archive.find_one({'simulation_ids': simulation_id}, {'payload': 1})
+    if not segment:
+        return None
+    for doc in decode_segment(segment['payload']):
+        if doc.get('simulation_id') == simulation_id:
+            doc.pop('_id', None)
+            return doc
+    return None
+
+
+def get_archived_user_simulations(user_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+    """A user's archived history, newest first, in the shape of get_user_simulations"""
+    archive = get_simulations_archive_collection()
+    if archive is None:
+        return []
+    found = []
+    for segment in archive.find({'user_ids': user_id}, {'payload': 1}).sort('last_timestamp', -1):
+        for doc in reversed(decode_segment(segment['payload'])):
+            if doc.get('user_id') != user_id:
+                continue
+            found.append({
+                'simulation_id': doc.get('simulation_id'),
+                'timestamp': doc.get('timestamp'),
+                'scenario_type': doc.get('scenario_type'),
+                'input_data': {'dreamCareer': (doc.get('input_data') or {}).get('dreamCareer')},
+                'result': {'score': (doc.get('result') or {}).get('score')},
+                'archived': True
+            })
+            if len(found) >= limit:
+                return found
+    return found
+
+
+def iter_archived_simulations(until: Optional[datetime] = None) -> Iterator[Dict[str, Any]]:
+    """Every archived simulation in time order (for full exports)"""
+    archive = get_simulations_archive_collection()
+    if archive is None:
+        return
+    query = {'first_timestamp': {'$lte': until}} if until else {}
+    for segment in archive.find(query, {'payload': 1}).sort([('first_timestamp', 1), ('_id', 1)]):
+        yield from decode_segment(segment['payload'])
+
+
+def archive_stats() -> Dict[str, Any]:
+    archive = get_simulations_archive_collection()
+    if archive is None:
+        return {'error': 'Database not connected'}
+    totals = next(archive.aggregate([{'$group': {
+        '_id': None, 'segments': {'$sum': 1}, 'simulations': {'$sum': '$count'},
+        'raw_bytes': {'$sum': '$raw_bytes'}, 'compressed_bytes': {'$sum': {'$binarySize': '$payload'}},
+        'oldest': {'$min': '$first_timestamp'}, 'newest': {'$max': '$last_timestamp'}
+    }}]), None)
+    if not totals:
+        return {'segments': 0, 'simulations': 0, 'archive_after_days': ARCHIVE_AFTER_DAYS}
+    totals.pop('_id')
+    totals['compression_ratio'] = round(totals['raw_bytes'] / totals['compressed_bytes'], 2) if totals['compressed_bytes'] else None
+    totals['archive_after_days'] = ARCHIVE_AFTER_DAYS
+    return totals
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'run':
+        print(run_archive())
+    print(archive_stats())
@@ -0,0 +1,290 @@
+"""
+Community scenario feed
+Parallel You: AI-Generated Personalized Reality Simulator
+
+Shared scenarios are stored in the `scenarios` collection. View and like
+counters are buffered in memory and written as batched `$inc` updates. The
+feed itself is a ranked top-N list rebuilt periodically in the background, so
+serving a page is a slice of an in-memory list.
+"""
+
+import base64
+import json
+import math
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from database import get_scenarios_collection, get_simulations_collection
+from jobs import PeriodicJob
+from notifications import notify
+
+logger = logging.getLogger(__name__)
+
+FEED_SIZE = int(os.getenv('FEED_SIZE', '500'))
+FEED_CANDIDATES = int(os.getenv('FEED_CANDIDATES', '5000'))
+FEED_MAX_AGE_DAYS = int(os.getenv('FEED_MAX_AGE_DAYS', '30'))
+FEED_REFRESH_INTERVAL = float(os.getenv('FEED_REFRESH_INTERVAL_SECONDS', '30'))
+COUNTER_FLUSH_INTERVAL = float(os.getenv('COUNTER_FLUSH_INTERVAL_SECONDS', '2'))
+# Rank = engagement / (age_hours + 2) ^ gravity
+FEED_GRAVITY = float(os.getenv('FEED_GRAVITY', '1.5'))
+MAX_PAGE_SIZE = 50
+COUNTER_FIELDS = ('views', 'likes', 'comments')
+# Distinct scenarios buffered between flushes; increments for new ids past this are dropped
+MAX_PENDING_SCENARIOS = int(os.getenv('COUNTER_MAX_PENDING_SCENARIOS', '10000'))
+MAX_SCENARIO_ID_LENGTH = 128
+
+FEED_PROJECTION = {
+    '_id': 0, 'scenario_id': 1, 'title': 1, 'description': 1, 'views': 1, 'likes': 1,
+    'comments': 1, 'success_rate': 1, 'user': 1, 'timestamp': 1, 'tags': 1
+}
+
+
+def _normalize_tags(tags: Any) -> List[str]:
+    if not isinstance(tags, list):
+        return []
+    normalized = []
+    for tag in tags[:10]:
+        if isinstance(tag, str) and tag.strip():
+            normalized.append(tag.strip().lower()[:32])
+    return sorted(set(normalized))
+
+
+def share_scenario(data: Dict[str, Any], session_user_id: Optional[str] = None) -> Dict[str, Any]:
+    """Persist (or update) a shared scenario; sharing the same scenario twice is idempotent
+
+    The owner is the simulation's user, else the signed-in user; never a user_id from
+    the request body. Only the owner can change a scenario once it is shared.
+    """
+    collection = get_scenarios_collection()
+    if collection is None:
+        return {'success': False, 'message': 'Database not connected'}
+
+    scenario_id = data.get('scenario_id')
+    if not scenario_id:
+        return {'success': False, 'message': 'scenario_id is required'}
+
+    # Pull the score and careers from the simulation being shared, when there is one
+    simulation = None
+    simulations = get_simulations_collection()
+    if simulations is not None:
+        simulation = simulations.find_one(
+            {'simulation_id': scenario_id},
+            {'_id': 0, 'user_id': 1, 'confidence_score': 1,
+             'input_data.currentCareer': 1, 'input_data.dreamCareer': 1}
+        )
+    owner = (simulation or {}).get('user_id') or session_user_id
+    if not owner:
+        return {'success': False, 'status': 403, 'message': 'Sign in to share a scenario'}
+    if simulation and session_user_id and simulation.get('user_id') != session_user_id:
+        return {'success': False, 'status': 403, 'message': 'You can only share your own simulations'}
+    inputs = (simulation or {}).get('input_data', {})
+    default_title = ' → '.join(filter(None, [inputs.get('currentCareer'), inputs.get('dreamCareer')]))
+
+    fields = {
+        'title': (data.get('title') or default_title or 'My Parallel Life')[:120],
+        'description': (data.get('description') or '')[:500],
+        'tags': _normalize_tags(data.get('tags')),
+        'public': bool(data.get('public', False)),
+        'user': (data.get('user') or 'Anonymous')[:64],
+        'success_rate': (simulation or {}).get('confidence_score', data.get('success_rate', 0))
+    }
+    try:
+        # Matching on the owner too (or no owner, for scenarios shared before owners were recorded):
+        # someone else's scenario_id makes the upsert collide on the unique index instead of overwriting
+        collection.update_one(
+            {'scenario_id': scenario_id, 'user_id': {'$in': [owner, None]}},
+            {
+                '$set': {**fields, 'user_id': owner},
+                '$setOnInsert': {
+                    'scenario_id': scenario_id, 'timestamp': datetime.now(),
+                    'views': 0, 'likes': 0, 'comments': 0
+                }
+            },
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return {'success': False, 'status': 403, 'message': 'This scenario was shared by another user'}
+    return {'success': True, 'message': 'Scenario shared successfully!',
+            'scenario_id': scenario_id, 'public': fields['public']}
+
+
+class CounterBuffer:
+    """Accumulates counter increments and writes them as one unordered bulk of $inc updates"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._stats = {'increments': 0, 'flushed_updates': 0, 'flushes': 0, 'failures': 0, 'dropped': 0}
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._pending = defaultdict(lambda: defaultdict(int))
+
+    def increment(self, scenario_id: str, field: str, amount: int = 1) -> bool:
+        """Buffer an increment; False if it was dropped because the buffer is full"""
+        if field not in COUNTER_FIELDS:
+            raise ValueError(f"Unknown counter: {field}")
+        if not scenario_id or len(scenario_id) > MAX_SCENARIO_ID_LENGTH:
+            raise ValueError(f"scenario_id must be 1-{MAX_SCENARIO_ID_LENGTH} characters")
+        with self._lock:
+            # Any path is accepted as a scenario id, so bound the distinct ids held until the next flush
+            if scenario_id not in self._pending and len(self._pending) >= MAX_PENDING_SCENARIOS:
+                self._stats['dropped'] += 1
+                return False
+            self._pending[scenario_id][field] += amount
+            self._stats['increments'] += 1
+        return True
+
+    def flush(self) -> int:
+        collection = get_scenarios_collection()
+        if collection is None:
+            return 0
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(lambda: defaultdict(int))
+        if not pending:
+            return 0
+
+        operations = [UpdateOne({'scenario_id': sid}, {'$inc': dict(fields)}) for sid, fields in pending.items()]
+        try:
+            collection.bulk_write(operations, ordered=False)
+        except Exception as e:
+            # Put the increments back so the next flush retries them
+            with self._lock:
+                for sid, fields in pending.items():
+                    for field, amount in fields.items():
+                        self._pending[sid][field] += amount
+                self._stats['failures'] += 1
+            logger.warning(f"Counter flush failed: {e}")
+            return 0
+        with self._lock:
+            self._stats['flushed_updates'] += len(operations)
+            self._stats['flushes'] += 1
+
+        liked = {sid: fields['likes'] for sid, fields in pending.items() if fields.get('likes')}
+        if liked:
+            self._notify_owners(collection, liked)
+        return len(operations)
+
+    def _notify_owners(self, collection, liked: Dict[str, int]):
+        # One lookup per flush for all liked scenarios, one notification per scenario
+        for scenario in collection.find({'scenario_id': {'$in': list(liked)}}, {'_id': 0, 'scenario_id': 1, 'user_id': 1, 'title': 1}):
+            count = liked[scenario['scenario_id']]
+            notify(
+                scenario.get('user_id'), 'community',
+                'New likes on your scenario',
+                f"{count} {'person' if count == 1 else 'people'} liked \"{scenario.get('title', 'your scenario')}\"",
+                {'scenario_id': scenario['scenario_id'], 'likes': count}
+            )
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, 'pending_scenarios': len(self._pending)}
+
+
+def rank_score(scenario: Dict[str, Any], now: datetime) -> float:
+    engagement = 1 + scenario.get('likes', 0) * 3 + scenario.get('comments', 0) * 2 + math.log1p(scenario.get('views', 0))
+    timestamp = scenario.get('timestamp') or now
+    age_hours = max((now - timestamp).total_seconds() / 3600, 0)
+    return engagement / math.pow(age_hours + 2, FEED_GRAVITY)
+
+
+class _FeedSnapshot:
+    def __init__(self, version: int, items: List[Dict[str, Any]]):
+        self.version = version
+        self.items = items
+        self.by_tag: Dict[str, List[int]] = defaultdict(list)
+        for position, item in enumerate(items):
+            for tag in item.get('tags', []):
+                self.by_tag[tag].append(position)
+        self.built_at = datetime.now()
+
+
+class CommunityFeed:
+    """Ranked, tag-indexed top-N feed rebuilt in the background and paged by cursor"""
+
+    def __init__(self):
+        self._current = _FeedSnapshot(0, [])
+        # The previous snapshot stays around so cursors survive one refresh
+        self._previous: Optional[_FeedSnapshot] = None
+
+    def refresh(self) -> int:
+        collection = get_scenarios_collection()
+        if collection is None:
+            return 0
+        now = datetime.now()
+        candidates = list(collection.find(
+            {'public': True, 'timestamp': {'$gte': now - timedelta(days=FEED_MAX_AGE_DAYS)}},
+            FEED_PROJECTION
+        ).sort('timestamp', -1).limit(FEED_CANDIDATES))
+
+        for scenario in candidates:
+            scenario['rank'] = round(rank_score(scenario, now), 6)
+            if isinstance(scenario.get('timestamp'), datetime):
+                scenario['timestamp'] = scenario['timestamp'].isoformat()
+        candidates.sort(key=lambda s: s['rank'], reverse=True)
+
+        snapshot = _FeedSnapshot(self._current.version + 1, candidates[:FEED_SIZE])
+        self._previous, self._current = self._current, snapshot
+        return len(snapshot.items)
+
+    def _snapshot_for(self, version: Optional[int]) -> _FeedSnapshot:
+        if version is not None and self._previous is not None and self._previous.version == version:
+            return self._previous
+        return self._current
+
+    def page(self, tag: Optional[str] = None, cursor: Optional[str] = None, limit: int = 20) -> Dict[str, Any]:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        version, offset = decode_cursor(cursor)
+        snapshot = self._snapshot_for(version)
+        if version is not None and snapshot.version != version:
+            # Cursor outlived two refreshes; start over on the current ranking
+            offset = 0
+
+        if tag:
+            positions = snapshot.by_tag.get(tag.strip().lower(), [])
+            window = positions[offset:offset + limit]
+            items = [snapshot.items[p] for p in window]
+            total = len(positions)
+        else:
+            items = snapshot.items[offset:offset + limit]
+            total = len(snapshot.items)
+
+        next_offset = offset + len(items)
+        return {
+            'scenarios': items,
+            'total_count': total,
+            'next_cursor': encode_cursor(snapshot.version, next_offset) if next_offset < total else None,
+            'ranking_version': snapshot.version,
+            'ranked_at': snapshot.built_at.isoformat()
+        }
+
+
+def encode_cursor(version: int, offset: int) -> str:
+    raw = json.dumps([version, offset], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str]) -> Tuple[Optional[int], int]:
+    if not cursor:
+        return None, 0
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        version, offset = json.loads(base64.urlsafe_b64decode(padded))
+        return int(version), max(int(offset), 0)
+    except Exception:
+        return None, 0
+
+
+# Global feed and counter buffer (per worker process)
+community_feed = CommunityFeed()
+counter_buffer = CounterBuffer()
+feed_refresh_job = PeriodicJob('community_feed_refresh', community_feed.refresh, FEED_REFRESH_INTERVAL)
+counter_flush_job = PeriodicJob('community_counter_flush', counter_buffer.flush, COUNTER_FLUSH_INTERVAL)
@@ -0,0 +1,211 @@
+"""
+Compact persisted form of simulation results
+Parallel You: AI-Generated Personalized Reality Simulator
+
+A stored simulation keeps its inputs, the score and the model that produced
+it, the template version, the avatar id and references to generated media
+(a rendered vision board is referenced by its render key, never re-rendered). The message, recommendations, journal entry,
+suggestion lists and scripts are rebuilt from those on read, only for the
+sections that are asked for. Text stored under an older TEMPLATE_VERSION is
+rebuilt with the current templates and flagged as such.
+
+    python backend/compact_storage.py report     # size per storage format
+    python backend/compact_storage.py migrate    # compact legacy documents
+"""
+
+import sys
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional
+import logging
+
+from bson import BSON
+from pymongo import UpdateOne
+
+from database import db_manager, get_simulations_collection
+from simulation_content import (
+    TEMPLATE_VERSION, generate_personalized_message, generate_recommendations,
+    generate_ar_vr_content, generate_3d_avatar_data, generate_ai_journal_entry,
+    generate_multimedia_suggestions, generate_insights
+)
+from ai_media import generate_life_movie, vision_board_text
+from vision_board import vision_board_renderer
+
+logger = logging.getLogger(__name__)
+
+COMPACT_FORMAT = 2
+# Media kinds whose payload is text we can regenerate; only a marker is kept
+REBUILT_MEDIA = ('life_movie',)
+MEDIA_REFERENCE_FIELDS = ('success', 'image_url', 'video_url', 'local_url', 'model', 'fallback', 'duration', 'timestamp')
+
+SECTIONS = (
+    'message', 'recommendations', 'insights', 'journal_entry',
+    'multimedia_suggestions', 'ar_vr_suggestions', 'avatar_data', 'media'
+)
+
+
+def is_compact(result: Dict[str, Any]) -> bool:
+    return isinstance(result, dict) and result.get('format') == COMPACT_FORMAT
+
+
+def compact_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduce a full /predict result to what is needed to rebuild it"""
+    if is_compact(result):
+        return result
+    score = result.get('score', 0)
+    media = {}
+    for kind, item in (result.get('media') or {}).items():
+        if not isinstance(item, dict):
+            continue
+        if kind in REBUILT_MEDIA:
+            media[kind] = {'rebuild': True, 'timestamp': item.get('timestamp')}
+        elif kind == 'vision_board':
+            # The text is rebuilt, the image is referenced by its render key
+            render = item.get('render') or {}
+            media[kind] = {'board_id': render.get('board_id'), 'format': render.get('format'),
+                           'timestamp': item.get('timestamp')}
+        else:
+            media[kind] = {field: item[field] for field in MEDIA_REFERENCE_FIELDS if field in item}
+    return {
+        'format': COMPACT_FORMAT,
+        'score': score,
+        'model_version': result.get('model_version'),
+        'template_version': TEMPLATE_VERSION,
+        'avatar_id': (result.get('avatar_data') or {}).get('avatar_id'),
+        'media': media
+    }
+
+
+def _expand_media(input_data: Dict[str, Any], score: int, media: Dict[str, Any]) -> Dict[str, Any]:
+    expanded = {}
+    for kind, reference in media.items():
+        if kind == 'life_movie':
+            expanded[kind] = {**generate_life_movie([input_data], input_data), 'timestamp': reference.get('timestamp')}
+        elif kind == 'vision_board':
+            goals = {
+                'personal': input_data.get('personal_goals', []),
+                'professional': input_data.get('professional_goals', [])
+            }
+            try:
+                generated_at = datetime.fromisoformat(reference.get('timestamp'))
+            except (TypeError, ValueError):
+                generated_at = None
+            text, elements_count = vision_board_text({**input_data, 'score': score}, goals, generated_at)
+            render = (vision_board_renderer.status(reference['board_id'], reference.get('format') or 'png')
+                      if reference.get('board_id') else None)
+            expanded[kind] = {'success': True, 'vision_board': text, 'elements_count': elements_count,
+                              'render': render, 'image_url': (render or {}).get('image_url'),
+                              'timestamp': reference.get('timestamp')}
+        else:
+            expanded[kind] = dict(reference)
+    return expanded
+
+
+def expand_result(input_data: Dict[str, Any], result: Dict[str, Any],
+                  sections: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """Rebuild the requested sections (all by default) of a stored result"""
+    if not is_compact(result):
+        # Legacy document: everything is already stored
+        if sections is None:
+            return dict(result)
+        return {k: v for k, v in result.items() if k in set(sections) | {'score'}}
+
+    wanted = set(SECTIONS if sections is None else sections)
+    score = result['score']
+    builders = {
+        'message': lambda: generate_personalized_message(input_data, score),
+        'recommendations': lambda: generate_recommendations(input_data, score),
+        'insights': lambda: generate_insights(score),
+        'journal_entry': lambda: generate_ai_journal_entry(input_data, score),
+        'multimedia_suggestions': lambda: generate_multimedia_suggestions(input_data, score),
+        'ar_vr_suggestions': lambda: generate_ar_vr_content(input_data, score),
+        'avatar_data': lambda: generate_3d_avatar_data({**input_data, 'score': score}, result.get('avatar_id')),
+        'media': lambda: _expand_media(input_data, score, result.get('media', {}))
+    }
+    expanded = {'score': score}
+    if result.get('model_version') is not None:
+        expanded['model_version'] = result['model_version']
+    if result.get('template_version') != TEMPLATE_VERSION:
+        # Stored under older wording: the text below is today's templates, not what the user saw
+        expanded['template_version'] = result.get('template_version')
+        expanded['templates_changed'] = True
+    for section in SECTIONS:
+        if section in wanted:
+            expanded[section] = builders[section]()
+    return expanded
+
+
+def migrate_to_compact(batch_size: int = 500) -> Dict[str, int]:
+    """Rewrite legacy simulation documents in the compact format, in _id order"""
+    collection = get_simulations_collection()
+    if collection is None:
+        return {'migrated': 0, 'error': 'Database not connected'}
+
+    migrated = 0
+    last_id = None
+    while True:
+        query = {'result.format': {'$ne': COMPACT_FORMAT}}
+        if last_id is not None:
+            query['_id'] = {'$gt': last_id}
+        batch = list(collection.find(query, {'result': 1}).sort('_id', 1).limit(batch_size))
+        if not batch:
+            break
+        operations = [
+            UpdateOne({'_id': doc['_id']}, {'$set': {'result': compact_result(doc.get('result') or {})}})
+            for doc in batch
+        ]
+        collection.bulk_write(operations, ordered=False)
+        migrated += len(operations)
+        last_id = batch[-1]['_id']
+        logger.info(f"Compacted {migrated} simulations so far")
+    return {'migrated': migrated}
+
+
+def size_report(sample_size: int = 200) -> Dict[str, Any]:
+    """Document sizes per storage format, collection/index sizes, and projected savings"""
+    collection = get_simulations_collection()
+    if collection is None:
+        return {'error': 'Database not connected'}
+
+    by_format = {}
+    for row in collection.aggregate([
+        {'$group': {
+            '_id': {'$ifNull': ['$result.format', 1]},
+            'documents': {'$sum': 1},
+            'avg_bytes': {'$avg': {'$bsonSize': '$$ROOT'}},
+            'total_bytes': {'$sum': {'$bsonSize': '$$ROOT'}}
+        }}
+    ]):
+        by_format[f"format_{row['_id']}"] = {
+            'documents': row['documents'],
+            'avg_bytes': round(row['avg_bytes'] or 0),
+            'total_bytes': row['total_bytes']
+        }
+
+    # Measure what compaction would save on a sample of legacy documents
+    before = after = 0
+    for doc in collection.find({'result.format': {'$ne': COMPACT_FORMAT}}).limit(sample_size):
+        before += len(BSON.encode(doc))
+        after += len(BSON.encode({**doc, 'result': compact_result(doc.get('result') or {})}))
+
+    stats = db_manager.db.command('collStats', collection.name)
+    return {
+        'by_format': by_format,
+        'legacy_sample': {
+            'documents_sampled': min(sample_size, by_format.get('format_1', {}).get('documents', 0)),
+            'bytes_before': before,
+            'bytes_after': after,
+            'reduction_pct': round((1 - after / before) * 100, 1) if before else 0
+        },
+        'collection': {
+            'size': stats.get('size'),
+            'storage_size': stats.get('storageSize'),
+            'total_index_size': stats.get('totalIndexSize')
+        }
+    }
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else 'report'
+    if command == 'migrate':
+        print(migrate_to_compact())
+    print(size_report())
@@ -0,0 +1,233 @@
+"""
+Precomputed static content bundles
+Parallel You: AI-Generated Personalized Reality Simulator
+
+The AR/VR and multimedia suggestion lists and the insight tiers of a
+/predict result depend only on the career family and the score tier (see
+simulation_content.CAREER_FAMILIES and TIER_BOUNDS). The build step renders
+every (family, tier) pair once into the static root that nginx serves:
+
+    bundles/manifest.json                  current version (the only file rewritten)
+    bundles/<version>/<family>-<tier>.json one bundle per pair, immutable
+    bundles/<version>/bundles.bin          all bundles back to back
+    bundles/<version>/index.json           "<family>-<tier>" -> [offset, length] in bundles.bin
+
+The version is a hash of the content, so an unchanged build reuses the same
+URLs and a changed one never overwrites a file a client may have cached.
+Workers memory-map bundles.bin, so every worker on a host shares the same
+page-cache copy. /predict either inlines a bundle from it or, when asked,
+returns only a reference to the static file. A reference is only handed out
+while that file exists; otherwise the bundle is inlined. In docker-compose
+the backend builds into a volume that nginx serves, so both see one build.
+
+    python backend/manage.py build-bundles [static_root]
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+import logging
+
+from simulation_content import (
+    TEMPLATE_VERSION, CAREER_FAMILIES, TIER_BOUNDS, career_family, score_tier, tier_scores, career_tier_content
+)
+
+logger = logging.getLogger(__name__)
+
+STATIC_ROOT = os.path.abspath(os.getenv(
+    'STATIC_ROOT', os.path.join(os.path.dirname(__file__), '..', 'frontend', 'dist')
+))
+BUNDLE_URL_PREFIX = os.getenv('BUNDLE_URL_PREFIX', '/bundles')
+BUNDLES_ENABLED = os.getenv('BUNDLES_ENABLED', '1') == '1'
+# How often a worker checks whether a newer build has been published
+RELOAD_CHECK_SECONDS = 10
+KEEP_VERSIONS = 3
+
+
+def bundle_name(family: str, tier: int) -> str:
+    return f"{family}-{tier}"
+
+
+def _encode(payload: Dict[str, Any]) -> bytes:
+    return json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def render_bundles() -> Dict[str, bytes]:
+    """Every (family, tier) bundle, checked to be the same across the whole tier"""
+    bundles = {}
+    for family, career in CAREER_FAMILIES.items():
+        if career_family(career) != family:
+            raise ValueError(f"Representative career {career!r} does not map to family {family!r}")
+        for tier in range(len(TIER_BOUNDS) + 1):
+            low, high = tier_scores(tier)
+            content = career_tier_content(career, low)
+            if career_tier_content(career, high) != content:
+                raise ValueError(f"Bundle {family}-{tier} differs within its tier; update TIER_BOUNDS")
+            bundles[bundle_name(family, tier)] = _encode({'family': family, 'tier': tier, **content})
+    return bundles
+
+
+def build(static_root: str = STATIC_ROOT) -> Dict[str, Any]:
+    """Write a new bundle version (if the content changed) and point the manifest at it"""
+    bundles = render_bundles()
+    digest = hashlib.sha256(f"v{TEMPLATE_VERSION}".encode())
+    for name in sorted(bundles):
+        digest.update(name.encode() + b'\0' + bundles[name] + b'\0')
+    version = digest.hexdigest()[:12]
+
+    bundle_dir = os.path.join(static_root, 'bundles')
+    version_dir = os.path.join(bundle_dir, version)
+    if not os.path.isdir(version_dir):
+        tmp_dir = f"{version_dir}.{os.getpid()}.tmp"
+        os.makedirs(tmp_dir, exist_ok=True)
+        index = {}
+        with open(os.path.join(tmp_dir, 'bundles.bin'), 'wb') as blob:
+            for name in sorted(bundles):
+                index[name] = [blob.tell(), len(bundles[name])]
+                blob.write(bundles[name])
+                with open(os.path.join(tmp_dir, f"{name}.json"), 'wb') as handle:
+                    handle.write(bundles[name])
+        with open(os.path.join(tmp_dir, 'index.json'), 'w') as handle:
+            json.dump(index, handle, sort_keys=True)
+        os.replace(tmp_dir, version_dir)
+
+    manifest = {
+        'version': version,
+        'template_version': TEMPLATE_VERSION,
+        'families': list(CAREER_FAMILIES),
+        'tier_bounds': list(TIER_BOUNDS),
+        'built_at': datetime.now().isoformat()
+    }
+    tmp = os.path.join(bundle_dir, f"manifest.json.{os.getpid()}.tmp")
+    with open(tmp, 'w') as handle:
+        json.dump(manifest, handle, indent=2)
+    os.replace(tmp, os.path.join(bundle_dir, 'manifest.json'))
+    pruned = _prune(bundle_dir, version)
+    return {'version': version, 'bundles': len(bundles), 'path': version_dir, 'pruned': pruned}
+
+
+def _prune(bundle_dir: str, current: str) -> int:
+    """Drop all but the newest KEEP_VERSIONS builds (cached references to those stay valid)"""
+    versions = sorted(
+        (entry for entry in os.scandir(bundle_dir) if entry.is_dir() and not entry.name.endswith('.tmp')),
+        key=lambda entry: entry.stat().st_mtime, reverse=True
+    )
+    pruned = 0
+    for entry in versions[KEEP_VERSIONS:]:
+        if entry.name != current:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            pruned += 1
+    return pruned
+
+
+class BundleIndex:
+    """Memory-mapped view of the current bundle build"""
+
+    def __init__(self, static_root: str = STATIC_ROOT):
+        self.manifest_path = os.path.join(static_root, 'bundles', 'manifest.json')
+        self._lock = threading.Lock()
+        self._state = None
+        self._manifest_mtime = None
+        self._next_check = 0.0
+        self._decoded: Dict[str, Dict[str, Any]] = {}
+        self._stats = {'inlined': 0, 'referenced': 0, 'fallbacks': 0, 'loads': 0, 'missing_static': 0}
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # The mapping itself stays valid in the child
+        self._lock = threading.Lock()
+
+    def _current(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return self._state
+        with self._lock:
+            if now < self._next_check:
+                return self._state
+            self._next_check = now + RELOAD_CHECK_SECONDS
+            try:
+                mtime = os.path.getmtime(self.manifest_path)
+            except OSError:
+                return self._state
+            if mtime != self._manifest_mtime:
+                self._load(mtime)
+            return self._state
+
+    def _load(self, mtime: float):
+        try:
+            with open(self.manifest_path) as handle:
+                manifest = json.load(handle)
+            if manifest.get('template_version') != TEMPLATE_VERSION or manifest.get('tier_bounds') != list(TIER_BOUNDS):
+                logger.warning("Content bundles were built from other templates; computing sections instead")
+                self._state = None
+            else:
+                version_dir = os.path.join(os.path.dirname(self.manifest_path), manifest['version'])
+                with open(os.path.join(version_dir, 'index.json')) as handle:
+                    index = json.load(handle)
+                with open(os.path.join(version_dir, 'bundles.bin'), 'rb') as blob:
+                    mapped = mmap.mmap(blob.fileno(), 0, access=mmap.ACCESS_READ)
+                self._state = (manifest['version'], index, mapped)
+                self._stats['loads'] += 1
+            self._decoded = {}
+            self._manifest_mtime = mtime
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Could not load content bundles: {e}")
+
+    def reload(self) -> bool:
+        """Pick up a newly published build now rather than at the next periodic check"""
+        self._next_check = 0.0
+        return self._current() is not None
+
+    def sections(self, dream_career: str, score: int) -> Dict[str, Any]:
+        """Career/tier-only sections for a result, from the mapped bundle or computed"""
+        state = self._current() if BUNDLES_ENABLED else None
+        name = bundle_name(career_family(dream_career), score_tier(score))
+        if state is not None and name in state[1]:
+            version, index, mapped = state
+            key = f"{version}/{name}"
+            bundle = self._decoded.get(key)
+            if bundle is None:
+                offset, length = index[name]
+                bundle = json.loads(mapped[offset:offset + length])
+                bundle.pop('family', None)
+                bundle.pop('tier', None)
+                self._decoded[key] = bundle
+            self._stats['inlined'] += 1
+            return bundle
+        self._stats['fallbacks'] += 1
+        return career_tier_content(dream_career, score)
+
+    def reference(self, dream_career: str, score: int) -> Optional[Dict[str, Any]]:
+        """URL of the static bundle nginx serves for this result, or None to inline it instead"""
+        state = self._current() if BUNDLES_ENABLED else None
+        if state is None:
+            return None
+        family, tier = career_family(dream_career), score_tier(score)
+        name = bundle_name(family, tier)
+        if name not in state[1] or not self._published(state[0], name):
+            return None
+        self._stats['referenced'] += 1
+        return {'url': f"{BUNDLE_URL_PREFIX}/{state[0]}/{name}.json", 'version': state[0],
+                'family': family, 'tier': tier}
+
+    def _published(self, version: str, name: str) -> bool:
+        # The static file can be pruned or never copied to where nginx serves; a stat is cheap
+        path = os.path.join(os.path.dirname(self.manifest_path), version, f"{name}.json")
+        if os.path.exists(path):
+            return True
+        self._stats['missing_static'] += 1
+        return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        state = self._current()
+        return {**self._stats, 'version': state[0] if state else None, 'bundles': len(state[1]) if state else 0}
+
+
+# Global index (per worker process; the mapped pages are shared by the host)
+bundle_index = BundleIndex()
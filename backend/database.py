@@ -3,77 +3,147 @@ MongoDB Database Configuration and Models
 Parallel You: AI-Generated Personalized Reality Simulator
 """
 
+import pymongo
 from pymongo import MongoClient
 from datetime import datetime, timedelta
+from functools import wraps
 import os
+import threading
+import time
 from typing import Optional, Dict, List, Any
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+import deadline
+from ids import new_id
+
+# Handlers are configured by log_pipeline (create_app / manage.py)
 logger = logging.getLogger(__name__)
 
+# Without MONGODB_URI these are probed in order (local development)
+FALLBACK_URIS = (
+    'mongodb://localhost:27017/',
+    'mongodb://127.0.0.1:27017/',
+    'mongodb://mongo:27017/'  # Docker container name
+)
+SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+PROBE_TIMEOUT_MS = int(os.getenv('MONGO_PROBE_TIMEOUT_MS', '1000'))
+# After a failed connection attempt, wait this long before trying again
+RECONNECT_INTERVAL = float(os.getenv('MONGO_RECONNECT_INTERVAL_SECONDS', '30'))
+
+# Command monitoring (latency histograms, slow query shapes); see mongo_profiler.py
+PROFILE_COMMANDS = os.getenv('MONGO_PROFILE_COMMANDS', '1') == '1'
+
+def _event_listeners():
+    if not PROFILE_COMMANDS:
+        return []
+    # Imported here: mongo_profiler's job scheduling depends on this module
+    from mongo_profiler import command_profiler
+    return [command_profiler]
+
 class DatabaseManager:
+    """Connects on first use, once per process; a forked worker opens its own client"""
+
     def __init__(self):
-        self.client = None
-        self.db = None
+        self._client = None
+        self._db = None
         self.collections = {}
-        self.connect()
+        self._lock = threading.Lock()
+        self._last_attempt = None
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # MongoClient is not fork-safe; drop the parent's without closing its sockets
+        self._client = None
+        self._db = None
+        self.collections = {}
+        self._lock = threading.Lock()
+        self._last_attempt = None
+
+    @property
+    def client(self):
+        self.ensure_connected()
+        return self._client
+
+    @property
+    def db(self):
+        self.ensure_connected()
+        return self._db
+
+    def ensure_connected(self) -> bool:
+        if self._client is not None:
+            return True
+        if self._last_attempt is not None and time.monotonic() - self._last_attempt < RECONNECT_INTERVAL:
+            return False
+        with self._lock:
+            if self._client is None and (
+                self._last_attempt is None or time.monotonic() - self._last_attempt >= RECONNECT_INTERVAL
+            ):
+                self._last_attempt = time.monotonic()
+                self.connect()
+        return self._client is not None
 
     def connect(self):
-        """Connect to MongoDB with fallback options"""
+        """Connect to MongoDB; with MONGODB_URI the client connects lazily, without a ping"""
+        uri = os.environ.get('MONGODB_URI')
         try:
-            # Try different connection methods
-            connection_strings = [
-                os.environ.get('MONGODB_URI', 'mongodb://localhost:27017/'),
-                'mongodb://localhost:27017/',
-                'mongodb://127.0.0.1:27017/',
-                'mongodb://mongo:27017/'  # Docker container name
-            ]
-            
-            for conn_str in connection_strings:
-                try:
-                    self.client = MongoClient(conn_str, serverSelectionTimeoutMS=5000)
-                    # Test connection
-                    self.client.admin.command('ping')
-                    self.db = self.client['parallel_you']
-                    logger.info(f"✅ Connected to MongoDB at {conn_str}")
-                    break
-                except Exception as e:
-                    logger.warning(f"Failed to connect to {conn_str}: {e}")
-                    continue
-            
-            if not self.client:
-                raise Exception("Could not connect to any MongoDB instance")
-                
+            if uri:
+                client = MongoClient(uri, serverSelectionTimeoutMS=SERVER_SELECTION_TIMEOUT_MS,
+                                     event_listeners=_event_listeners())
+                logger.info("✅ MongoDB client created")
+            else:
+                client = self._probe()
+            self._db = client['parallel_you']
             self._setup_collections()
-            self._create_indexes()
-            
+            self._client = client
         except Exception as e:
             logger.error(f"❌ MongoDB connection failed: {e}")
             logger.info("Using in-memory storage as fallback")
-            self.client = None
-            self.db = None
+            self._client = None
+            self._db = None
+            self.collections = {}
+
+    def _probe(self):
+        for conn_str in FALLBACK_URIS:
+            try:
+                client = MongoClient(conn_str, serverSelectionTimeoutMS=PROBE_TIMEOUT_MS,
+                                     event_listeners=_event_listeners())
+                client.admin.command('ping')
+                logger.info(f"✅ Connected to MongoDB at {conn_str}")
+                return client
+            except Exception as e:
+                logger.warning(f"Failed to connect to {conn_str}: {e}")
+        raise Exception("Could not connect to any MongoDB instance")
 
     def _setup_collections(self):
         """Initialize database collections"""
-        if self.db is None:  # <-- FIXED
+        if self._db is None:
             return
             
         self.collections = {
-            'users': self.db['users'],
-            'simulations': self.db['simulations'],
-            'scenarios': self.db['scenarios'],
-            'analytics': self.db['analytics'],
-            'feedback': self.db['feedback'],
-            'sessions': self.db['sessions']
+            'users': self._db['users'],
+            'simulations': self._db['simulations'],
+            'scenarios': self._db['scenarios'],
+            'analytics': self._db['analytics'],
+            'feedback': self._db['feedback'],
+            'sessions': self._db['sessions'],
+            'rollups': self._db['simulation_rollups'],
+            'job_state': self._db['job_state'],
+            'sketches': self._db['sketches'],
+            'notifications': self._db['notifications'],
+            'notification_counters': self._db['notification_counters'],
+            'media_objects': self._db['media_objects'],
+            'sweeps': self._db['sweeps'],
+            'idempotency': self._db['idempotency_keys'],
+            'simulations_archive': self._db['simulations_archive'],
+            'speculative_media': self._db['speculative_media'],
+            'speculation_budget': self._db['speculation_budget']
         }
         logger.info("📊 Database collections initialized")
 
-    def _create_indexes(self):
-        """Create database indexes for performance"""
-        if self.db is None:  # <-- FIXED
-            return
+    def create_indexes(self):
+        """Create database indexes for performance (run once per deploy via manage.py migrate)"""
+        if not self.ensure_connected():
+            return False
             
         try:
             # User indexes
@@ -87,22 +157,61 @@ class DatabaseManager:
             self.collections['simulations'].create_index("simulation_id", unique=True)
             self.collections['simulations'].create_index([("user_id", 1), ("timestamp", -1)])
             
+            # Archived simulation segments (see archive.py)
+            self.collections['simulations_archive'].create_index("simulation_ids")
+            self.collections['simulations_archive'].create_index([("user_ids", 1), ("last_timestamp", -1)])
+            self.collections['simulations_archive'].create_index("first_timestamp")
+            
+            # Community scenario indexes (Scenario model documents have no scenario_id)
+            self.collections['scenarios'].create_index("scenario_id", unique=True, sparse=True)
+            self.collections['scenarios'].create_index([("public", 1), ("timestamp", -1)])
+            
+            # Notification inbox indexes
+            self.collections['notifications'].create_index([("user_id", 1), ("seq", -1)], unique=True)
+            self.collections['notifications'].create_index("notification_id", unique=True)
+            
+            # Media store indexes (objects are keyed by content hash)
+            self.collections['media_objects'].create_index("sources")
+            
+            # Idempotency records expire after IDEMPOTENCY_TTL_SECONDS
+            self.collections['idempotency'].create_index(
+                "created_at", expireAfterSeconds=int(os.getenv('IDEMPOTENCY_TTL_SECONDS', str(24 * 3600)))
+            )
+            
+            # Speculatively generated media and its daily budget counters (see speculative_media.py)
+            self.collections['speculative_media'].create_index(
+                "created_at", expireAfterSeconds=int(os.getenv('SPECULATION_TTL_SECONDS', str(24 * 3600)))
+            )
+            self.collections['speculative_media'].create_index([("user_id", 1), ("created_at", -1)])
+            self.collections['speculation_budget'].create_index("expires_at", expireAfterSeconds=0)
+            
+            # What-if sweep summaries
+            self.collections['sweeps'].create_index([("user_id", 1), ("created_at", -1)])
+            
             # Analytics indexes
             self.collections['analytics'].create_index("event_type")
             self.collections['analytics'].create_index("timestamp")
             self.collections['analytics'].create_index("user_id")
             
+            # Rollup indexes ($merge target needs a unique index on its match fields)
+            self.collections['rollups'].create_index(
+                [("granularity", 1), ("dimension", 1), ("bucket", 1), ("key", 1)], unique=True
+            )
+            
             logger.info("🔍 Database indexes created")
+            return True
         except Exception as e:
             logger.warning(f"Index creation failed: {e}")
+            return False
 
     def get_collection(self, collection_name: str):
         """Get a collection by name"""
+        self.ensure_connected()
         return self.collections.get(collection_name)
 
     def is_connected(self) -> bool:
         """Check if database is connected"""
-        return self.client is not None
+        return self.ensure_connected()
 
     def get_stats(self) -> Dict[str, Any]:
         """Get database statistics"""
@@ -112,18 +221,19 @@ class DatabaseManager:
         try:
             stats = {
                 "status": "connected",
-                "database": self.db.name,
+                "database": self._db.name,
                 "collections": {}
             }
             
+            # Metadata counts; no collection scans
             for name, collection in self.collections.items():
-                stats["collections"][name] = collection.count_documents({})
+                stats["collections"][name] = collection.estimated_document_count()
             
             return stats
         except Exception as e:
             return {"status": "error", "message": str(e)}
 
-# Global database instance
+# Global database instance (connects on first use)
 db_manager = DatabaseManager()
 
 # Collection getters for easy access
@@ -145,6 +255,39 @@ def get_feedback_collection():
 def get_sessions_collection():
     return db_manager.get_collection('sessions')
 
+def get_rollups_collection():
+    return db_manager.get_collection('rollups')
+
+def get_job_state_collection():
+    return db_manager.get_collection('job_state')
+
+def get_sketches_collection():
+    return db_manager.get_collection('sketches')
+
+def get_notifications_collection():
+    return db_manager.get_collection('notifications')
+
+def get_notification_counters_collection():
+    return db_manager.get_collection('notification_counters')
+
+def get_media_objects_collection():
+    return db_manager.get_collection('media_objects')
+
+def get_sweeps_collection():
+    return db_manager.get_collection('sweeps')
+
+def get_idempotency_collection():
+    return db_manager.get_collection('idempotency')
+
+def get_simulations_archive_collection():
+    return db_manager.get_collection('simulations_archive')
+
+def get_speculative_media_collection():
+    return db_manager.get_collection('speculative_media')
+
+def get_speculation_budget_collection():
+    return db_manager.get_collection('speculation_budget')
+
 # Data Models
 class User:
     def __init__(self, user_data: Dict[str, Any]):
@@ -160,7 +303,7 @@ class User:
     def create(cls, email: str, name: str, password_hash: str) -> 'User':
         """Create a new user"""
         user_data = {
-            'user_id': f"user_{datetime.now().strftime('%Y%m%d%H%M%S')}_{hash(email) % 10000}",
+            'user_id': new_id('user'),
             'email': email.lower(),
             'name': name,
             'password_hash': password_hash,
@@ -195,18 +338,22 @@ class Simulation:
         self.timestamp = simulation_data.get('timestamp', datetime.now())
         self.scenario_type = simulation_data.get('scenario_type', 'general')
         self.confidence_score = simulation_data.get('confidence_score', 0)
+        self.model_version = simulation_data.get('model_version')
 
     @classmethod
-    def create(cls, user_id: str, input_data: Dict[str, Any], result: Dict[str, Any], scenario_type: str = 'general') -> 'Simulation':
+    def create(cls, user_id: str, input_data: Dict[str, Any], result: Dict[str, Any], scenario_type: str = 'general',
+               simulation_id: Optional[str] = None) -> 'Simulation':
         """Create a new simulation record"""
         simulation_data = {
-            'simulation_id': f"sim_{datetime.now().strftime('%Y%m%d%H%M%S')}_{hash(str(input_data)) % 10000}",
+            'simulation_id': simulation_id or new_id('sim'),
             'user_id': user_id,
             'input_data': input_data,
             'result': result,
             'timestamp': datetime.now(),
             'scenario_type': scenario_type,
-            'confidence_score': result.get('score', 0)
+            'confidence_score': result.get('score', 0),
+            # 'rules' for the formula in scoring.py, else the learned model version that scored it
+            'model_version': result.get('model_version')
         }
         return cls(simulation_data)
 
@@ -218,10 +365,32 @@ class Simulation:
             'result': self.result,
             'timestamp': self.timestamp,
             'scenario_type': self.scenario_type,
-            'confidence_score': self.confidence_score
+            'confidence_score': self.confidence_score,
+            'model_version': self.model_version
         }
 
+# Operations below this much remaining request budget are skipped
+MIN_DB_SECONDS = float(os.getenv('MIN_DB_BUDGET_MS', '50')) / 1000
+
+def bounded_by_deadline(default):
+    """Size an operation's timeout from the request deadline; return default() if no time is left"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            left = deadline.remaining()
+            if left is None:
+                return fn(*args, **kwargs)
+            if left < MIN_DB_SECONDS:
+                logger.warning(f"Skipping {fn.__name__}: request deadline exceeded")
+                deadline.note_degraded(fn.__name__)
+                return default()
+            with pymongo.timeout(left):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
 # Database utility functions
+@bounded_by_deadline(lambda: False)
 def save_user(user: User) -> bool:
     """Save user to database"""
     collection = get_users_collection()
@@ -237,6 +406,7 @@ def save_user(user: User) -> bool:
         logger.error(f"Failed to save user: {e}")
         return False
 
+@bounded_by_deadline(lambda: None)
 def get_user_by_email(email: str) -> Optional[User]:
     """Get user by email"""
     collection = get_users_collection()
@@ -250,6 +420,7 @@ def get_user_by_email(email: str) -> Optional[User]:
         logger.error(f"Failed to get user: {e}")
         return None
 
+@bounded_by_deadline(lambda: False)
 def save_simulation(simulation: Simulation) -> bool:
     """Save simulation to database"""
     collection = get_simulations_collection()
@@ -265,6 +436,7 @@ def save_simulation(simulation: Simulation) -> bool:
         logger.error(f"Failed to save simulation: {e}")
         return False
 
+@bounded_by_deadline(list)
 def get_user_simulations(user_id: str, limit: int = 20) -> List[Dict[str, Any]]:
     """Get user's simulation history"""
     collection = get_simulations_collection()
@@ -281,46 +453,18 @@ def get_user_simulations(user_id: str, limit: int = 20) -> List[Dict[str, Any]]:
         logger.error(f"Failed to get simulations: {e}")
         return []
 
-def get_analytics_data() -> Dict[str, Any]:
-    """Get aggregated analytics data"""
-    simulations_collection = get_simulations_collection()
-    if simulations_collection is None:  # <-- FIXED
-        return {"error": "Database not connected"}
+@bounded_by_deadline(lambda: None)
+def get_simulation(simulation_id: str) -> Optional[Dict[str, Any]]:
+    """Get a single stored simulation"""
+    collection = get_simulations_collection()
+    if collection is None:
+        return None
     
     try:
-        # Popular career choices
-        pipeline = [
-            {'$group': {'_id': '$input_data.dreamCareer', 'count': {'$sum': 1}}},
-            {'$sort': {'count': -1}},
-            {'$limit': 10}
-        ]
-        popular_careers = list(simulations_collection.aggregate(pipeline))
-        
-        # Education impact analysis
-        education_scores = {}
-        for doc in simulations_collection.find({}, {'input_data.education': 1, 'result.score': 1}):
-            edu = doc.get('input_data', {}).get('education', 'unknown')
-            score = doc.get('result', {}).get('score', 0)
-            if edu not in education_scores:
-                education_scores[edu] = []
-            education_scores[edu].append(score)
-        
-        avg_scores = {edu: sum(scores)/len(scores) for edu, scores in education_scores.items()}
-        
-        # Total statistics
-        total_simulations = simulations_collection.count_documents({})
-        total_users = get_users_collection().count_documents({}) if get_users_collection() else 0
-        
-        return {
-            "popular_careers": popular_careers,
-            "education_impact": avg_scores,
-            "total_simulations": total_simulations,
-            "total_users": total_users,
-            "last_updated": datetime.now().isoformat()
-        }
+        return collection.find_one({'simulation_id': simulation_id}, {'_id': 0})
     except Exception as e:
-        logger.error(f"Failed to get analytics: {e}")
-        return {"error": str(e)}
+        logger.error(f"Failed to get simulation: {e}")
+        return None
 
 # Initialize database on import
 if __name__ == "__main__":
@@ -0,0 +1,96 @@
+"""
+Per-request deadlines
+Parallel You: AI-Generated Personalized Reality Simulator
+
+A request gets a time budget from the X-Request-Budget-Ms header (capped) or
+REQUEST_BUDGET_MS. The deadline lives in a context variable for the request
+thread; provider calls and database operations size their timeouts from the
+time left, and work that no longer fits is skipped in favour of fallbacks.
+Everything skipped is recorded so the response can say what was degraded.
+"""
+
+import contextvars
+import os
+import time
+from functools import wraps
+from typing import List, Optional
+import logging
+
+import pymongo
+from flask import request
+
+logger = logging.getLogger(__name__)
+
+BUDGET_HEADER = 'X-Request-Budget-Ms'
+DEFAULT_BUDGET_MS = float(os.getenv('REQUEST_BUDGET_MS', '8000'))
+MAX_BUDGET_MS = float(os.getenv('REQUEST_MAX_BUDGET_MS', '30000'))
+MIN_BUDGET_MS = 100
+
+_deadline: contextvars.ContextVar = contextvars.ContextVar('request_deadline', default=None)
+_degraded: contextvars.ContextVar = contextvars.ContextVar('request_degraded', default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out"""
+
+
+def set_deadline(budget_seconds: float):
+    _deadline.set(time.monotonic() + budget_seconds)
+    _degraded.set([])
+
+
+def clear_deadline():
+    _deadline.set(None)
+    _degraded.set(None)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left for the current request, or None outside a deadline"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+def timeout_for(default: float) -> float:
+    """The smaller of a call's usual timeout and the time left"""
+    left = remaining()
+    return default if left is None else min(default, left)
+
+
+def has_time(seconds: float) -> bool:
+    left = remaining()
+    return left is None or left >= seconds
+
+
+def note_degraded(component: str):
+    degraded = _degraded.get()
+    if degraded is not None and component not in degraded:
+        degraded.append(component)
+
+
+def degraded() -> List[str]:
+    return list(_degraded.get() or [])
+
+
+def request_budget() -> float:
+    """Budget in seconds from the request header, else the configured default"""
+    try:
+        budget_ms = float(request.headers.get(BUDGET_HEADER, DEFAULT_BUDGET_MS))
+    except ValueError:
+        budget_ms = DEFAULT_BUDGET_MS
+    return min(max(budget_ms, MIN_BUDGET_MS), MAX_BUDGET_MS) / 1000
+
+
+def with_deadline(view):
+    """Run a view under the request's deadline; Mongo operations inside it share the same budget"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        budget = request_budget()
+        set_deadline(budget)
+        try:
+            with pymongo.timeout(budget):
+                return view(*args, **kwargs)
+        finally:
+            clear_deadline()
+    return wrapper
@@ -0,0 +1,262 @@
+"""
+Idempotency keys for expensive endpoints
+Parallel You: AI-Generated Personalized Reality Simulator
+
+A request carrying an `Idempotency-Key` header is executed at most once per
+(user, endpoint, key). The first response is stored byte-for-byte in the
+TTL-indexed `idempotency_keys` collection, a local LRU cache and the host's
+shared-memory cache; retries get that stored response back without running
+the view, from memory when they land on any worker of the same host. A duplicate that arrives
+while the original is still running waits for it: in-process through
+single-flight, across workers by polling the pending record.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import wraps
+from typing import Any, Callable, Dict, NamedTuple, Optional
+import logging
+
+from bson.binary import Binary
+from flask import Response, jsonify, make_response, request, session
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from database import get_idempotency_collection
+from deadline import request_budget, timeout_for
+from jobs import WORKER_ID
+from singleflight import SingleFlight, SingleFlightTimeout
+from shm_cache import shared_cache
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+LOCAL_CACHE_SIZE = int(os.getenv('IDEMPOTENCY_CACHE_SIZE', '1000'))
+RECORD_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', str(24 * 3600)))
+# How long a duplicate waits for the original request to finish
+WAIT_SECONDS = float(os.getenv('IDEMPOTENCY_WAIT_SECONDS', '120'))
+# A pending record older than this is assumed abandoned by a crashed worker
+PENDING_LEASE_SECONDS = float(os.getenv('IDEMPOTENCY_PENDING_LEASE_SECONDS', '300'))
+POLL_INTERVAL = 0.1
+
+
+class IdempotencyConflict(Exception):
+    """The original request is still running and did not finish in time"""
+
+
+class IdempotencyMismatch(Exception):
+    """The key was already used with a different request body"""
+
+
+class StoredResponse(NamedTuple):
+    fingerprint: str
+    status: int
+    content_type: str
+    body: bytes
+
+
+class IdempotencyStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, StoredResponse]" = OrderedDict()
+        self._flight = SingleFlight('idempotency')
+        self._stats = {'requests': 0, 'executed': 0, 'replayed_local': 0, 'replayed_host': 0, 'replayed_db': 0,
+                       'waited': 0, 'conflicts': 0, 'mismatches': 0, 'takeovers': 0}
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._flight = SingleFlight('idempotency')
+
+    def _count(self, stat: str):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def _cache_get(self, record_id: str) -> Optional[StoredResponse]:
+        with self._lock:
+            stored = self._cache.get(record_id)
+            if stored is not None:
+                self._cache.move_to_end(record_id)
+            return stored
+
+    def _cache_put(self, record_id: str, stored: StoredResponse, share: bool = True):
+        if share:
+            shared_cache.set(f"idempotency:{record_id}", stored, RECORD_TTL_SECONDS)
+        with self._lock:
+            self._cache[record_id] = stored
+            self._cache.move_to_end(record_id)
+            while len(self._cache) > LOCAL_CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+    @staticmethod
+    def _from_doc(doc: Dict[str, Any]) -> StoredResponse:
+        return StoredResponse(doc['fingerprint'], doc['status_code'], doc['content_type'], bytes(doc['body']))
+
+    def execute(self, record_id: str, fingerprint: str, run: Callable[[], Response],
+                wait_seconds: float = WAIT_SECONDS) -> StoredResponse:
+        """Stored response for record_id, running the view only if there is none"""
+        self._count('requests')
+        stored, shared = self._flight.do(
+            record_id, lambda: self._execute_once(record_id, fingerprint, run, wait_seconds), timeout=wait_seconds
+        )
+        if shared:
+            self._count('waited')
+        if stored.fingerprint != fingerprint:
+            self._count('mismatches')
+            raise IdempotencyMismatch()
+        return stored
+
+    def _execute_once(self, record_id: str, fingerprint: str, run: Callable[[], Response],
+                      wait_seconds: float) -> StoredResponse:
+        stored = self._cache_get(record_id)
+        if stored is not None:
+            self._count('replayed_local')
+            return stored
+        stored = shared_cache.get(f"idempotency:{record_id}")
+        if stored is not None:
+            self._cache_put(record_id, stored, share=False)
+            self._count('replayed_host')
+            return stored
+
+        collection = get_idempotency_collection()
+        if collection is not None and not self._claim(collection, record_id, fingerprint):
+            stored = self._wait_for(collection, record_id, fingerprint, wait_seconds)
+            if stored is not None:
+                self._cache_put(record_id, stored)
+                self._count('replayed_db')
+                return stored
+            # Took over an abandoned record; fall through and run
+
+        try:
+            response = run()
+        except Exception:
+            self._release(collection, record_id)
+            raise
+        self._count('executed')
+        stored = StoredResponse(fingerprint, response.status_code, response.content_type, response.get_data())
+
+        if response.status_code >= 500:
+            # Failures are not remembered, so a retry can run again
+            self._release(collection, record_id)
+            return stored
+
+        self._cache_put(record_id, stored)
+        if collection is not None:
+            try:
+                collection.update_one(
+                    {'_id': record_id},
+                    {'$set': {'status': 'complete', 'status_code': stored.status,
+                              'content_type': stored.content_type, 'body': Binary(stored.body),
+                              'completed_at': datetime.now()},
+                     '$unset': {'lease_until': ''}}
+                )
+            except PyMongoError as e:
+                # The response is good; only other hosts lose the replay. Don't leave them waiting on the lease.
+                logger.warning(f"Could not store idempotent response: {e}")
+                self._release(collection, record_id)
+        return stored
+
+    def _release(self, collection, record_id: str):
+        """Drop our pending claim so a retry can run instead of waiting out the lease"""
+        if collection is None:
+            return
+        try:
+            collection.delete_one({'_id': record_id, 'status': 'pending', 'owner': WORKER_ID})
+        except PyMongoError as e:
+            logger.warning(f"Could not release idempotency claim: {e}")
+
+    def _claim(self, collection, record_id: str, fingerprint: str) -> bool:
+        now = datetime.now()
+        try:
+            collection.insert_one({
+                '_id': record_id, 'status': 'pending', 'fingerprint': fingerprint, 'owner': WORKER_ID,
+                'created_at': now, 'lease_until': now + timedelta(seconds=PENDING_LEASE_SECONDS)
+            })
+            return True
+        except DuplicateKeyError:
+            return False
+
+    def _wait_for(self, collection, record_id: str, fingerprint: str,
+                  wait_seconds: float = WAIT_SECONDS) -> Optional[StoredResponse]:
+        """Poll another worker's record; None means we took over an abandoned one"""
+        deadline = time.monotonic() + timeout_for(wait_seconds)
+        while True:
+            doc = collection.find_one({'_id': record_id})
+            if doc is None:
+                # Original failed and released its claim; try to become the owner
+                if self._claim(collection, record_id, fingerprint):
+                    return None
+            elif doc.get('status') == 'complete':
+                return self._from_doc(doc)
+            elif doc['fingerprint'] != fingerprint:
+                self._count('mismatches')
+                raise IdempotencyMismatch()
+            elif doc.get('lease_until') and doc['lease_until'] < datetime.now():
+                taken = collection.update_one(
+                    {'_id': record_id, 'status': 'pending', 'lease_until': doc['lease_until']},
+                    {'$set': {'owner': WORKER_ID,
+                              'lease_until': datetime.now() + timedelta(seconds=PENDING_LEASE_SECONDS)}}
+                )
+                if taken.modified_count:
+                    self._count('takeovers')
+                    return None
+            if time.monotonic() >= deadline:
+                self._count('conflicts')
+                raise IdempotencyConflict()
+            time.sleep(POLL_INTERVAL)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, 'cached': len(self._cache), 'in_flight': self._flight.in_flight()}
+
+
+# Global store (per worker process)
+idempotency_store = IdempotencyStore()
+
+
+def _replay(stored: StoredResponse) -> Response:
+    return Response(stored.body, status=stored.status, content_type=stored.content_type)
+
+
+def idempotent(endpoint: str):
+    """Honour the Idempotency-Key header on a view, scoped to the calling user
+
+    Apply it outside with_deadline: claiming and completing the record must not
+    share the view's Mongo timeout, or a view that used up its budget leaves
+    its claim pending until the lease runs out.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not key:
+                return view(*args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return jsonify({'error': f'{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters'}), 400
+
+            body = request.get_json(silent=True) or {}
+            user_id = session.get('user_id') or body.get('user_id') or 'anonymous'
+            record_id = hashlib.sha256(f"{user_id}\x00{endpoint}\x00{key}".encode('utf-8')).hexdigest()
+            fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+            try:
+                # A duplicate waits no longer than the request's own budget
+                stored = idempotency_store.execute(record_id, fingerprint, lambda: make_response(view(*args, **kwargs)),
+                                                   wait_seconds=min(WAIT_SECONDS, request_budget()))
+            except IdempotencyMismatch:
+                return jsonify({'error': f'{IDEMPOTENCY_HEADER} was already used with a different request'}), 422
+            except (IdempotencyConflict, SingleFlightTimeout):
+                response = jsonify({'error': 'original request with this key is still in progress'})
+                response.headers['Retry-After'] = '1'
+                return response, 409
+            except PyMongoError as e:
+                logger.warning(f"Idempotency store unavailable: {e}")
+                response = jsonify({'error': 'could not check the idempotency key, please retry'})
+                response.headers['Retry-After'] = '1'
+                return response, 503
+            return _replay(stored)
+        return wrapper
+    return decorator
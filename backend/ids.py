@@ -0,0 +1,82 @@
+"""
+Time-ordered unique IDs
+Parallel You: AI-Generated Personalized Reality Simulator
+
+ULID-style identifiers: 48 bits of millisecond timestamp followed by 80 random
+bits, Crockford base32 encoded to 26 characters, so string order is creation
+order and new documents land at the right edge of unique indexes. Within one
+millisecond a process increments the random part instead of redrawing it, so
+its IDs are strictly increasing; across processes the random bits keep IDs
+unique.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+CROCKFORD = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+_DECODE = {ch: i for i, ch in enumerate(CROCKFORD)}
+RANDOM_BITS = 80
+RANDOM_MAX = (1 << RANDOM_BITS) - 1
+
+
+class IdGenerator:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._last_random = 0
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # The child must not continue the parent's sequence
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._last_random = 0
+
+    def next_value(self) -> int:
+        with self._lock:
+            now_ms = int(time.time() * 1000)
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._last_random = int.from_bytes(os.urandom(10), 'big')
+            elif self._last_random < RANDOM_MAX:
+                # Same millisecond, or the clock stepped back: keep counting from the last ID
+                self._last_random += 1
+            else:
+                self._last_ms += 1
+                self._last_random = int.from_bytes(os.urandom(10), 'big')
+            return (self._last_ms << RANDOM_BITS) | self._last_random
+
+
+_generator = IdGenerator()
+
+
+def encode(value: int) -> str:
+    chars = []
+    for _ in range(26):
+        chars.append(CROCKFORD[value & 31])
+        value >>= 5
+    return ''.join(reversed(chars))
+
+
+def ulid() -> str:
+    return encode(_generator.next_value())
+
+
+def new_id(prefix: Optional[str] = None) -> str:
+    """A fresh ID, e.g. new_id('sim') -> 'sim_01HZX3K6W8Q4J9V2M7T5R1N0BC'"""
+    value = ulid()
+    return f"{prefix}_{value}" if prefix else value
+
+
+def id_timestamp(identifier: str) -> Optional[datetime]:
+    """Creation time encoded in an ID from new_id(), or None for legacy IDs"""
+    value = identifier.rsplit('_', 1)[-1].upper()
+    if len(value) != 26 or any(ch not in _DECODE for ch in value):
+        return None
+    ms = 0
+    for ch in value[:10]:
+        ms = (ms << 5) | _DECODE[ch]
+    return datetime.fromtimestamp(ms / 1000)
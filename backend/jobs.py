@@ -0,0 +1,143 @@
+"""
+Background job helpers
+Parallel You: AI-Generated Personalized Reality Simulator
+
+Leases and watermarks live in the `job_state` collection so that a job can
+be scheduled in every worker process while only one of them runs it at a time.
+"""
+
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional
+import logging
+
+from database import get_job_state_collection
+
+logger = logging.getLogger(__name__)
+
+# Identifies this process as a lease holder
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+def _refresh_worker_id():
+    global WORKER_ID
+    WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+os.register_at_fork(after_in_child=_refresh_worker_id)
+
+
+def get_job_state(job_name: str) -> Dict[str, Any]:
+    """Read persisted state (watermarks etc.) for a job"""
+    collection = get_job_state_collection()
+    if collection is None:
+        return {}
+    return collection.find_one({'_id': job_name}) or {}
+
+
+def update_job_state(job_name: str, fields: Dict[str, Any], unset: Optional[list] = None) -> bool:
+    collection = get_job_state_collection()
+    if collection is None:
+        return False
+    update = {'$set': fields}
+    if unset:
+        update['$unset'] = {field: '' for field in unset}
+    collection.update_one({'_id': job_name}, update, upsert=True)
+    return True
+
+
+def acquire_lease(job_name: str, ttl_seconds: float) -> bool:
+    """Take (or renew) the exclusive lease for a job; False if another worker holds it"""
+    collection = get_job_state_collection()
+    if collection is None:
+        return False
+    now = datetime.now()
+    try:
+        collection.find_one_and_update(
+            {
+                '_id': job_name,
+                '$or': [
+                    {'lease_until': {'$exists': False}},
+                    {'lease_until': {'$lt': now}},
+                    {'lease_owner': WORKER_ID}
+                ]
+            },
+            {'$set': {'lease_owner': WORKER_ID, 'lease_until': now + timedelta(seconds=ttl_seconds)}},
+            upsert=True
+        )
+        return True
+    except Exception as e:
+        # Duplicate key on upsert means the lease document exists and is held by someone else
+        if getattr(e, 'code', None) != 11000:
+            logger.warning(f"Lease acquisition for {job_name} failed: {e}")
+        return False
+
+
+def release_lease(job_name: str):
+    collection = get_job_state_collection()
+    if collection is None:
+        return
+    collection.update_one(
+        {'_id': job_name, 'lease_owner': WORKER_ID},
+        {'$unset': {'lease_owner': '', 'lease_until': ''}}
+    )
+
+
+def run_exclusive(job_name: str, fn: Callable[[], Any], lease_seconds: float = 600) -> Any:
+    """Run fn under the job lease; returns None without running if the lease is held elsewhere"""
+    if not acquire_lease(job_name, lease_seconds):
+        return None
+    try:
+        return fn()
+    finally:
+        release_lease(job_name)
+
+
+class PeriodicJob:
+    """Runs a function on a fixed interval in a daemon thread of the current process"""
+
+    def __init__(self, name: str, fn: Callable[[], Any], interval_seconds: float):
+        self.name = name
+        self.fn = fn
+        self.interval = interval_seconds
+        self._thread = None
+        self._stop = threading.Event()
+        self.last_run = None
+        self.last_error = None
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name=f"job-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _reset_after_fork(self):
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.fn()
+                self.last_run = datetime.now()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Job {self.name} failed: {e}")
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'running': bool(self._thread and self._thread.is_alive()),
+            'interval_seconds': self.interval,
+            'last_run': self.last_run.isoformat() if self.last_run else None,
+            'last_error': self.last_error
+        }
@@ -0,0 +1,228 @@
+"""
+Non-blocking structured logging
+Parallel You: AI-Generated Personalized Reality Simulator
+
+Request threads never write to a stream themselves. Records go onto a bounded
+in-memory queue, and a listener thread formats them as one JSON object per
+line and writes them out. When the queue is full, records are dropped and
+counted instead of blocking the request.
+
+Two filters run in the caller before a record is queued:
+
+* Repeated records from the same call site (a provider failing a thousand
+  times a second) are rate-limited: the first LOG_BURST per window go
+  through, then one in LOG_SAMPLE_EVERY, each carrying how many were
+  suppressed since the last one emitted.
+* Inside a request, INFO and DEBUG records are folded into that request's
+  summary. The summary is written as a single line when the response goes
+  out, so a request logs once instead of once per step.
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+LOG_WINDOW_SECONDS = float(os.getenv('LOG_RATE_WINDOW_SECONDS', '10'))
+LOG_BURST = int(os.getenv('LOG_BURST', '10'))
+LOG_SAMPLE_EVERY = int(os.getenv('LOG_SAMPLE_EVERY', '100'))
+# Folded records kept per request summary; the rest are only counted
+MAX_SUMMARY_EVENTS = 20
+SUMMARY_LOGGER = 'request'
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_summary: contextvars.ContextVar = contextvars.ContextVar('request_log_summary', default=None)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with `extra` fields as top-level keys"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'pid': record.process
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """Burst-then-sample limit per call site and level"""
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        # (name, level, path, line) -> [window_start, seen, suppressed]
+        self._sites: Dict[tuple, list] = {}
+        self.suppressed = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.name == SUMMARY_LOGGER:
+            return True
+        key = (record.name, record.levelno, record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None or now - site[0] >= LOG_WINDOW_SECONDS:
+                carried = site[2] if site else 0
+                site = self._sites[key] = [now, 0, 0]
+                if len(self._sites) > 10000:
+                    self._sites = {key: site}
+            else:
+                carried = 0
+            site[1] += 1
+            if site[1] > LOG_BURST and (site[1] - LOG_BURST) % LOG_SAMPLE_EVERY:
+                site[2] += 1
+                self.suppressed += 1
+                return False
+            suppressed, site[2] = site[2] + carried, 0
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class RequestSummaryFilter(logging.Filter):
+    """Fold a request's INFO/DEBUG records into its summary line"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        summary = _summary.get()
+        if summary is None or record.levelno >= logging.WARNING or record.name == SUMMARY_LOGGER:
+            if summary is not None:
+                summary['warnings'] += 1
+            return True
+        summary['folded'] += 1
+        if len(summary['events']) < MAX_SUMMARY_EVENTS:
+            summary['events'].append(record.getMessage())
+        return False
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records when the listener falls behind"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self.enqueued = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+            self.enqueued += 1
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogPipeline:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.handler: Optional[DroppingQueueHandler] = None
+        self.listener: Optional[logging.handlers.QueueListener] = None
+        self.rate_limit = RateLimitFilter()
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+        atexit.register(self._flush)
+
+    def _flush(self):
+        # Write out whatever is still queued at interpreter exit
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def _reset_after_fork(self):
+        # The listener thread does not survive fork; the child starts its own on a fresh queue
+        self._lock = threading.Lock()
+        self.rate_limit._lock = threading.Lock()
+        if self.handler is not None:
+            self.handler.queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+            self.listener = None
+            self._start_listener()
+
+    def _start_listener(self):
+        output = logging.StreamHandler(sys.stderr)
+        output.setFormatter(JsonFormatter())
+        self.listener = logging.handlers.QueueListener(self.handler.queue, output, respect_handler_level=False)
+        self.listener.start()
+
+    def configure(self):
+        """Route the root logger through the queue (idempotent)"""
+        with self._lock:
+            if self.handler is not None:
+                return
+            self.handler = DroppingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+            self.handler.addFilter(RequestSummaryFilter())
+            self.handler.addFilter(self.rate_limit)
+            root = logging.getLogger()
+            for existing in list(root.handlers):
+                root.removeHandler(existing)
+            root.addHandler(self.handler)
+            root.setLevel(LOG_LEVEL)
+            self._start_listener()
+
+    def get_stats(self) -> Dict[str, Any]:
+        handler = self.handler
+        if handler is None:
+            return {'configured': False}
+        return {
+            'configured': True,
+            'enqueued': handler.enqueued,
+            'dropped': handler.dropped,
+            'rate_limited': self.rate_limit.suppressed,
+            'queue_depth': handler.queue.qsize()
+        }
+
+
+# Global pipeline (per worker process)
+log_pipeline = LogPipeline()
+summary_logger = logging.getLogger(SUMMARY_LOGGER)
+
+
+def configure_logging():
+    log_pipeline.configure()
+
+
+def begin_request():
+    _summary.set({'started': time.perf_counter(), 'events': [], 'folded': 0, 'warnings': 0})
+
+
+def annotate(**fields):
+    """Attach fields to the current request's summary line"""
+    summary = _summary.get()
+    if summary is not None:
+        summary.setdefault('fields', {}).update(fields)
+
+
+def end_request(method: str, path: str, status: int):
+    """Write the request's single summary line"""
+    summary = _summary.get()
+    if summary is None:
+        return
+    _summary.set(None)
+    extra = {
+        'method': method, 'path': path, 'status': status,
+        'duration_ms': round((time.perf_counter() - summary['started']) * 1000, 1),
+        'warnings': summary['warnings'], 'folded': summary['folded'], 'events': summary['events'],
+        **summary.get('fields', {})
+    }
+    summary_logger.info(f"{method} {path} {status}", extra=extra)
+
+
+def get_logging_stats() -> Dict[str, Any]:
+    return log_pipeline.get_stats()
@@ -0,0 +1,97 @@
+"""
+Operational commands
+Parallel You: AI-Generated Personalized Reality Simulator
+
+Work that used to run on every worker import now runs once per deploy:
+
+    python backend/manage.py migrate          # create indexes
+    python backend/manage.py warmup           # connect and print collection stats
+    python backend/manage.py bench-startup [runs]
+    python backend/manage.py build-bundles [static_root]   # precompute static content bundles
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Runs in a fresh interpreter so import caches do not flatter the numbers
+_STARTUP_PROBE = """
+import json, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+flask_app = app.create_app()
+t2 = time.perf_counter()
+with flask_app.test_client() as client:
+    client.get('/health')
+t3 = time.perf_counter()
+print(json.dumps({'import_ms': (t1 - t0) * 1000, 'create_app_ms': (t2 - t1) * 1000,
+                  'first_request_ms': (t3 - t2) * 1000}))
+"""
+
+
+def migrate():
+    from database import db_manager
+
+    if not db_manager.create_indexes():
+        print("Index creation failed or database unavailable")
+        return 1
+    print("Indexes created")
+    return 0
+
+
+def warmup():
+    from database import db_manager
+
+    start = time.perf_counter()
+    connected = db_manager.is_connected()
+    connect_ms = (time.perf_counter() - start) * 1000
+    print(json.dumps({'connect_ms': round(connect_ms, 1), 'stats': db_manager.get_stats()}, indent=2, default=str))
+    return 0 if connected else 1
+
+
+def build_bundles(static_root=None):
+    from content_bundles import build, STATIC_ROOT
+
+    print(json.dumps(build(static_root or STATIC_ROOT), indent=2))
+    return 0
+
+
+def bench_startup(runs: int = 5):
+    """Cold import, factory and first-request times of app.py, median over fresh processes"""
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', _STARTUP_PROBE], cwd=BACKEND_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip().splitlines()[-1]
+        samples.append(json.loads(output))
+    report = {
+        key: {'median': round(statistics.median(s[key] for s in samples), 1),
+              'max': round(max(s[key] for s in samples), 1)}
+        for key in samples[0]
+    }
+    print(json.dumps({'runs': runs, **report}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    from log_pipeline import configure_logging
+
+    configure_logging()
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    if command == 'migrate':
+        sys.exit(migrate())
+    elif command == 'warmup':
+        sys.exit(warmup())
+    elif command == 'bench-startup':
+        sys.exit(bench_startup(int(sys.argv[2]) if len(sys.argv) > 2 else 5))
+    elif command == 'build-bundles':
+        sys.exit(build_bundles(sys.argv[2] if len(sys.argv) > 2 else None))
+    print(__doc__)
+    sys.exit(2)
@@ -0,0 +1,298 @@
+"""
+Local content-addressed media store
+Parallel You: AI-Generated Personalized Reality Simulator
+
+Provider URLs expire, so generated images and videos are downloaded in the
+background into hash-sharded directories (<root>/ab/cd/<sha256>.<ext>) or,
+optionally, GridFS. Clients get a stable source URL that redirects to the
+provider until the copy lands and to the immutable content URL afterwards.
+nginx proxies /media/ to the backend; set MEDIA_BASE_URL when clients reach
+the backend on another origin (e.g. http://localhost:5000 in development).
+Image thumbnails and WebP variants are produced in a Pillow process pool.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Optional
+import logging
+
+import requests
+
+from database import db_manager, get_media_objects_collection
+from shm_cache import shared_cache
+
+logger = logging.getLogger(__name__)
+
+MEDIA_STORE_DIR = os.path.abspath(os.getenv('MEDIA_STORE_DIR', os.path.join(os.path.dirname(__file__), 'media_store')))
+# 'filesystem' or 'gridfs'; GridFS objects are materialized into MEDIA_STORE_DIR on first read
+MEDIA_STORE_BACKEND = os.getenv('MEDIA_STORE_BACKEND', 'filesystem')
+DOWNLOAD_WORKERS = int(os.getenv('MEDIA_DOWNLOAD_WORKERS', '4'))
+THUMBNAIL_WORKERS = int(os.getenv('MEDIA_THUMBNAIL_WORKERS', str(max(1, (os.cpu_count() or 2) // 2))))
+# Resolved source keys are shared between this host's workers for this long
+SOURCE_CACHE_TTL = 24 * 3600
+# Source keys each worker keeps in memory; older ones are found again in the shared cache or Mongo
+LOCAL_SOURCES_SIZE = int(os.getenv('MEDIA_LOCAL_SOURCES_SIZE', '10000'))
+DOWNLOAD_TIMEOUT = float(os.getenv('MEDIA_DOWNLOAD_TIMEOUT', '60'))
+MAX_DOWNLOAD_BYTES = int(os.getenv('MEDIA_MAX_DOWNLOAD_BYTES', str(200 * 1024 * 1024)))
+CHUNK_SIZE = 1024 * 1024
+# Prefix for the /media/... URLs handed to clients; empty means the page's own origin
+MEDIA_BASE_URL = os.getenv('MEDIA_BASE_URL', '').rstrip('/')
+SOURCE_PATH = '/media/source/'
+
+CONTENT_TYPES = {
+    'image/png': 'png', 'image/jpeg': 'jpg', 'image/webp': 'webp', 'image/gif': 'gif',
+    'video/mp4': 'mp4', 'video/webm': 'webm', 'video/quicktime': 'mov'
+}
+EXTENSION_TYPES = {ext: content_type for content_type, ext in CONTENT_TYPES.items()}
+EXTENSION_TYPES['jpeg'] = 'image/jpeg'
+EXTENSION_TYPES['bin'] = 'application/octet-stream'
+
+# (name, max edge in px); every variant is WebP
+IMAGE_VARIANTS = (('thumb_256', 256), ('thumb_512', 512), ('full', None))
+
+
+def media_url(path: str) -> str:
+    """Client-facing URL of a backend /media/... path"""
+    return f"{MEDIA_BASE_URL}{path}"
+
+
+def source_key(url: str) -> str:
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+
+def shard_path(content_hash: str, suffix: str) -> str:
+    return os.path.join(MEDIA_STORE_DIR, content_hash[:2], content_hash[2:4], f"{content_hash}{suffix}")
+
+
+def object_path(content_hash: str, extension: str) -> str:
+    return shard_path(content_hash, f".{extension}")
+
+
+def variant_path(content_hash: str, variant: str) -> str:
+    return shard_path(content_hash, f"__{variant}.webp")
+
+
+def _write_variants(source: str, content_hash: str, root: str) -> Dict[str, int]:
+    """Runs in a worker process: resize and re-encode one image into every WebP variant"""
+    from PIL import Image
+
+    written = {}
+    with Image.open(source) as image:
+        image.load()
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        for name, edge in IMAGE_VARIANTS:
+            target = os.path.join(root, content_hash[:2], content_hash[2:4], f"{content_hash}__{name}.webp")
+            if os.path.exists(target):
+                continue
+            variant = image.copy()
+            if edge:
+                variant.thumbnail((edge, edge), Image.LANCZOS)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as handle:
+                variant.save(handle, 'WEBP', quality=82, method=4)
+            os.replace(tmp, target)
+            written[name] = os.path.getsize(target)
+    return written
+
+
+class MediaStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sources: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._downloads = None
+        self._thumbnails = None
+        self._stats = {'registered': 0, 'downloaded': 0, 'deduplicated': 0, 'download_failures': 0,
+                       'variants_written': 0, 'variant_failures': 0}
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # Pools do not survive fork; a worker builds its own on first use
+        self._lock = threading.Lock()
+        self._downloads = None
+        self._thumbnails = None
+
+    def _executors(self):
+        with self._lock:
+            if self._downloads is None:
+                self._downloads = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix='media-download')
+                self._thumbnails = ProcessPoolExecutor(max_workers=THUMBNAIL_WORKERS)
+            return self._downloads, self._thumbnails
+
+    def _remember(self, key: str, fields: Dict[str, Any]) -> Dict[str, Any]:
+        """Add or update a source entry in the bounded local LRU (call with _lock held)"""
+        entry = self._sources.setdefault(key, {})
+        entry.update(fields)
+        self._sources.move_to_end(key)
+        while len(self._sources) > LOCAL_SOURCES_SIZE:
+            self._sources.popitem(last=False)
+        return entry
+
+    def register_remote(self, url: str, kind: str) -> str:
+        """Schedule a background copy of a provider URL; returns the stable local URL for it"""
+        key = source_key(url)
+        downloads, _ = self._executors()
+        with self._lock:
+            self._stats['registered'] += 1
+            if key in self._sources:
+                self._sources.move_to_end(key)
+                return media_url(f"{SOURCE_PATH}{key}")
+            self._remember(key, {'source_url': url, 'kind': kind, 'content_hash': None})
+        # Until the copy lands, any worker on this host can redirect to the provider
+        shared_cache.set(f"media-source:{key}", {'source_url': url, 'content_hash': None}, SOURCE_CACHE_TTL)
+        downloads.submit(self._ingest, key, url, kind)
+        return media_url(f"{SOURCE_PATH}{key}")
+
+    def _ingest(self, key: str, url: str, kind: str):
+        try:
+            content_hash, extension, size, content_type = self._download(url)
+        except Exception as e:
+            with self._lock:
+                self._stats['download_failures'] += 1
+            logger.warning(f"Media download failed for {url}: {e}")
+            return
+
+        collection = get_media_objects_collection()
+        if collection is not None:
+            collection.update_one(
+                {'_id': content_hash},
+                {'$setOnInsert': {'extension': extension, 'content_type': content_type, 'size': size,
+                                  'kind': kind, 'created_at': datetime.now()},
+                 '$addToSet': {'sources': key}},
+                upsert=True
+            )
+        with self._lock:
+            self._remember(key, {'source_url': url, 'content_hash': content_hash, 'extension': extension})
+        shared_cache.set(f"media-source:{key}", {'content_hash': content_hash, 'extension': extension}, SOURCE_CACHE_TTL)
+
+        if content_type.startswith('image/'):
+            _, thumbnails = self._executors()
+            future = thumbnails.submit(_write_variants, object_path(content_hash, extension), content_hash, MEDIA_STORE_DIR)
+            future.add_done_callback(lambda f: self._variants_done(content_hash, f))
+
+    def _download(self, url: str):
+        os.makedirs(MEDIA_STORE_DIR, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        with requests.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+            response.raise_for_status()
+            content_type = response.headers.get('Content-Type', 'application/octet-stream').split(';')[0].strip()
+            extension = CONTENT_TYPES.get(content_type, 'bin')
+            fd, tmp = tempfile.mkstemp(dir=MEDIA_STORE_DIR, suffix='.download')
+            try:
+                with os.fdopen(fd, 'wb') as handle:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        size += len(chunk)
+                        if size > MAX_DOWNLOAD_BYTES:
+                            raise ValueError(f"download exceeds {MAX_DOWNLOAD_BYTES} bytes")
+                        digest.update(chunk)
+                        handle.write(chunk)
+                content_hash = digest.hexdigest()
+                self._commit(tmp, content_hash, extension, content_type)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        return content_hash, extension, size, content_type
+
+    def _commit(self, tmp: str, content_hash: str, extension: str, content_type: str):
+        target = object_path(content_hash, extension)
+        if os.path.exists(target):
+            with self._lock:
+                self._stats['deduplicated'] += 1
+            return
+        if MEDIA_STORE_BACKEND == 'gridfs' and db_manager.db is not None:
+            import gridfs
+            bucket = gridfs.GridFSBucket(db_manager.db, bucket_name='media')
+            try:
+                with open(tmp, 'rb') as handle:
+                    bucket.upload_from_stream_with_id(content_hash, f"{content_hash}.{extension}", handle,
+                                                      metadata={'content_type': content_type})
+            except gridfs.errors.FileExists:
+                pass
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(tmp, target)
+        with self._lock:
+            self._stats['downloaded'] += 1
+
+    def _variants_done(self, content_hash: str, future):
+        try:
+            written = future.result()
+            with self._lock:
+                self._stats['variants_written'] += len(written)
+        except Exception as e:
+            with self._lock:
+                self._stats['variant_failures'] += 1
+            logger.warning(f"Thumbnail generation failed for {content_hash}: {e}")
+
+    def resolve_source(self, key: str) -> Optional[Dict[str, Any]]:
+        """Where a source URL currently lives: local content hash if copied, else the provider URL"""
+        with self._lock:
+            entry = self._sources.get(key)
+            if entry is not None:
+                self._sources.move_to_end(key)
+                entry = dict(entry)
+        if entry and entry.get('content_hash'):
+            return entry
+        resolved = shared_cache.get(f"media-source:{key}")
+        if resolved is not None and resolved.get('content_hash'):
+            with self._lock:
+                self._remember(key, resolved)
+            return resolved
+        # Still downloading somewhere on this host: redirect to the provider meanwhile
+        entry = entry or resolved
+        collection = get_media_objects_collection()
+        if collection is not None:
+            doc = collection.find_one({'sources': key}, {'extension': 1})
+            if doc:
+                resolved = {'content_hash': doc['_id'], 'extension': doc['extension']}
+                shared_cache.set(f"media-source:{key}", resolved, SOURCE_CACHE_TTL)
+                with self._lock:
+                    self._remember(key, resolved)
+                return resolved
+        return entry
+
+    def local_file(self, content_hash: str, extension: str) -> Optional[str]:
+        """Path of a stored object on local disk, materializing it from GridFS if needed"""
+        path = object_path(content_hash, extension)
+        if os.path.exists(path):
+            return path
+        if MEDIA_STORE_BACKEND != 'gridfs' or db_manager.db is None:
+            return None
+        import gridfs
+        bucket = gridfs.GridFSBucket(db_manager.db, bucket_name='media')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as handle:
+                bucket.download_to_stream(content_hash, handle)
+            os.replace(tmp, path)
+        except Exception as e:
+            logger.warning(f"GridFS read for {content_hash} failed: {e}")
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return None
+        return path
+
+    def path_for_local_url(self, local_url: Optional[str]) -> Optional[str]:
+        """Disk path behind a /media/source/<key> URL, if the copy has landed"""
+        if local_url and MEDIA_BASE_URL and local_url.startswith(MEDIA_BASE_URL):
+            local_url = local_url[len(MEDIA_BASE_URL):]
+        if not local_url or not local_url.startswith(SOURCE_PATH):
+            return None
+        entry = self.resolve_source(local_url.rsplit('/', 1)[-1])
+        if not entry or not entry.get('content_hash'):
+            return None
+        return self.local_file(entry['content_hash'], entry['extension'])
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, 'tracked_sources': len(self._sources), 'backend': MEDIA_STORE_BACKEND}
+
+
+# Global media store (per worker process)
+media_store = MediaStore()
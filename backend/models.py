@@ -1,10 +1,16 @@
-from pymongo import MongoClient
 from bson.objectid import ObjectId
-import os
 
-MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017')
-client = MongoClient(MONGO_URI)
-db = client['parallel_you']
+from database import db_manager
+
+
+class _LazyDatabase:
+    """Shares db_manager's per-process client instead of opening a second one at import"""
+
+    def __getattr__(self, name):
+        return db_manager.db[name]
+
+
+db = _LazyDatabase()
 
 # User Profile Model
 class UserProfile:
@@ -0,0 +1,307 @@
+"""
+Mongo command monitoring and slow-query profiler
+Parallel You: AI-Generated Personalized Reality Simulator
+
+A pymongo CommandListener registered on the client times every command and
+keeps a latency histogram per collection and operation. Commands slower than
+MONGO_SLOW_MS are grouped by query shape: the filter, sort or pipeline with
+every literal value replaced by '?', so no user data is kept. A sample of
+slow shapes is explained in a background thread, and shapes whose winning
+plan contains a COLLSCAN are flagged. The listener itself only does
+dictionary updates; it never issues commands.
+"""
+
+import json
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+from pymongo import monitoring
+
+from jobs import PeriodicJob
+
+logger = logging.getLogger(__name__)
+
+SLOW_MS = float(os.getenv('MONGO_SLOW_MS', '100'))
+EXPLAIN_SAMPLE_RATE = float(os.getenv('MONGO_EXPLAIN_SAMPLE_RATE', '0.1'))
+# A shape is explained again at most this often
+EXPLAIN_INTERVAL = float(os.getenv('MONGO_EXPLAIN_INTERVAL_SECONDS', '3600'))
+REPORT_INTERVAL = float(os.getenv('MONGO_PROFILE_REPORT_INTERVAL_SECONDS', '300'))
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+MAX_SHAPES = 500
+RECENT_SLOW = 50
+REPORT_TOP = 20
+
+# Driver housekeeping, not application queries
+IGNORED_COMMANDS = {
+    'hello', 'ismaster', 'isMaster', 'ping', 'buildinfo', 'buildInfo', 'saslStart', 'saslContinue',
+    'endSessions', 'killCursors', 'explain', 'getLastError', 'abortTransaction', 'commitTransaction'
+}
+EXPLAINABLE = {'find', 'aggregate', 'count', 'distinct', 'update', 'delete', 'findAndModify'}
+# Session and cluster fields that may not be sent inside an explain
+_NOT_EXPLAINED = {'lsid', '$db', '$clusterTime', 'txnNumber', 'autocommit', 'startTransaction',
+                  '$readPreference', 'writeConcern', 'readConcern'}
+
+
+def redact(value: Any) -> Any:
+    """Keep field names, operators and $field paths; replace every literal with '?'"""
+    if isinstance(value, dict):
+        return {key: redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if value and all(isinstance(item, dict) for item in value):
+            return [redact(item) for item in value]
+        return ['?'] if value else []
+    if isinstance(value, str) and value.startswith('$'):
+        return value
+    return '?'
+
+
+def query_shape(command_name: str, command: Dict[str, Any]) -> Optional[str]:
+    """Redacted filter/sort/pipeline of a command, as a stable string"""
+    if command_name == 'find':
+        parts = {'filter': command.get('filter', {}), 'sort': command.get('sort'), 'projection': command.get('projection')}
+    elif command_name == 'aggregate':
+        parts = {'pipeline': command.get('pipeline', [])}
+    elif command_name in ('count', 'distinct'):
+        parts = {'query': command.get('query', {}), 'key': command.get('key')}
+    elif command_name == 'findAndModify':
+        parts = {'query': command.get('query', {}), 'sort': command.get('sort')}
+    elif command_name == 'update':
+        parts = {'q': (command.get('updates') or [{}])[0].get('q', {})}
+    elif command_name == 'delete':
+        parts = {'q': (command.get('deletes') or [{}])[0].get('q', {})}
+    else:
+        return None
+    return json.dumps(redact({k: v for k, v in parts.items() if v is not None}), sort_keys=True, default=str)
+
+
+def _collection_of(command_name: str, command: Dict[str, Any]) -> str:
+    if command_name == 'getMore':
+        return command.get('collection', '?')
+    target = command.get(command_name)
+    return target if isinstance(target, str) else '(database)'
+
+
+def plan_stages(explain: Dict[str, Any]) -> List[str]:
+    """Stage names of every winning plan in an explain result (find, aggregate or sharded)"""
+    stages = []
+
+    def walk(node, in_plan):
+        if isinstance(node, dict):
+            if in_plan and isinstance(node.get('stage'), str):
+                stages.append(node['stage'])
+            for key, value in node.items():
+                walk(value, in_plan or key == 'winningPlan')
+        elif isinstance(node, list):
+            for item in node:
+                walk(item, in_plan)
+
+    walk(explain, False)
+    return stages
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.failures = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, ms: float, ok: bool):
+        index = next((i for i, bound in enumerate(BUCKETS_MS) if ms <= bound), len(BUCKETS_MS))
+        self.counts[index] += 1
+        self.count += 1
+        self.failures += not ok
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th quantile"""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return BUCKETS_MS[index] if index < len(BUCKETS_MS) else round(self.max_ms, 1)
+        return round(self.max_ms, 1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        buckets = {f"<={bound}ms": count for bound, count in zip(BUCKETS_MS, self.counts)}
+        buckets[f">{BUCKETS_MS[-1]}ms"] = self.counts[-1]
+        return {
+            'count': self.count,
+            'failures': self.failures,
+            'avg_ms': round(self.total_ms / self.count, 2) if self.count else 0,
+            'p50_ms': self.quantile(0.5),
+            'p95_ms': self.quantile(0.95),
+            'p99_ms': self.quantile(0.99),
+            'max_ms': round(self.max_ms, 1),
+            'histogram': buckets
+        }
+
+
+class CommandProfiler(monitoring.CommandListener):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[Any, int], Tuple[str, str, Any, str]] = {}
+        self._histograms: Dict[str, Histogram] = {}
+        self._shapes: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        self._recent = deque(maxlen=RECENT_SLOW)
+        self._explain_queue = None
+        self._stats = {'commands': 0, 'slow': 0, 'explained': 0, 'explain_failures': 0, 'shapes_dropped': 0}
+        self.started_at = datetime.now()
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # Each worker profiles its own commands
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._explain_queue = None
+
+    # Listener callbacks run on the thread that issued the command; keep them cheap
+
+    def started(self, event):
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        command = event.command
+        collection = _collection_of(event.command_name, command)
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (
+                event.command_name, collection, command, event.database_name
+            )
+
+    def succeeded(self, event):
+        self._finish(event, True)
+
+    def failed(self, event):
+        self._finish(event, False)
+
+    def _finish(self, event, ok: bool):
+        with self._lock:
+            pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+        command_name, collection, command, database_name = pending
+        ms = event.duration_micros / 1000
+        key = f"{collection}.{command_name}"
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.record(ms, ok)
+            self._stats['commands'] += 1
+        if ms >= SLOW_MS:
+            self._record_slow(command_name, collection, command, database_name, ms)
+
+    def _record_slow(self, command_name: str, collection: str, command: Dict[str, Any], database_name: str, ms: float):
+        shape = query_shape(command_name, command) or '{}'
+        key = (collection, command_name, shape)
+        now = time.time()
+        explain = False
+        with self._lock:
+            self._stats['slow'] += 1
+            entry = self._shapes.get(key)
+            if entry is None:
+                if len(self._shapes) >= MAX_SHAPES:
+                    self._stats['shapes_dropped'] += 1
+                    return
+                entry = self._shapes[key] = {
+                    'collection': collection, 'operation': command_name, 'shape': shape,
+                    'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'plan': None, 'explained_at': 0.0
+                }
+            entry['count'] += 1
+            entry['total_ms'] += ms
+            entry['max_ms'] = max(entry['max_ms'], ms)
+            entry['last_seen'] = datetime.now().isoformat()
+            self._recent.append({'collection': collection, 'operation': command_name, 'shape': shape,
+                                 'ms': round(ms, 1), 'at': entry['last_seen']})
+            if (command_name in EXPLAINABLE and now - entry['explained_at'] >= EXPLAIN_INTERVAL
+                    and random.random() < EXPLAIN_SAMPLE_RATE):
+                entry['explained_at'] = now
+                explain = True
+        if explain:
+            self._queue_explain(key, command, database_name)
+
+    def _queue_explain(self, key, command: Dict[str, Any], database_name: str):
+        with self._lock:
+            if self._explain_queue is None:
+                self._explain_queue = queue.Queue(maxsize=10)
+                threading.Thread(target=self._explain_worker, args=(self._explain_queue,),
+                                 name='mongo-explain', daemon=True).start()
+            work = self._explain_queue
+        explained = {k: v for k, v in command.items() if k not in _NOT_EXPLAINED}
+        try:
+            work.put_nowait((key, explained, database_name))
+        except queue.Full:
+            pass
+
+    def _explain_worker(self, work: queue.Queue):
+        from database import db_manager
+
+        while True:
+            key, command, database_name = work.get()
+            try:
+                result = db_manager.client[database_name].command({'explain': command, 'verbosity': 'queryPlanner'})
+                stages = plan_stages(result)
+                plan = {'stages': stages, 'collscan': 'COLLSCAN' in stages, 'explained': datetime.now().isoformat()}
+                with self._lock:
+                    if key in self._shapes:
+                        self._shapes[key]['plan'] = plan
+                    self._stats['explained'] += 1
+                if plan['collscan']:
+                    logger.warning(f"COLLSCAN on {key[0]}.{key[1]}", extra={'shape': key[2]})
+            except Exception as e:
+                with self._lock:
+                    self._stats['explain_failures'] += 1
+                logger.warning(f"Explain of slow {key[0]}.{key[1]} failed: {e}")
+
+    def get_report(self, top: int = REPORT_TOP) -> Dict[str, Any]:
+        with self._lock:
+            operations = {key: histogram.snapshot() for key, histogram in sorted(self._histograms.items())}
+            shapes = [dict(entry) for entry in self._shapes.values()]
+            recent = list(self._recent)
+            stats = dict(self._stats)
+        for entry in shapes:
+            entry['avg_ms'] = round(entry['total_ms'] / entry['count'], 1)
+            entry['total_ms'] = round(entry.pop('total_ms'), 1)
+            entry['max_ms'] = round(entry['max_ms'], 1)
+            entry.pop('explained_at')
+        shapes.sort(key=lambda entry: entry['total_ms'], reverse=True)
+        return {
+            **stats,
+            'since': self.started_at.isoformat(),
+            'pid': os.getpid(),
+            'slow_threshold_ms': SLOW_MS,
+            'operations': operations,
+            'slow_shapes': shapes[:top],
+            'collscans': [entry for entry in shapes if entry['plan'] and entry['plan']['collscan']],
+            'recent_slow': recent[-top:]
+        }
+
+    def log_report(self):
+        """Periodic one-line digest: busiest operations and the worst slow shapes"""
+        report = self.get_report(top=5)
+        busiest = sorted(report['operations'].items(), key=lambda item: item[1]['count'], reverse=True)[:5]
+        logger.info(
+            f"Mongo profile: {report['commands']} commands, {report['slow']} slow, {len(report['collscans'])} COLLSCAN shapes",
+            extra={
+                'busiest': {key: {'count': op['count'], 'p95_ms': op['p95_ms']} for key, op in busiest},
+                'slowest': [{'op': f"{s['collection']}.{s['operation']}", 'shape': s['shape'], 'count': s['count'],
+                             'avg_ms': s['avg_ms']} for s in report['slow_shapes']],
+                'collscans': [f"{s['collection']}.{s['operation']} {s['shape']}" for s in report['collscans']]
+            }
+        )
+
+
+# Global profiler (per worker process), registered on the MongoClient by database.py
+command_profiler = CommandProfiler()
+profile_report_job = PeriodicJob('mongo_profile_report', command_profiler.log_report, REPORT_INTERVAL)
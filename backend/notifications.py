@@ -0,0 +1,220 @@
+"""
+Per-user notification inbox with long-poll delivery
+Parallel You: AI-Generated Personalized Reality Simulator
+
+Notifications live in the `notifications` collection, numbered per user by a
+sequence kept next to the unread counter in `notification_counters`. Waiting
+clients block on an in-process event; one watcher thread per worker checks
+the counters of every waiting user in a single query and wakes them, so idle
+clients cost no database traffic of their own.
+
+This is long polling on a synchronous WSGI server, not SSE or websockets:
+each waiting client holds a request thread for up to LONG_POLL_MAX_WAIT.
+Waiters are therefore capped at a share of the server's request threads
+(SERVER_THREADS), and past the cap, or on a server that handles one request
+at a time, a poll answers immediately and the client simply polls again.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import logging
+
+from pymongo import ReturnDocument
+
+from database import get_notifications_collection, get_notification_counters_collection
+from ids import new_id
+
+logger = logging.getLogger(__name__)
+
+LONG_POLL_MAX_WAIT = float(os.getenv('NOTIFICATIONS_MAX_WAIT_SECONDS', '25'))
+WATCH_INTERVAL = float(os.getenv('NOTIFICATIONS_WATCH_INTERVAL_SECONDS', '1'))
+# Request threads per worker process (the threaded dev server has no hard limit, so this is what we budget)
+SERVER_THREADS = int(os.getenv('SERVER_THREADS', '32'))
+# Leave most threads free for ordinary requests
+MAX_WAITERS = int(os.getenv('NOTIFICATIONS_MAX_WAITERS', str(max(1, SERVER_THREADS // 4))))
+PAGE_SIZE = 50
+
+NOTIFICATION_PROJECTION = {
+    '_id': 0, 'id': '$notification_id', 'seq': 1, 'type': 1, 'title': 1,
+    'message': 1, 'timestamp': 1, 'read': 1, 'data': 1
+}
+
+
+def notify(user_id: str, notification_type: str, title: str, message: str,
+           data: Optional[Dict[str, Any]] = None) -> Optional[int]:
+    """Append a notification to a user's inbox; returns its sequence number"""
+    notifications = get_notifications_collection()
+    counters = get_notification_counters_collection()
+    if notifications is None or counters is None or not user_id:
+        return None
+    try:
+        counter = counters.find_one_and_update(
+            {'_id': user_id},
+            {'$inc': {'seq': 1, 'unread': 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        seq = counter['seq']
+        notifications.insert_one({
+            'notification_id': new_id('notif'),
+            'user_id': user_id,
+            'seq': seq,
+            'type': notification_type,
+            'title': title,
+            'message': message,
+            'data': data or {},
+            'timestamp': datetime.now(),
+            'read': False
+        })
+    except Exception as e:
+        logger.error(f"Failed to notify {user_id}: {e}")
+        return None
+    inbox_waiters.wake(user_id, seq)
+    return seq
+
+
+def get_inbox_state(user_id: str) -> Dict[str, int]:
+    counters = get_notification_counters_collection()
+    if counters is None:
+        return {'seq': 0, 'unread': 0}
+    counter = counters.find_one({'_id': user_id}) or {}
+    return {'seq': counter.get('seq', 0), 'unread': max(counter.get('unread', 0), 0)}
+
+
+def list_notifications(user_id: str, since_seq: int = 0, limit: int = PAGE_SIZE) -> List[Dict[str, Any]]:
+    notifications = get_notifications_collection()
+    if notifications is None:
+        return []
+    items = list(notifications.aggregate([
+        {'$match': {'user_id': user_id, 'seq': {'$gt': since_seq}}},
+        {'$sort': {'seq': -1}},
+        {'$limit': limit},
+        {'$project': NOTIFICATION_PROJECTION}
+    ]))
+    for item in items:
+        if isinstance(item.get('timestamp'), datetime):
+            item['timestamp'] = item['timestamp'].isoformat()
+    return items
+
+
+def mark_read(user_id: str, notification_ids: Optional[List[str]] = None) -> int:
+    """Mark some (or all, when ids is None) notifications read and decrement the unread counter"""
+    notifications = get_notifications_collection()
+    counters = get_notification_counters_collection()
+    if notifications is None or counters is None:
+        return 0
+    query = {'user_id': user_id, 'read': False}
+    if notification_ids is not None:
+        query['notification_id'] = {'$in': notification_ids}
+    modified = notifications.update_many(query, {'$set': {'read': True}}).modified_count
+    if notification_ids is None:
+        # Reading everything is a natural point to correct any counter drift
+        counters.update_one({'_id': user_id}, {'$set': {'unread': 0}})
+    elif modified:
+        counters.update_one({'_id': user_id}, {'$inc': {'unread': -modified}})
+    return modified
+
+
+class InboxWaiters:
+    """Long-poll waiters grouped by user; woken locally or by the shared watcher thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters: Dict[str, Dict[str, Any]] = {}
+        self._total = 0
+        self._watcher = None
+        self._stats = {'waits': 0, 'woken': 0, 'timeouts': 0, 'rejected': 0, 'watch_queries': 0}
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._waiters = {}
+        self._total = 0
+        self._watcher = None
+
+    def wait(self, user_id: str, since_seq: int, timeout: float) -> Optional[bool]:
+        """Block until the user's sequence passes since_seq; None if too many clients are waiting"""
+        self._ensure_watcher()
+        with self._lock:
+            if self._total >= MAX_WAITERS:
+                self._stats['rejected'] += 1
+                return None
+            entry = self._waiters.get(user_id)
+            if entry is None:
+                entry = self._waiters[user_id] = {'event': threading.Event(), 'since': since_seq, 'count': 0}
+            else:
+                entry['since'] = min(entry['since'], since_seq)
+            entry['count'] += 1
+            self._total += 1
+            self._stats['waits'] += 1
+
+        woken = entry['event'].wait(timeout)
+
+        with self._lock:
+            entry['count'] -= 1
+            self._total -= 1
+            if entry['count'] == 0 and self._waiters.get(user_id) is entry:
+                del self._waiters[user_id]
+            self._stats['woken' if woken else 'timeouts'] += 1
+        return woken
+
+    def wake(self, user_id: str, seq: int):
+        with self._lock:
+            entry = self._waiters.get(user_id)
+            if entry is None or seq <= entry['since']:
+                return
+            # Later waiters for this user start on a fresh event
+            del self._waiters[user_id]
+        entry['event'].set()
+
+    def _ensure_watcher(self):
+        if self._watcher and self._watcher.is_alive():
+            return
+        with self._lock:
+            if self._watcher and self._watcher.is_alive():
+                return
+            self._watcher = threading.Thread(target=self._watch, name='inbox-watcher', daemon=True)
+            self._watcher.start()
+
+    def _watch(self):
+        # Picks up notifications written by other worker processes
+        while True:
+            time.sleep(WATCH_INTERVAL)
+            with self._lock:
+                waiting = {user_id: entry['since'] for user_id, entry in self._waiters.items()}
+            counters = get_notification_counters_collection()
+            if not waiting or counters is None:
+                continue
+            try:
+                self._stats['watch_queries'] += 1
+                for counter in counters.find({'_id': {'$in': list(waiting)}}, {'seq': 1}):
+                    if counter.get('seq', 0) > waiting[counter['_id']]:
+                        self.wake(counter['_id'], counter['seq'])
+            except Exception as e:
+                logger.warning(f"Inbox watcher query failed: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, 'waiting_clients': self._total, 'waiting_users': len(self._waiters)}
+
+
+def poll(user_id: str, since_seq: int = 0, wait_seconds: float = 0, can_block: bool = True) -> Dict[str, Any]:
+    """Return new notifications, long-polling up to wait_seconds when there are none yet"""
+    state = get_inbox_state(user_id)
+    if state['seq'] <= since_seq and wait_seconds > 0 and can_block:
+        woken = inbox_waiters.wait(user_id, since_seq, min(wait_seconds, LONG_POLL_MAX_WAIT))
+        if woken:
+            state = get_inbox_state(user_id)
+    notifications = list_notifications(user_id, since_seq) if state['seq'] > since_seq else []
+    return {
+        'notifications': notifications,
+        'unread_count': state['unread'],
+        'seq': state['seq']
+    }
+
+
+# Global waiter registry (per worker process)
+inbox_waiters = InboxWaiters()
@@ -0,0 +1,215 @@
+"""
+Latency-aware provider routing with hedged requests
+Parallel You: AI-Generated Personalized Reality Simulator
+
+Keeps a rolling window of latency and failures per provider. In "fastest"
+mode a request goes to the provider with the best recent p95 (penalised by
+its error rate). If the primary has not answered by its own p95, a backup
+request is fired at the next provider and whichever answers first wins. The
+loser cannot be interrupted mid-request; it runs on in the pool until it
+finishes or hits its own timeout, and its real latency is recorded then.
+Hedges are capped at a fraction of recent requests so an overall slowdown
+cannot double provider traffic.
+"""
+
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+
+import requests
+
+import deadline
+
+logger = logging.getLogger(__name__)
+
+WINDOW_SIZE = int(os.getenv('ROUTING_WINDOW_SIZE', '200'))
+WINDOW_SECONDS = float(os.getenv('ROUTING_WINDOW_SECONDS', '600'))
+MIN_SAMPLES = 5
+# Assumed p95 for a provider without enough recent samples
+PRIOR_P95 = float(os.getenv('ROUTING_PRIOR_P95_SECONDS', '10'))
+ERROR_PENALTY = 4.0
+HEDGE_MAX_FRACTION = float(os.getenv('HEDGE_MAX_FRACTION', '0.1'))
+HEDGE_MIN_DELAY = 0.5
+ROUTING_WORKERS = int(os.getenv('ROUTING_WORKERS', '16'))
+
+ProviderCall = Callable[[requests.Session], Dict[str, Any]]
+
+
+class ProviderStats:
+    """Rolling (time, latency, ok) samples for one provider"""
+
+    def __init__(self):
+        self.samples = deque(maxlen=WINDOW_SIZE)
+        self.calls = 0
+        self.wins = 0
+
+    def record(self, latency: float, ok: bool):
+        self.samples.append((time.monotonic(), latency, ok))
+        self.calls += 1
+
+    def _recent(self) -> List[Tuple[float, float, bool]]:
+        horizon = time.monotonic() - WINDOW_SECONDS
+        return [s for s in self.samples if s[0] >= horizon]
+
+    def p95(self) -> Optional[float]:
+        latencies = sorted(s[1] for s in self._recent())
+        if len(latencies) < MIN_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+
+    def error_rate(self) -> float:
+        recent = self._recent()
+        return sum(1 for s in recent if not s[2]) / len(recent) if recent else 0.0
+
+    def routing_cost(self) -> float:
+        return (self.p95() or PRIOR_P95) * (1 + ERROR_PENALTY * self.error_rate())
+
+    def snapshot(self) -> Dict[str, Any]:
+        recent = self._recent()
+        latencies = sorted(s[1] for s in recent)
+        p95 = self.p95()
+        return {
+            'samples': len(recent),
+            'p50_ms': round(latencies[len(latencies) // 2] * 1000) if latencies else None,
+            'p95_ms': round(p95 * 1000) if p95 is not None else None,
+            'error_rate': round(self.error_rate(), 4),
+            'calls': self.calls,
+            'wins': self.wins
+        }
+
+
+class ProviderRouter:
+    def __init__(self, name: str, providers: List[str], is_failure: Callable[[Dict[str, Any]], bool]):
+        self.name = name
+        self.providers = list(providers)
+        self.is_failure = is_failure
+        self._lock = threading.Lock()
+        self._stats = {provider: ProviderStats() for provider in providers}
+        self._recent_hedges = deque(maxlen=WINDOW_SIZE)
+        self._counters = {'requests': 0, 'hedges': 0, 'hedge_wins': 0, 'hedges_suppressed': 0, 'abandoned': 0}
+        self._pool = None
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=ROUTING_WORKERS, thread_name_prefix=f"{self.name}-route")
+            return self._pool
+
+    def ranked(self) -> List[str]:
+        """Providers from lowest to highest routing cost"""
+        with self._lock:
+            return sorted(self.providers, key=lambda p: self._stats[p].routing_cost())
+
+    def _hedge_allowed(self) -> bool:
+        with self._lock:
+            if not self._recent_hedges:
+                return True
+            return sum(self._recent_hedges) / len(self._recent_hedges) < HEDGE_MAX_FRACTION
+
+    def _run(self, provider: str, call: ProviderCall, session: requests.Session):
+        started = time.monotonic()
+        try:
+            result = call(session)
+            ok = not self.is_failure(result)
+        except Exception as e:
+            result, ok = e, False
+        finally:
+            session.close()
+        return provider, result, ok, time.monotonic() - started
+
+    def _record_late(self, future):
+        """Record a request the caller stopped waiting for, once it actually finishes"""
+        provider, _, ok, latency = future.result()
+        with self._lock:
+            self._stats[provider].record(latency, ok)
+
+    def _submit(self, provider: str, call: ProviderCall):
+        session = requests.Session()
+        # Each task gets its own copy of the request context so the deadline reaches the worker thread
+        return self._executor().submit(contextvars.copy_context().run, self._run, provider, call, session)
+
+    def call(self, calls: Dict[str, ProviderCall], fallback: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """Route to the fastest provider, hedging to the next one past the primary's p95"""
+        order = [p for p in self.ranked() if p in calls]
+        primary = order[0]
+        with self._lock:
+            self._counters['requests'] += 1
+            hedge_after = max(self._stats[primary].p95() or PRIOR_P95, HEDGE_MIN_DELAY)
+
+        next_index = 0
+
+        def launch():
+            nonlocal next_index
+            provider = order[next_index]
+            next_index += 1
+            return self._submit(provider, calls[provider])
+
+        pending = {launch()}
+        hedged = False
+        done, _ = wait(pending, timeout=deadline.timeout_for(hedge_after), return_when=FIRST_COMPLETED)
+        if not done and next_index < len(order) and deadline.has_time(HEDGE_MIN_DELAY):
+            if self._hedge_allowed():
+                pending.add(launch())
+                hedged = True
+            else:
+                with self._lock:
+                    self._counters['hedges_suppressed'] += 1
+        with self._lock:
+            self._recent_hedges.append(hedged)
+            self._counters['hedges'] += hedged
+
+        winner = None
+        while pending and winner is None:
+            done, pending = wait(pending, timeout=deadline.remaining(), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for finished in done:
+                provider, result, ok, latency = finished.result()
+                with self._lock:
+                    self._stats[provider].record(latency, ok)
+                if ok and winner is None:
+                    winner = (provider, result)
+            if winner is None and not pending and next_index < len(order) and deadline.has_time(HEDGE_MIN_DELAY):
+                # Every request so far failed: fail over to the next provider
+                pending.add(launch())
+
+        # Whatever is still running keeps its pool thread until it returns or times out;
+        # its outcome is recorded then, so a slow provider's p95 reflects the real latency
+        for future in pending:
+            future.add_done_callback(self._record_late)
+        with self._lock:
+            self._counters['abandoned'] += len(pending)
+
+        if winner is None:
+            deadline.note_degraded(self.name)
+            return fallback()
+        provider, result = winner
+        with self._lock:
+            self._stats[provider].wins += 1
+            if hedged and provider != primary:
+                self._counters['hedge_wins'] += 1
+        return {**result, 'routed_to': provider, 'hedged': hedged}
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            providers = {name: stats.snapshot() for name, stats in self._stats.items()}
+            recent_rate = sum(self._recent_hedges) / len(self._recent_hedges) if self._recent_hedges else 0.0
+        return {
+            **counters,
+            'hedge_rate': round(counters['hedges'] / counters['requests'], 4) if counters['requests'] else 0.0,
+            'recent_hedge_rate': round(recent_rate, 4),
+            'hedge_cap': HEDGE_MAX_FRACTION,
+            'providers': providers,
+            'ranking': self.ranked()
+        }
@@ -0,0 +1,276 @@
+"""
+Incremental simulation rollups
+Parallel You: AI-Generated Personalized Reality Simulator
+
+Hourly and daily buckets per career, per education level and overall are
+maintained in `simulation_rollups` by aggregating only simulations newer
+than the stored `timestamp` watermark and folding them in with `$merge`.
+Distinct users per bucket are kept as HyperLogLog registers (see
+sketches.py) rather than a list of ids, so a bucket stays a few KB however
+many people it counts; re-merging the same users is a no-op, which keeps
+re-runs of a window safe. Dashboard figures are read from the daily buckets
+instead of raw simulations.
+"""
+
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+import logging
+
+from bson.binary import Binary
+
+from database import get_simulations_collection, get_rollups_collection, get_users_collection
+from jobs import PeriodicJob, get_job_state, update_job_state, run_exclusive
+from sketches import HyperLogLog
+
+logger = logging.getLogger(__name__)
+
+JOB_NAME = 'simulation_rollups'
+ROLLUP_INTERVAL = float(os.getenv('ROLLUP_INTERVAL_SECONDS', '300'))
+# Simulations are stamped by the app clock before insert; leave room for in-flight writes
+ROLLUP_LAG = timedelta(seconds=int(os.getenv('ROLLUP_LAG_SECONDS', '60')))
+
+GRANULARITIES = {'hour': 'hour', 'day': 'day'}
+DIMENSIONS = {
+    'all': {'$literal': 'all'},
+    'career': {'$toLower': {'$trim': {'input': {'$ifNull': ['$input_data.dreamCareer', 'unknown']}}}},
+    'education': {'$ifNull': ['$input_data.education', 'unknown']}
+}
+
+
+def _rollup_pipeline(granularity: str, dimension: str, since: datetime, until: datetime) -> List[Dict[str, Any]]:
+    # last_run makes a re-run of the same window a no-op for buckets it already folded in
+    not_applied = {'$lt': [{'$ifNull': ['$last_run', datetime.min]}, '$$new.last_run']}
+    return [
+        {'$match': {'timestamp': {'$gt': since, '$lte': until}}},
+        {'$group': {
+            '_id': {
+                'bucket': {'$dateTrunc': {'date': '$timestamp', 'unit': GRANULARITIES[granularity]}},
+                'key': DIMENSIONS[dimension]
+            },
+            'count': {'$sum': 1},
+            'score_sum': {'$sum': '$confidence_score'}
+        }},
+        {'$project': {
+            '_id': 0,
+            'granularity': {'$literal': granularity},
+            'dimension': {'$literal': dimension},
+            'key': '$_id.key',
+            'bucket': '$_id.bucket',
+            'count': 1,
+            'score_sum': 1,
+            'last_run': {'$literal': until}
+        }},
+        {'$merge': {
+            'into': 'simulation_rollups',
+            'on': ['granularity', 'dimension', 'bucket', 'key'],
+            'whenMatched': [
+                {'$set': {
+                    'count': {'$cond': [not_applied, {'$add': ['$count', '$$new.count']}, '$count']},
+                    'score_sum': {'$cond': [not_applied, {'$add': ['$score_sum', '$$new.score_sum']}, '$score_sum']},
+                    'last_run': {'$max': ['$last_run', '$$new.last_run']}
+                }}
+            ],
+            'whenNotMatched': 'insert'
+        }}
+    ]
+
+
+def _users_pipeline(granularity: str, dimension: str, since: datetime, until: datetime) -> List[Dict[str, Any]]:
+    # One row per distinct user per bucket, in bucket order, so no document holds a whole user list
+    return [
+        {'$match': {'timestamp': {'$gt': since, '$lte': until}}},
+        {'$group': {'_id': {
+            'bucket': {'$dateTrunc': {'date': '$timestamp', 'unit': GRANULARITIES[granularity]}},
+            'key': DIMENSIONS[dimension],
+            'user': {'$ifNull': ['$user_id', 'anonymous']}
+        }}},
+        {'$sort': {'_id.bucket': 1, '_id.key': 1}}
+    ]
+
+
+def _bucket_users(bucket: Dict[str, Any]) -> HyperLogLog:
+    """A bucket's distinct-user sketch (built from the id list of buckets written before sketches)"""
+    if bucket.get('users_hll'):
+        return HyperLogLog(registers=bucket['users_hll'])
+    sketch = HyperLogLog()
+    for user_id in bucket.get('users') or []:
+        sketch.add(str(user_id))
+    return sketch
+
+
+def _fold_users(granularity: str, dimension: str, since: datetime, until: datetime):
+    simulations = get_simulations_collection()
+    rollups = get_rollups_collection()
+
+    def flush(bucket, key, sketch):
+        match = {'granularity': granularity, 'dimension': dimension, 'bucket': bucket, 'key': key}
+        existing = rollups.find_one(match, {'users_hll': 1, 'users': 1})
+        if existing:
+            sketch.merge(_bucket_users(existing))
+        rollups.update_one(match, {'$set': {'users_hll': Binary(sketch.to_bytes()), 'unique_users': sketch.count()},
+                                   '$unset': {'users': ''}}, upsert=True)
+
+    current, sketch = None, None
+    for row in simulations.aggregate(_users_pipeline(granularity, dimension, since, until), allowDiskUse=True):
+        group = (row['_id']['bucket'], row['_id']['key'])
+        if group != current:
+            if current is not None:
+                flush(*current, sketch)
+            current, sketch = group, HyperLogLog()
+        sketch.add(str(row['_id']['user']))
+    if current is not None:
+        flush(*current, sketch)
+
+
+def _run_rollups_locked(now: datetime = None) -> Dict[str, Any]:
+    simulations = get_simulations_collection()
+    state = get_job_state(JOB_NAME)
+    since = state.get('watermark', datetime.min)
+
+    # A run that died mid-way recorded its window; reuse it so the last_run guard dedupes
+    until = state.get('pending_until')
+    if until is None:
+        until = (now or datetime.now()) - ROLLUP_LAG
+        if until <= since:
+            return {'status': 'up_to_date', 'watermark': since}
+        update_job_state(JOB_NAME, {'pending_until': until})
+
+    for granularity in GRANULARITIES:
+        for dimension in DIMENSIONS:
+            simulations.aggregate(_rollup_pipeline(granularity, dimension, since, until))
+            _fold_users(granularity, dimension, since, until)
+
+    update_job_state(JOB_NAME, {'watermark': until, 'last_completed': datetime.now()}, unset=['pending_until'])
+    logger.info(f"Simulation rollups advanced to {until.isoformat()}")
+    return {'status': 'ok', 'from': since, 'watermark': until}
+
+
+def run_rollups(now: datetime = None) -> Dict[str, Any]:
+    """Fold simulations newer than the watermark into the rollup buckets"""
+    if get_simulations_collection() is None or get_rollups_collection() is None:
+        return {'status': 'skipped', 'reason': 'Database not connected'}
+    result = run_exclusive(JOB_NAME, lambda: _run_rollups_locked(now))
+    return result or {'status': 'skipped', 'reason': 'Another worker holds the rollup lease'}
+
+
+rollup_job = PeriodicJob(JOB_NAME, run_rollups, ROLLUP_INTERVAL)
+
+
+def _daily_buckets(dimension: str, start: datetime, end: datetime, projection: Dict[str, int]) -> List[Dict[str, Any]]:
+    rollups = get_rollups_collection()
+    return list(rollups.find(
+        {'granularity': 'day', 'dimension': dimension, 'bucket': {'$gte': start, '$lt': end}},
+        {'_id': 0, 'key': 1, 'bucket': 1, **projection}
+    ))
+
+
+def _sum_by_key(buckets: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    totals: Dict[str, Dict[str, float]] = {}
+    for bucket in buckets:
+        entry = totals.setdefault(bucket['key'], {'count': 0, 'score_sum': 0})
+        entry['count'] += bucket.get('count', 0)
+        entry['score_sum'] += bucket.get('score_sum', 0)
+    return totals
+
+
+def _format_growth(current: float, previous: float) -> str:
+    if previous == 0:
+        return 'new' if current else '+0%'
+    change = (current - previous) / previous * 100
+    return f"{change:+.0f}%"
+
+
+def _window_bounds(window_days: int, now: datetime = None):
+    # Day buckets are truncated to midnight, so windows end at the start of tomorrow
+    end = (now or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    return end - timedelta(days=2 * window_days), end - timedelta(days=window_days), end
+
+
+def get_trending_careers(window_days: int = 7, limit: int = 5, min_count: int = 3, now: datetime = None) -> List[Dict[str, Any]]:
+    """Careers ranked by simulation growth in the last window vs. the one before it"""
+    previous_start, current_start, end = _window_bounds(window_days, now)
+    current = _sum_by_key(_daily_buckets('career', current_start, end, {'count': 1, 'score_sum': 1}))
+    previous = _sum_by_key(_daily_buckets('career', previous_start, current_start, {'count': 1, 'score_sum': 1}))
+
+    ranked = []
+    for career, totals in current.items():
+        if totals['count'] < min_count:
+            continue
+        prev_count = previous.get(career, {}).get('count', 0)
+        # Smoothed ratio so brand-new careers with a handful of runs don't dominate
+        momentum = (totals['count'] + 1) / (prev_count + 1)
+        ranked.append({
+            'career': career.title(),
+            'growth': _format_growth(totals['count'], prev_count),
+            'avg_score': round(totals['score_sum'] / totals['count'], 1),
+            'simulations': int(totals['count']),
+            '_momentum': momentum
+        })
+
+    ranked.sort(key=lambda item: (item['_momentum'], item['simulations']), reverse=True)
+    for item in ranked:
+        del item['_momentum']
+    return ranked[:limit]
+
+
+def get_dashboard_metrics(window_days: int = 7, now: datetime = None) -> Dict[str, Any]:
+    """Headline dashboard numbers computed from the overall daily buckets"""
+    previous_start, current_start, end = _window_bounds(window_days, now)
+    rollups = get_rollups_collection()
+
+    all_time = list(rollups.find(
+        {'granularity': 'day', 'dimension': 'all'},
+        {'_id': 0, 'count': 1, 'score_sum': 1}
+    ))
+    total_runs = sum(bucket.get('count', 0) for bucket in all_time)
+    total_score = sum(bucket.get('score_sum', 0) for bucket in all_time)
+
+    current = _daily_buckets('all', current_start, end, {'count': 1, 'users_hll': 1, 'users': 1})
+    previous = _daily_buckets('all', previous_start, current_start, {'count': 1, 'users_hll': 1, 'users': 1})
+    current_users, previous_users = HyperLogLog(), HyperLogLog()
+    for bucket in current:
+        current_users.merge(_bucket_users(bucket))
+    for bucket in previous:
+        previous_users.merge(_bucket_users(bucket))
+    current_runs = sum(bucket.get('count', 0) for bucket in current)
+    previous_runs = sum(bucket.get('count', 0) for bucket in previous)
+
+    return {
+        'avg_success_score': round(total_score / total_runs, 1) if total_runs else 0,
+        'total_scenarios_run': int(total_runs),
+        'active_users': current_users.count(),
+        'growth': {
+            'window_days': window_days,
+            'simulations': _format_growth(current_runs, previous_runs),
+            'active_users': _format_growth(current_users.count(), previous_users.count())
+        },
+        'rollup_watermark': get_job_state(JOB_NAME).get('watermark')
+    }
+
+
+def get_population_stats(limit: int = 10) -> Dict[str, Any]:
+    """All-time popular careers and average score per education level, from the daily buckets"""
+    rollups = get_rollups_collection()
+    totals = {}
+    for dimension in ('career', 'education'):
+        totals[dimension] = list(rollups.aggregate([
+            {'$match': {'granularity': 'day', 'dimension': dimension}},
+            {'$group': {'_id': '$key', 'count': {'$sum': '$count'}, 'score_sum': {'$sum': '$score_sum'}}}
+        ]))
+    careers = sorted(totals['career'], key=lambda row: row['count'], reverse=True)[:limit]
+    users = get_users_collection()
+    watermark = get_job_state(JOB_NAME).get('watermark')
+    return {
+        'popular_careers': [{'_id': (row['_id'] or 'unknown').title(), 'count': int(row['count'])} for row in careers],
+        'education_impact': {
+            row['_id']: round(row['score_sum'] / row['count'], 1) for row in totals['education'] if row['count']
+        },
+        'total_simulations': int(sum(row['count'] for row in totals['career'])),
+        'total_users': users.estimated_document_count() if users is not None else 0,
+        'last_updated': watermark.isoformat() if isinstance(watermark, datetime) else None
+    }
+
+
+if __name__ == "__main__":
+    print(run_rollups())
@@ -0,0 +1,88 @@
+"""
+Rule-based success scoring
+Parallel You: AI-Generated Personalized Reality Simulator
+"""
+
+import random
+
+# Career success factors and predictions
+CAREER_FACTORS = {
+    'software_engineer': {'base_score': 85, 'growth': 'high', 'salary': 'high'},
+    'doctor': {'base_score': 90, 'growth': 'medium', 'salary': 'very_high'},
+    'teacher': {'base_score': 75, 'growth': 'medium', 'salary': 'medium'},
+    'entrepreneur': {'base_score': 70, 'growth': 'very_high', 'salary': 'variable'},
+    'artist': {'base_score': 60, 'growth': 'variable', 'salary': 'variable'},
+    'scientist': {'base_score': 80, 'growth': 'medium', 'salary': 'high'},
+    'lawyer': {'base_score': 85, 'growth': 'medium', 'salary': 'very_high'},
+    'designer': {'base_score': 75, 'growth': 'high', 'salary': 'medium'},
+    'consultant': {'base_score': 80, 'growth': 'high', 'salary': 'high'},
+    'writer': {'base_score': 65, 'growth': 'variable', 'salary': 'variable'}
+}
+
+EDUCATION_BONUS = {
+    'high-school': 0,
+    'associate': 5,
+    'bachelor': 10,
+    'master': 15,
+    'phd': 20,
+    'other': 5
+}
+
+HABIT_BONUSES = {
+    'Exercise regularly': 8,
+    'Read daily': 6,
+    'Meditate': 5,
+    'Learn new skills': 10,
+    'Network actively': 7,
+    'Save money': 6,
+    'Travel frequently': 4,
+    'Volunteer': 3
+}
+
+def match_career_key(dream_career):
+    """Map a free-text career to a CAREER_FACTORS key, or None"""
+    dream_career = (dream_career or '').lower()
+    for key in CAREER_FACTORS:
+        if key in dream_career or dream_career in key:
+            return key
+    return None
+
+def career_base_score(dream_career):
+    """Career factor, 70 for unknown careers"""
+    career_key = match_career_key(dream_career)
+    return CAREER_FACTORS[career_key]['base_score'] if career_key else 70
+
+def age_adjustment(age):
+    """Age factor (younger = more potential)"""
+    age = int(age)
+    if age < 25:
+        return 10
+    elif age < 30:
+        return 5
+    elif age > 50:
+        return -5
+    return 0
+
+def rule_based_score(data):
+    """Deterministic part of the success score, before noise and clamping"""
+    base_score = career_base_score(data.get('dreamCareer', ''))
+    
+    # Education bonus
+    base_score += EDUCATION_BONUS.get(data.get('education', ''), 0)
+    
+    base_score += age_adjustment(data.get('age', 25))
+    
+    # Habits bonus
+    for habit in data.get('habits', []):
+        base_score += HABIT_BONUSES.get(habit, 0)
+    
+    return base_score
+
+def calculate_success_score(data):
+    """Calculate success score based on various factors"""
+    base_score = rule_based_score(data)
+    
+    # Add some randomness for realism
+    base_score += random.randint(-5, 10)
+    
+    return min(100, max(0, base_score))
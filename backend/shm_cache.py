@@ -0,0 +1,282 @@
+"""
+Host-wide shared-memory cache
+Parallel You: AI-Generated Personalized Reality Simulator
+
+Every worker process on a host maps the same file (in /dev/shm when it
+exists), so an entry cached by one worker is a hit for all of them and is
+stored once. The file is a fixed array of slots organised as a
+set-associative hash table: a key hashes to one set of SHM_CACHE_WAYS slots,
+and when the set is full a clock hand evicts the first slot not referenced
+since the hand last passed it.
+
+Sets are guarded by striped locks that work both across processes (fcntl
+byte-range locks on the file) and across threads (a threading.Lock per
+stripe, since fcntl locks belong to the whole process). Each slot carries a
+CRC of its value, so a slot left half-written by a killed process reads as a
+miss. Hit, miss, store and eviction counters live in the file, which makes
+them per-host rather than per-worker.
+
+Values are pickled and must fit in one slot; larger values are not cached.
+Without fcntl (Windows) the cache is disabled and every lookup misses.
+"""
+
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, Optional
+import logging
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SHM_CACHE_ENABLED = os.getenv('SHM_CACHE_ENABLED', '1') == '1'
+SHM_CACHE_DIR = os.getenv('SHM_CACHE_DIR', '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir())
+SHM_CACHE_NAME = os.getenv('SHM_CACHE_NAME', 'parallel-you-cache')
+SHM_CACHE_SETS = int(os.getenv('SHM_CACHE_SETS', '1024'))
+SHM_CACHE_WAYS = int(os.getenv('SHM_CACHE_WAYS', '8'))
+SHM_CACHE_SLOT_BYTES = int(os.getenv('SHM_CACHE_SLOT_BYTES', '8192'))
+LOCK_STRIPES = 64
+DEFAULT_TTL = 3600
+
+MAGIC = b'PYSHMC01'
+HEADER = struct.Struct('<8sIII')                 # magic, sets, ways, slot bytes
+COUNTERS = struct.Struct('<QQQQ')                # hits, misses, stores, evictions (one per stripe)
+SLOT = struct.Struct('<QdIIHBB')                 # key hash, expires at, value length, crc32, key length, used, referenced
+COUNTERS_OFFSET = 64
+LOCKS_OFFSET = COUNTERS_OFFSET + LOCK_STRIPES * COUNTERS.size
+HEADER_BYTES = 4096
+COUNTER_NAMES = ('hits', 'misses', 'stores', 'evictions')
+
+
+def _hash(key: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+
+class SharedCache:
+    def __init__(self, name: str = SHM_CACHE_NAME, sets: int = SHM_CACHE_SETS, ways: int = SHM_CACHE_WAYS,
+                 slot_bytes: int = SHM_CACHE_SLOT_BYTES):
+        self.sets = sets
+        self.ways = ways
+        self.slot_bytes = slot_bytes
+        # The layout is part of the file name, so workers with different settings never share a file
+        self.path = os.path.join(SHM_CACHE_DIR, f"{name}-{sets}x{ways}x{slot_bytes}.bin")
+        self.hands_offset = HEADER_BYTES
+        self.slots_offset = HEADER_BYTES + -(-sets // HEADER_BYTES) * HEADER_BYTES
+        self.size = self.slots_offset + sets * ways * slot_bytes
+        self._fd = None
+        self._map = None
+        self._disabled = not SHM_CACHE_ENABLED or fcntl is None
+        self._open_lock = threading.Lock()
+        self._stripe_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._oversize = 0
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # The mapping is shared with the parent and stays valid; only thread locks are reset
+        self._open_lock = threading.Lock()
+        self._stripe_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+    def _ensure_open(self) -> bool:
+        if self._map is not None:
+            return True
+        if self._disabled:
+            return False
+        with self._open_lock:
+            if self._map is None and not self._disabled:
+                try:
+                    self._open()
+                except OSError as e:
+                    logger.warning(f"Shared cache unavailable at {self.path}: {e}")
+                    self._disabled = True
+        return self._map is not None
+
+    def _open(self):
+        os.makedirs(SHM_CACHE_DIR, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_size < self.size:
+                os.ftruncate(fd, self.size)
+            if os.pread(fd, HEADER.size, 0)[:len(MAGIC)] != MAGIC:
+                os.pwrite(fd, HEADER.pack(MAGIC, self.sets, self.ways, self.slot_bytes), 0)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        self._map = mmap.mmap(fd, self.size)
+        self._fd = fd
+
+    def _lock(self, stripe: int):
+        self._stripe_locks[stripe].acquire()
+        try:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, LOCKS_OFFSET + stripe)
+        except BaseException:
+            self._stripe_locks[stripe].release()
+            raise
+
+    def _unlock(self, stripe: int):
+        try:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, LOCKS_OFFSET + stripe)
+        finally:
+            self._stripe_locks[stripe].release()
+
+    def _count(self, stripe: int, field: int):
+        offset = COUNTERS_OFFSET + stripe * COUNTERS.size + field * 8
+        (value,) = struct.unpack_from('<Q', self._map, offset)
+        struct.pack_into('<Q', self._map, offset, value + 1)
+
+    def _slot_offset(self, set_index: int, way: int) -> int:
+        return self.slots_offset + (set_index * self.ways + way) * self.slot_bytes
+
+    def _find(self, set_index: int, key_hash: int, key: bytes) -> Optional[int]:
+        for way in range(self.ways):
+            offset = self._slot_offset(set_index, way)
+            slot_hash, _, _, _, key_len, used, _ = SLOT.unpack_from(self._map, offset)
+            if used and slot_hash == key_hash and key_len == len(key):
+                start = offset + SLOT.size
+                if self._map[start:start + key_len] == key:
+                    return way
+        return None
+
+    def get(self, key: str) -> Optional[Any]:
+        """Cached value for key, or None"""
+        if not self._ensure_open():
+            return None
+        raw_key = key.encode()
+        key_hash = _hash(raw_key)
+        set_index = key_hash % self.sets
+        stripe = set_index % LOCK_STRIPES
+        payload = None
+        self._lock(stripe)
+        try:
+            way = self._find(set_index, key_hash, raw_key)
+            if way is not None:
+                offset = self._slot_offset(set_index, way)
+                _, expires_at, value_len, crc, key_len, _, _ = SLOT.unpack_from(self._map, offset)
+                start = offset + SLOT.size + key_len
+                payload = self._map[start:start + value_len]
+                if expires_at < time.time() or zlib.crc32(payload) != crc:
+                    # Expired, or torn by a process that died mid-write: free the slot
+                    self._map[offset + SLOT.size - 2] = 0
+                    payload = None
+                else:
+                    self._map[offset + SLOT.size - 1] = 1
+            self._count(stripe, 0 if payload is not None else 1)
+        finally:
+            self._unlock(stripe)
+        if payload is None:
+            return None
+        try:
+            return pickle.loads(payload)
+        except Exception:
+            return None
+
+    def set(self, key: str, value: Any, ttl: float = DEFAULT_TTL) -> bool:
+        """Store value for ttl seconds; False if it does not fit in a slot or the cache is off"""
+        if not self._ensure_open():
+            return False
+        raw_key = key.encode()
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if SLOT.size + len(raw_key) + len(payload) > self.slot_bytes or len(raw_key) > 0xFFFF:
+            self._oversize += 1
+            return False
+        key_hash = _hash(raw_key)
+        set_index = key_hash % self.sets
+        stripe = set_index % LOCK_STRIPES
+        self._lock(stripe)
+        try:
+            way = self._find(set_index, key_hash, raw_key)
+            if way is None:
+                way = self._victim(set_index, stripe)
+            offset = self._slot_offset(set_index, way)
+            # Mark the slot unused while it is rewritten
+            self._map[offset + SLOT.size - 2] = 0
+            start = offset + SLOT.size
+            self._map[start:start + len(raw_key)] = raw_key
+            self._map[start + len(raw_key):start + len(raw_key) + len(payload)] = payload
+            SLOT.pack_into(self._map, offset, key_hash, time.time() + ttl, len(payload), zlib.crc32(payload),
+                           len(raw_key), 1, 1)
+            self._count(stripe, 2)
+        finally:
+            self._unlock(stripe)
+        return True
+
+    def _victim(self, set_index: int, stripe: int) -> int:
+        """A free or expired slot in the set, else the clock hand's choice"""
+        now = time.time()
+        for way in range(self.ways):
+            _, expires_at, _, _, _, used, _ = SLOT.unpack_from(self._map, self._slot_offset(set_index, way))
+            if not used or expires_at < now:
+                return way
+        hand_offset = self.hands_offset + set_index
+        hand = self._map[hand_offset] % self.ways
+        while True:
+            referenced_at = self._slot_offset(set_index, hand) + SLOT.size - 1
+            if not self._map[referenced_at]:
+                break
+            self._map[referenced_at] = 0
+            hand = (hand + 1) % self.ways
+        self._map[hand_offset] = (hand + 1) % self.ways
+        self._count(stripe, 3)
+        return hand
+
+    def delete(self, key: str):
+        if not self._ensure_open():
+            return
+        raw_key = key.encode()
+        key_hash = _hash(raw_key)
+        set_index = key_hash % self.sets
+        stripe = set_index % LOCK_STRIPES
+        self._lock(stripe)
+        try:
+            way = self._find(set_index, key_hash, raw_key)
+            if way is not None:
+                self._map[self._slot_offset(set_index, way) + SLOT.size - 2] = 0
+        finally:
+            self._unlock(stripe)
+
+    def get_or_set(self, key: str, compute: Callable[[], Any], ttl: float = DEFAULT_TTL) -> Any:
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            if value is not None:
+                self.set(key, value, ttl)
+        return value
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Host-wide counters (all workers), plus slot occupancy"""
+        if not self._ensure_open():
+            return {'enabled': False}
+        totals = [0, 0, 0, 0]
+        for stripe in range(LOCK_STRIPES):
+            for i, value in enumerate(COUNTERS.unpack_from(self._map, COUNTERS_OFFSET + stripe * COUNTERS.size)):
+                totals[i] += value
+        stats = dict(zip(COUNTER_NAMES, totals))
+        now = time.time()
+        used = 0
+        for index in range(self.sets * self.ways):
+            _, expires_at, _, _, _, in_use, _ = SLOT.unpack_from(self._map, self.slots_offset + index * self.slot_bytes)
+            used += bool(in_use) and expires_at >= now
+        lookups = stats['hits'] + stats['misses']
+        stats.update({
+            'enabled': True,
+            'path': self.path,
+            'hit_rate': round(stats['hits'] / lookups, 4) if lookups else 0.0,
+            'slots': self.sets * self.ways,
+            'slots_used': used,
+            'slot_bytes': self.slot_bytes,
+            'oversize_skipped': self._oversize
+        })
+        return stats
+
+
+# Global cache, shared by every worker process on this host
+shared_cache = SharedCache()
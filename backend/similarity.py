@@ -0,0 +1,273 @@
+"""
+"People like you" nearest-neighbour search
+Parallel You: AI-Generated Personalized Reality Simulator
+
+Simulation inputs are featurized with the success model's featurizer into
+fixed-length vectors and indexed in a scikit-learn BallTree. New simulations
+saved by this worker go into a small delta buffer that is searched by brute
+force alongside the tree and folded in when the tree is rebuilt. A leased job
+rebuilds the full index from Mongo and snapshots it to disk; workers load the
+newest snapshot at startup and when it changes, instead of rebuilding.
+
+    python backend/similarity.py build
+"""
+
+import json
+import os
+import pickle
+import sys
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional
+import logging
+
+import numpy as np
+
+from success_model import featurize, featurize_many, FEATURE_VERSION
+from jobs import PeriodicJob, run_exclusive
+
+logger = logging.getLogger(__name__)
+
+JOB_NAME = 'similarity_snapshot'
+SIMILARITY_DIR = os.path.abspath(os.getenv('SIMILARITY_DIR', os.path.join(os.path.dirname(__file__), 'similarity_store')))
+SNAPSHOT_PATH = os.path.join(SIMILARITY_DIR, 'index.pkl')
+SNAPSHOT_INTERVAL = float(os.getenv('SIMILARITY_SNAPSHOT_INTERVAL_SECONDS', '900'))
+RELOAD_INTERVAL = float(os.getenv('SIMILARITY_RELOAD_INTERVAL_SECONDS', '60'))
+# Fold the delta buffer into a new tree once it holds this many vectors
+DELTA_REBUILD_SIZE = int(os.getenv('SIMILARITY_DELTA_REBUILD_SIZE', '5000'))
+LEAF_SIZE = 40
+MAX_K = 50
+DEFAULT_K = 10
+
+
+class IndexState(NamedTuple):
+    tree: Any
+    vectors: np.ndarray
+    simulation_ids: np.ndarray
+    user_ids: np.ndarray
+    scores: np.ndarray
+    profiles: List[Dict[str, Any]]
+    built_at: float
+
+
+def _build_tree(vectors: np.ndarray):
+    from sklearn.neighbors import BallTree
+
+    return BallTree(vectors, leaf_size=LEAF_SIZE) if len(vectors) else None
+
+
+def _public_profile(input_data: Dict[str, Any]) -> Dict[str, Any]:
+    """What a neighbour's card may show; nothing that identifies them"""
+    try:
+        age = int(input_data.get('age', 0))
+        age_band = f"{age // 5 * 5}-{age // 5 * 5 + 4}" if age else None
+    except (TypeError, ValueError):
+        age_band = None
+    return {
+        'career': input_data.get('dreamCareer'),
+        'education': input_data.get('education'),
+        'age_band': age_band,
+        'habits': list(input_data.get('habits') or [])
+    }
+
+
+def _empty_state() -> IndexState:
+    return IndexState(None, np.zeros((0, len(featurize({}))), np.float32), np.array([], dtype=object),
+                      np.array([], dtype=object), np.array([], dtype=np.float32), [], time.time())
+
+
+def build_state(rows: List[Dict[str, Any]], read_started: float) -> IndexState:
+    vectors = featurize_many([row.get('input_data') or {} for row in rows])
+    return IndexState(
+        _build_tree(vectors), vectors,
+        np.array([row.get('simulation_id') for row in rows], dtype=object),
+        np.array([row.get('user_id') for row in rows], dtype=object),
+        np.array([row.get('confidence_score', 0) for row in rows], dtype=np.float32),
+        [_public_profile(row.get('input_data') or {}) for row in rows],
+        read_started
+    )
+
+
+class SimilarityIndex:
+    def __init__(self):
+        self._state = _empty_state()
+        self._lock = threading.Lock()
+        self._delta: List[Dict[str, Any]] = []
+        self._snapshot_mtime = None
+        self._rebuilding = False
+        self._stats = {'queries': 0, 'added': 0, 'rebuilds': 0, 'snapshot_loads': 0, 'query_ms_total': 0.0}
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._rebuilding = False
+
+    def add(self, simulation_id: str, user_id: str, input_data: Dict[str, Any], score: float):
+        """Make a just-saved simulation searchable in this worker"""
+        row = {'simulation_id': simulation_id, 'user_id': user_id, 'input_data': input_data,
+               'confidence_score': score, 'vector': featurize(input_data), 'added_at': time.time()}
+        with self._lock:
+            self._delta.append(row)
+            self._stats['added'] += 1
+            rebuild = len(self._delta) >= DELTA_REBUILD_SIZE and not self._rebuilding
+            if rebuild:
+                self._rebuilding = True
+        if rebuild:
+            threading.Thread(target=self._fold_delta, name='similarity-rebuild', daemon=True).start()
+
+    def _fold_delta(self):
+        try:
+            with self._lock:
+                state, delta = self._state, list(self._delta)
+            vectors = np.vstack([state.vectors] + [row['vector'][None, :] for row in delta])
+            folded = IndexState(
+                _build_tree(vectors), vectors,
+                np.concatenate([state.simulation_ids, np.array([r['simulation_id'] for r in delta], dtype=object)]),
+                np.concatenate([state.user_ids, np.array([r['user_id'] for r in delta], dtype=object)]),
+                np.concatenate([state.scores, np.array([r['confidence_score'] for r in delta], dtype=np.float32)]),
+                state.profiles + [_public_profile(r['input_data']) for r in delta],
+                state.built_at
+            )
+            with self._lock:
+                # A snapshot loaded meanwhile supersedes this fold
+                if self._state is state:
+                    self._state = folded
+                    self._delta = self._delta[len(delta):]
+                    self._stats['rebuilds'] += 1
+        finally:
+            self._rebuilding = False
+
+    def query(self, profile: Dict[str, Any], k: int = DEFAULT_K, exclude_user: Optional[str] = None) -> Dict[str, Any]:
+        """k most similar stored simulations (excluding the caller's own) and their outcomes"""
+        start = time.perf_counter()
+        k = max(1, min(int(k), MAX_K))
+        vector = featurize(profile)
+        with self._lock:
+            state, delta = self._state, list(self._delta)
+
+        delta_distances = delta_order = None
+        if delta:
+            delta_distances = np.linalg.norm(np.stack([row['vector'] for row in delta]) - vector, axis=1)
+            delta_order = np.argsort(delta_distances)
+
+        # Over-fetch so that dropping the caller's own simulations still leaves k, and keep
+        # doubling while they crowd out everyone else and there are rows left to look at
+        size = len(state.vectors) if state.tree is not None else 0
+        fetch = k + 10 if exclude_user else k
+        while True:
+            candidates = []
+            if size:
+                distances, indices = state.tree.query(vector[None, :], k=min(fetch, size))
+                for distance, index in zip(distances[0], indices[0]):
+                    candidates.append((float(distance), state.user_ids[index], state.simulation_ids[index],
+                                       float(state.scores[index]), state.profiles[index]))
+            if delta:
+                for i in delta_order[:fetch]:
+                    row = delta[i]
+                    candidates.append((float(delta_distances[i]), row['user_id'], row['simulation_id'],
+                                       float(row['confidence_score']), _public_profile(row['input_data'])))
+
+            candidates.sort(key=lambda c: c[0])
+            neighbours = []
+            seen = set()
+            for distance, user_id, simulation_id, score, public in candidates:
+                if (exclude_user and user_id == exclude_user) or simulation_id in seen:
+                    continue
+                seen.add(simulation_id)
+                neighbours.append({**public, 'score': int(score), 'distance': round(distance, 4),
+                                   'similarity': round(1 / (1 + distance), 4)})
+                if len(neighbours) >= k:
+                    break
+            if len(neighbours) >= k or fetch >= max(size, len(delta)):
+                break
+            fetch *= 2
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._stats['queries'] += 1
+            self._stats['query_ms_total'] += elapsed_ms
+        scores = [n['score'] for n in neighbours]
+        return {
+            'neighbours': neighbours,
+            'summary': {
+                'count': len(neighbours),
+                'avg_score': round(float(np.mean(scores)), 1) if scores else None,
+                'min_score': min(scores) if scores else None,
+                'max_score': max(scores) if scores else None
+            },
+            'index_size': len(state.vectors) + len(delta),
+            'query_ms': round(elapsed_ms, 2)
+        }
+
+    def load_snapshot(self) -> bool:
+        """Swap in the on-disk snapshot if it is newer than the one loaded"""
+        try:
+            mtime = os.path.getmtime(SNAPSHOT_PATH)
+        except OSError:
+            return False
+        if mtime == self._snapshot_mtime:
+            return False
+        with open(SNAPSHOT_PATH, 'rb') as handle:
+            snapshot = pickle.load(handle)
+        if snapshot.get('feature_version') != FEATURE_VERSION:
+            logger.warning("Similarity snapshot uses an old feature layout; ignoring it")
+            self._snapshot_mtime = mtime
+            return False
+        state = snapshot['state']
+        with self._lock:
+            # Simulations saved before the snapshot's read began are already in it
+            self._delta = [row for row in self._delta if row['added_at'] >= state.built_at]
+            self._state = state
+            self._stats['snapshot_loads'] += 1
+        self._snapshot_mtime = mtime
+        logger.info(f"Similarity index loaded: {len(state.vectors)} vectors")
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {**self._stats, 'indexed': len(self._state.vectors), 'delta': len(self._delta)}
+        stats['avg_query_ms'] = round(stats.pop('query_ms_total') / stats['queries'], 3) if stats['queries'] else 0
+        return stats
+
+
+def write_snapshot(state: IndexState):
+    os.makedirs(SIMILARITY_DIR, exist_ok=True)
+    tmp = f"{SNAPSHOT_PATH}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as handle:
+        pickle.dump({'feature_version': FEATURE_VERSION, 'state': state}, handle, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, SNAPSHOT_PATH)
+
+
+def _rebuild_locked() -> Dict[str, Any]:
+    from database import get_simulations_collection
+
+    simulations = get_simulations_collection()
+    if simulations is None:
+        return {'error': 'Database not connected'}
+    start = time.perf_counter()
+    read_started = time.time()
+    rows = list(simulations.find(
+        {}, {'_id': 0, 'simulation_id': 1, 'user_id': 1, 'confidence_score': 1, 'input_data.dreamCareer': 1,
+             'input_data.education': 1, 'input_data.age': 1, 'input_data.habits': 1}
+    ).sort('timestamp', 1).batch_size(5000))
+    state = build_state(rows, read_started)
+    write_snapshot(state)
+    return {'indexed': len(rows), 'seconds': round(time.perf_counter() - start, 2)}
+
+
+def rebuild_snapshot() -> Optional[Dict[str, Any]]:
+    """Rebuild the full index from Mongo and write the snapshot; None if another worker holds the lease"""
+    return run_exclusive(JOB_NAME, _rebuild_locked, lease_seconds=1800)
+
+
+# Global index (per worker process)
+similarity_index = SimilarityIndex()
+snapshot_job = PeriodicJob(JOB_NAME, rebuild_snapshot, SNAPSHOT_INTERVAL)
+snapshot_reload_job = PeriodicJob('similarity_reload', similarity_index.load_snapshot, RELOAD_INTERVAL)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'build':
+        print(json.dumps(rebuild_snapshot(), indent=2))
+    else:
+        print("usage: python backend/similarity.py build")
@@ -0,0 +1,277 @@
+"""
+Text content generated for each simulation
+Parallel You: AI-Generated Personalized Reality Simulator
+
+Everything here is a pure function of the simulation inputs and the score
+(apart from the generated avatar id), which is what lets stored simulations keep
+only the score and rebuild the text on read.
+"""
+
+from bisect import bisect_right
+
+from ids import new_id
+
+
+# Bump when any template below changes wording
+TEMPLATE_VERSION = 1
+
+# The AR/VR and multimedia lists depend only on which keyword branch the career
+# falls in, and those lists plus the insights only on which of these score bands
+# the score is in. Each family maps to a career that selects its branches.
+CAREER_FAMILIES = {
+    'tech': 'engineer',
+    'medical': 'doctor',
+    'medical-creative': 'medical designer',
+    'medical-business': 'medical entrepreneur',
+    'creative': 'artist',
+    'business': 'entrepreneur',
+    'general': ''
+}
+TIER_BOUNDS = (55, 60, 70, 80, 85)
+CAREER_TIER_SECTIONS = ('ar_vr_suggestions', 'multimedia_suggestions', 'insights')
+
+def career_family(dream_career):
+    """Which branches of generate_ar_vr_content / generate_multimedia_suggestions a career takes"""
+    career = (dream_career or '').lower()
+    if 'engineer' in career or 'developer' in career:
+        return 'tech'
+    if 'doctor' in career or 'medical' in career:
+        if 'artist' in career or 'designer' in career:
+            return 'medical-creative'
+        if 'entrepreneur' in career:
+            return 'medical-business'
+        return 'medical'
+    if 'artist' in career or 'designer' in career:
+        return 'creative'
+    if 'entrepreneur' in career:
+        return 'business'
+    return 'general'
+
+def score_tier(score):
+    """Score band (0 = below the lowest bound)"""
+    return bisect_right(TIER_BOUNDS, score)
+
+def tier_scores(tier):
+    """Lowest and highest score in a band"""
+    low = TIER_BOUNDS[tier - 1] if tier else 0
+    high = TIER_BOUNDS[tier] - 1 if tier < len(TIER_BOUNDS) else 100
+    return low, high
+
+def career_tier_content(dream_career, score):
+    """The sections of a result that depend only on (career family, score tier)"""
+    data = {'dreamCareer': dream_career}
+    return {
+        'ar_vr_suggestions': generate_ar_vr_content(data, score),
+        'multimedia_suggestions': generate_multimedia_suggestions(data, score),
+        'insights': generate_insights(score)
+    }
+
+def generate_personalized_message(data, score):
+    """Generate personalized message based on user data"""
+    name = data.get('name', 'User')
+    age = data.get('age', '25')
+    dream_career = data.get('dreamCareer', 'your chosen field')
+    education = data.get('education', '')
+    habits = data.get('habits', [])
+    
+    # Base message
+    if score >= 90:
+        message = f"🌟 Excellent! {name}, your path to becoming a {dream_career} looks incredibly promising!"
+    elif score >= 80:
+        message = f"🚀 Great potential! {name}, you have strong prospects in {dream_career}."
+    elif score >= 70:
+        message = f"💪 Good foundation! {name}, with some focused effort, {dream_career} is definitely achievable."
+    elif score >= 60:
+        message = f"📈 Room for growth! {name}, {dream_career} is possible with dedication and planning."
+    else:
+        message = f"🎯 Consider alternatives! {name}, you might want to explore related fields or build more experience first."
+    
+    # Add age-specific advice
+    if int(age) < 25:
+        message += " Your youth gives you time to build the perfect foundation!"
+    elif int(age) < 35:
+        message += " You're at a great age to make this career transition!"
+    else:
+        message += " Your experience is valuable - leverage it strategically!"
+    
+    return message
+
+
+def generate_recommendations(data, score):
+    """Generate actionable recommendations"""
+    recommendations = []
+    dream_career = data.get('dreamCareer', '').lower()
+    education = data.get('education', '')
+    habits = data.get('habits', [])
+    
+    # Education recommendations
+    if education in ['high-school', 'associate'] and 'bachelor' not in dream_career:
+        recommendations.append("Consider pursuing higher education or specialized certifications")
+    
+    # Skill development
+    if 'Learn new skills' not in habits:
+        recommendations.append("Start learning new skills relevant to your target career")
+    
+    # Networking
+    if 'Network actively' not in habits:
+        recommendations.append("Build your professional network in your target industry")
+    
+    # Experience building
+    if not data.get('currentCareer'):
+        recommendations.append("Gain relevant work experience through internships or projects")
+    
+    # Financial planning
+    if 'Save money' not in habits:
+        recommendations.append("Build a financial safety net for career transition")
+    
+    # Health and wellness
+    if 'Exercise regularly' not in habits:
+        recommendations.append("Maintain physical and mental health for peak performance")
+    
+    # Career-specific advice
+    if 'entrepreneur' in dream_career:
+        recommendations.append("Start with a side project to test your business ideas")
+    elif 'artist' in dream_career or 'writer' in dream_career:
+        recommendations.append("Build a portfolio and online presence to showcase your work")
+    elif 'doctor' in dream_career or 'lawyer' in dream_career:
+        recommendations.append("Research specific requirements and prerequisites for your field")
+    
+    return recommendations[:5]  # Limit to 5 recommendations
+
+
+def generate_ar_vr_content(data, score):
+    """Generate AR/VR content suggestions"""
+    dream_career = data.get('dreamCareer', '').lower()
+    suggestions = []
+
+    # AR/VR career-specific content
+    if 'engineer' in dream_career or 'developer' in dream_career:
+        suggestions.extend([
+            "🥽 Use AR to visualize code architecture in 3D space",
+            "🎮 Practice coding in VR environments like CodeCombat VR",
+            "📱 Try AR apps to see how your software would look in real world",
+            "🎯 Use VR to simulate debugging complex systems"
+        ])
+    elif 'doctor' in dream_career or 'medical' in dream_career:
+        suggestions.extend([
+            "🩺 Practice surgery in VR medical simulators",
+            "🧠 Use AR to study human anatomy in 3D",
+            "💊 Visualize drug interactions in VR molecular models",
+            "🏥 Experience hospital workflows in VR training"
+        ])
+    elif 'artist' in dream_career or 'designer' in dream_career:
+        suggestions.extend([
+            "🎨 Create 3D art in VR using Tilt Brush or Gravity Sketch",
+            "🏗️ Design buildings in AR using Magic Leap or HoloLens",
+            "🎭 Experience your art installations in VR before building",
+            "📐 Use AR to visualize designs in real-world spaces"
+        ])
+    elif 'entrepreneur' in dream_career:
+        suggestions.extend([
+            "🏢 Present your business ideas in VR boardrooms",
+            "📊 Visualize market data in 3D AR dashboards",
+            "🌍 Explore global markets in VR environments",
+            "🤝 Practice investor pitches in AR meeting rooms"
+        ])
+    
+    # General AR/VR suggestions
+    suggestions.extend([
+        "🌍 Explore your future workplace in VR",
+        "👥 Practice networking in virtual conferences",
+        "📚 Learn new skills in immersive VR classrooms",
+        "🏠 Visualize your future home in AR"
+    ])
+    
+    return suggestions[:6]
+
+
+def generate_3d_avatar_data(data, avatar_id=None):
+    """Generate 3D avatar data for AR/VR"""
+    return {
+        "avatar_id": avatar_id or new_id('avatar'),
+        "personality_traits": {
+            "confidence": min(100, data.get('score', 50) + 20),
+            "creativity": 75 if 'artist' in data.get('dreamCareer', '').lower() else 60,
+            "analytical": 85 if 'engineer' in data.get('dreamCareer', '').lower() else 70,
+            "social": 80 if 'Network actively' in data.get('habits', []) else 60
+        },
+        "appearance": {
+            "style": "professional" if data.get('education') in ['master', 'phd'] else "casual",
+            "age_group": "young_adult" if int(data.get('age', 25)) < 30 else "adult"
+        },
+        "voice_settings": {
+            "pitch": "medium",
+            "speed": "normal",
+            "accent": "neutral"
+        }
+    }
+
+
+def generate_ai_journal_entry(data, score):
+    """Generate AI-powered journal entry for the simulation"""
+    name = data.get('name', 'User')
+    dream_career = data.get('dreamCareer', 'your chosen field')
+    age = data.get('age', '25')
+    
+    journal_entries = {
+        'high': f"Dear {name},\n\nToday I explored the path to becoming a {dream_career}. The simulation shows incredible potential - a {score}% success rate! At {age}, you're perfectly positioned to make this transition. The data suggests that your current habits and education are strong foundations for this career change.\n\nI can already envision you thriving in this new role, making meaningful contributions and finding deep satisfaction in your work. The journey ahead looks promising, and I'm excited to see how this unfolds in reality.\n\nKeep pushing forward - the future you is counting on it!\n\n- Your Digital Twin",
+        
+        'medium': f"Dear {name},\n\nI've been analyzing your potential path to {dream_career}, and the results are encouraging with a {score}% success rate. While there are some challenges ahead, your determination and the right preparation can definitely make this happen.\n\nAt {age}, you have valuable experience to build upon. The simulation suggests focusing on skill development and networking will be key to your success. I believe in your ability to overcome any obstacles and create the future you envision.\n\nRemember, every expert was once a beginner. Your digital twin is here to support you every step of the way.\n\n- Your Digital Twin",
+        
+        'low': f"Dear {name},\n\nThe simulation for becoming a {dream_career} shows a {score}% success rate, which means this path will require significant effort and strategic planning. But don't let this discourage you - some of the most rewarding journeys are the most challenging ones.\n\nAt {age}, you have time to build the necessary skills and experience. Consider this an opportunity to grow and develop in ways you never imagined. The simulation suggests focusing on education, gaining relevant experience, and building a strong network.\n\nYour digital twin believes in your potential to achieve anything you set your mind to. Let's create a plan together!\n\n- Your Digital Twin"
+    }
+    
+    if score >= 80:
+        return journal_entries['high']
+    elif score >= 60:
+        return journal_entries['medium']
+    else:
+        return journal_entries['low']
+
+
+def generate_multimedia_suggestions(data, score):
+    """Generate multimedia content suggestions"""
+    dream_career = data.get('dreamCareer', '').lower()
+    suggestions = []
+
+    # Career-specific multimedia suggestions
+    if 'engineer' in dream_career or 'developer' in dream_career:
+        suggestions.extend([
+            "📱 Create a coding portfolio website",
+            "🎥 Record coding tutorials on YouTube",
+            "📸 Document your coding journey on Instagram",
+            "🎵 Listen to coding-focused podcasts during commutes"
+        ])
+    elif 'artist' in dream_career or 'designer' in dream_career:
+        suggestions.extend([
+            "🎨 Build an online art portfolio",
+            "📹 Create time-lapse videos of your creative process",
+            "📱 Share daily sketches on social media",
+            "🎵 Create playlists that inspire your creativity"
+        ])
+    elif 'entrepreneur' in dream_career:
+        suggestions.extend([
+            "📹 Start a business vlog documenting your journey",
+            "🎙️ Record podcast interviews with successful entrepreneurs",
+            "📸 Create visual business plans and pitch decks",
+            "🎵 Listen to business and startup podcasts"
+        ])
+    
+    # General suggestions based on score
+    if score >= 80:
+        suggestions.extend([
+            "🎉 Create a vision board with your career goals",
+            "📹 Record a 'future self' video message",
+            "📸 Take professional headshots for your new career"
+        ])
+    
+    return suggestions[:6]  # Return top 6 suggestions
+
+def generate_insights(score):
+    """Insight tiers derived from the score"""
+    return {
+        'career_growth_potential': 'High' if score >= 80 else 'Medium' if score >= 60 else 'Needs Development',
+        'time_to_success': '2-3 years' if score >= 80 else '3-5 years' if score >= 60 else '5+ years',
+        'risk_level': 'Low' if score >= 80 else 'Medium' if score >= 60 else 'High',
+        'confidence_level': 'Very High' if score >= 85 else 'High' if score >= 70 else 'Medium' if score >= 55 else 'Low'
+    }
@@ -0,0 +1,196 @@
+"""
+Columnar simulation export for offline analytics
+Parallel You: AI-Generated Personalized Reality Simulator
+
+Streams `simulations` through a projected, batched cursor, flattens the
+fields analysts use into typed columns and writes zstd-compressed Parquet
+files of at most EXPORT_CHUNK_ROWS rows, partitioned by day:
+
+    <EXPORT_DIR>/simulations/date=2024-05-01/part-<run>-00000.parquet
+
+Each run continues from the (timestamp, _id) watermark of the last file
+written, so incremental runs only export new simulations. Load with
+`pandas.read_parquet('<EXPORT_DIR>/simulations')`.
+
+    python backend/simulation_export.py [--full [--include-archive]]
+
+--full ignores the watermark and re-exports everything; point EXPORT_DIR at an
+empty directory when using it. --include-archive also exports simulations that
+archive.py has moved out of the hot collection.
+"""
+
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+import logging
+
+from database import get_simulations_collection
+from jobs import PeriodicJob, get_job_state, update_job_state, run_exclusive
+
+logger = logging.getLogger(__name__)
+
+JOB_NAME = 'simulation_export'
+EXPORT_DIR = os.path.abspath(os.getenv('EXPORT_DIR', os.path.join(os.path.dirname(__file__), 'exports')))
+EXPORT_CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', '50000'))
+# 0 disables the in-process schedule; the CLI can be run from cron instead
+EXPORT_INTERVAL = float(os.getenv('SIMULATION_EXPORT_INTERVAL_SECONDS', '0'))
+EXPORT_LAG = timedelta(seconds=int(os.getenv('EXPORT_LAG_SECONDS', '60')))
+
+PROJECTION = {
+    'simulation_id': 1, 'user_id': 1, 'timestamp': 1, 'confidence_score': 1, 'result.score': 1,
+    'input_data.dreamCareer': 1, 'input_data.education': 1, 'input_data.age': 1, 'input_data.habits': 1
+}
+INT32_MAX = 2 ** 31 - 1
+COLUMNS = ('simulation_id', 'user_id', 'career', 'education', 'age', 'habits', 'habit_count', 'score', 'timestamp')
+
+
+def _schema():
+    import pyarrow as pa
+
+    # Parquet stores every integer narrower than 32 bits as INT32 anyway, so narrower Arrow
+    # types save nothing on disk and only make out-of-range user input fail the whole chunk
+    return pa.schema([
+        ('simulation_id', pa.string()),
+        ('user_id', pa.string()),
+        ('career', pa.dictionary(pa.int32(), pa.string())),
+        ('education', pa.dictionary(pa.int32(), pa.string())),
+        ('age', pa.int32()),
+        ('habits', pa.list_(pa.string())),
+        ('habit_count', pa.int32()),
+        ('score', pa.int32()),
+        ('timestamp', pa.timestamp('ms'))
+    ])
+
+
+def flatten(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """One simulation document as a flat row of typed values"""
+    input_data = doc.get('input_data') or {}
+    try:
+        age = int(input_data.get('age'))
+    except (TypeError, ValueError, OverflowError):
+        age = None
+    if age is not None and not 0 <= age <= INT32_MAX:
+        age = None
+    habits = [str(h) for h in (input_data.get('habits') or [])]
+    score = doc.get('confidence_score', (doc.get('result') or {}).get('score'))
+    try:
+        score = int(score) if score is not None else None
+    except (TypeError, ValueError, OverflowError):
+        score = None
+    if score is not None and abs(score) > INT32_MAX:
+        score = None
+    return {
+        'simulation_id': doc.get('simulation_id'),
+        'user_id': doc.get('user_id'),
+        'career': str(input_data.get('dreamCareer') or 'unknown').strip().lower(),
+        'education': str(input_data.get('education') or 'unknown'),
+        'age': age,
+        'habits': habits,
+        'habit_count': len(habits),
+        'score': score,
+        'timestamp': doc['timestamp']
+    }
+
+
+class PartitionWriter:
+    """Buffers rows column-wise and writes one Parquet file per full chunk or day change"""
+
+    def __init__(self, run_id: str, chunk_rows: int = EXPORT_CHUNK_ROWS):
+        self.run_id = run_id
+        self.chunk_rows = chunk_rows
+        self.day: Optional[str] = None
+        self.columns: Dict[str, List[Any]] = {name: [] for name in COLUMNS}
+        self.files: List[str] = []
+        self.rows = 0
+        self._part = 0
+
+    def add(self, row: Dict[str, Any]) -> Optional[str]:
+        """Append a row; returns the path of a file if one was written first"""
+        day = row['timestamp'].strftime('%Y-%m-%d')
+        written = None
+        if self.day is not None and (day != self.day or len(self.columns['timestamp']) >= self.chunk_rows):
+            written = self.flush()
+        self.day = day
+        for name in COLUMNS:
+            self.columns[name].append(row[name])
+        return written
+
+    def flush(self) -> Optional[str]:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        count = len(self.columns['timestamp'])
+        if not count:
+            return None
+        partition = os.path.join(EXPORT_DIR, 'simulations', f"date={self.day}")
+        os.makedirs(partition, exist_ok=True)
+        path = os.path.join(partition, f"part-{self.run_id}-{self._part:05d}.parquet")
+        table = pa.Table.from_pydict(self.columns, schema=_schema())
+        tmp = f"{path}.tmp"
+        pq.write_table(table, tmp, compression='zstd')
+        os.replace(tmp, path)
+
+        self._part += 1
+        self.rows += count
+        self.files.append(path)
+        self.columns = {name: [] for name in COLUMNS}
+        return path
+
+
+def _export_locked(full: bool = False, now: datetime = None, include_archive: bool = False) -> Dict[str, Any]:
+    simulations = get_simulations_collection()
+    if simulations is None:
+        return {'error': 'Database not connected'}
+
+    state = {} if full else get_job_state(JOB_NAME)
+    since = state.get('watermark', datetime.min)
+    since_id = state.get('watermark_id')
+    until = (now or datetime.now()) - EXPORT_LAG
+
+    query = {'timestamp': {'$gt': since, '$lte': until}}
+    if since_id is not None:
+        # Rows sharing the watermark timestamp but not yet exported
+        query = {'$or': [query, {'timestamp': since, '_id': {'$gt': since_id}}]}
+
+    writer = PartitionWriter(datetime.now().strftime('%Y%m%d%H%M%S') + uuid.uuid4().hex[:4])
+    cursor = simulations.find(query, PROJECTION).sort([('timestamp', 1), ('_id', 1)]).batch_size(
+        min(EXPORT_CHUNK_ROWS, 5000)
+    )
+    last = None
+    skipped = 0
+    if full and include_archive:
+        from archive import iter_archived_simulations
+
+        # Archived simulations are older than everything still in the hot collection
+        for doc in iter_archived_simulations(until):
+            if isinstance(doc.get('timestamp'), datetime) and doc['timestamp'] <= until:
+                writer.add(flatten(doc))
+    for doc in cursor:
+        if not isinstance(doc.get('timestamp'), datetime):
+            skipped += 1
+            continue
+        if writer.add(flatten(doc)) and last is not None:
+            # The previous file is durable; advance the watermark to its last row
+            update_job_state(JOB_NAME, {'watermark': last[0], 'watermark_id': last[1]})
+        last = (doc['timestamp'], doc['_id'])
+    if writer.flush() and last is not None:
+        update_job_state(JOB_NAME, {'watermark': last[0], 'watermark_id': last[1]})
+    update_job_state(JOB_NAME, {'last_run': datetime.now(), 'last_rows': writer.rows})
+
+    logger.info(f"Exported {writer.rows} simulations to {len(writer.files)} files")
+    return {'rows': writer.rows, 'files': writer.files, 'skipped': skipped,
+            'watermark': last[0].isoformat() if last else (since.isoformat() if since != datetime.min else None)}
+
+
+def run_export(full: bool = False, include_archive: bool = False) -> Optional[Dict[str, Any]]:
+    """Export new simulations; None if another worker holds the job lease"""
+    return run_exclusive(JOB_NAME, lambda: _export_locked(full, include_archive=include_archive), lease_seconds=3600)
+
+
+export_job = PeriodicJob(JOB_NAME, run_export, EXPORT_INTERVAL)
+
+
+if __name__ == "__main__":
+    print(run_export(full='--full' in sys.argv, include_archive='--include-archive' in sys.argv))
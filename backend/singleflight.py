@@ -0,0 +1,85 @@
+"""
+Single-flight request coalescing
+Parallel You: AI-Generated Personalized Reality Simulator
+
+Concurrent callers asking for the same key share one in-flight call instead
+of each firing their own remote request.
+"""
+
+import re
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class SingleFlightTimeout(Exception):
+    """Raised when a waiter gives up on an in-flight call"""
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._stats = {'calls': 0, 'executed': 0, 'coalesced': 0, 'timeouts': 0}
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        """Run fn once per key; returns (result, shared) where shared is True for waiters"""
+        with self._lock:
+            self._stats['calls'] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self._stats['executed'] += 1
+            else:
+                call.waiters += 1
+                self._stats['coalesced'] += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.event.set()
+            if call.error is not None:
+                raise call.error
+            return call.result, False
+
+        if not call.event.wait(timeout):
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise SingleFlightTimeout(f"{self.name}: timed out waiting for in-flight call")
+        if call.error is not None:
+            raise call.error
+        return call.result, True
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._calls)
+        stats['coalesce_rate'] = round(stats['coalesced'] / stats['calls'], 4) if stats['calls'] else 0.0
+        return stats
+
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Case- and whitespace-insensitive form of a prompt for use as a coalescing key"""
+    return _WHITESPACE.sub(' ', (prompt or '').strip().lower())
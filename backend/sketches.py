@@ -0,0 +1,312 @@
+"""
+Mergeable probabilistic sketches for dashboard analytics
+Parallel You: AI-Generated Personalized Reality Simulator
+
+HyperLogLog answers "how many distinct users" and t-digest answers score
+percentiles without touching the simulations collection. Every worker keeps
+its own sketches in memory; a periodic job merges them into the `sketches`
+collection and pulls back the combined view.
+"""
+
+import hashlib
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+from bson.binary import Binary
+
+from database import get_sketches_collection
+from jobs import PeriodicJob
+
+logger = logging.getLogger(__name__)
+
+SKETCH_PERSIST_INTERVAL = float(os.getenv('SKETCH_PERSIST_INTERVAL_SECONDS', '60'))
+MAX_KEYS_PER_DIMENSION = int(os.getenv('SKETCH_MAX_KEYS_PER_DIMENSION', '500'))
+MAX_PERSIST_RETRIES = 5
+# Dashboard reads reuse the computed summary for this long
+SUMMARY_MAX_AGE = float(os.getenv('SKETCH_SUMMARY_MAX_AGE_SECONDS', '5'))
+
+
+class HyperLogLog:
+    """HyperLogLog with 2^p one-byte registers; merge is register-wise max"""
+
+    def __init__(self, p: int = 12, registers: Optional[bytes] = None):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(registers) if registers else bytearray(self.m)
+        self._alpha = 0.7213 / (1 + 1.079 / self.m)
+        self._estimate = None
+
+    def add(self, value: str):
+        h = int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+        index = h >> (64 - self.p)
+        remaining = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - remaining.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            self._estimate = None
+
+    def merge(self, other: 'HyperLogLog'):
+        if other.p != self.p:
+            raise ValueError("Cannot merge HyperLogLogs with different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        self._estimate = None
+
+    def count(self) -> int:
+        if self._estimate is None:
+            harmonic = sum(2.0 ** -r for r in self.registers)
+            estimate = self._alpha * self.m * self.m / harmonic
+            zeros = self.registers.count(0)
+            if estimate <= 2.5 * self.m and zeros:
+                # Small-range correction (linear counting)
+                estimate = self.m * math.log(self.m / zeros)
+            self._estimate = int(round(estimate))
+        return self._estimate
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.registers)
+
+
+class TDigest:
+    """Merging t-digest; centroids are (mean, weight) pairs kept sorted by mean"""
+
+    def __init__(self, compression: float = 100, centroids: Optional[List[Tuple[float, float]]] = None):
+        self.compression = compression
+        self.centroids: List[Tuple[float, float]] = [tuple(c) for c in centroids] if centroids else []
+        self._buffer: List[Tuple[float, float]] = []
+        self._buffer_limit = int(compression * 5)
+
+    @property
+    def count(self) -> float:
+        return sum(w for _, w in self.centroids) + sum(w for _, w in self._buffer)
+
+    def add(self, value: float, weight: float = 1):
+        self._buffer.append((float(value), float(weight)))
+        if len(self._buffer) >= self._buffer_limit:
+            self._compress()
+
+    def merge(self, other: 'TDigest'):
+        other._compress()
+        self._buffer.extend(other.centroids)
+        self._compress()
+
+    def _compress(self):
+        if not self._buffer:
+            return
+        points = sorted(self.centroids + self._buffer)
+        self._buffer = []
+        total = sum(w for _, w in points)
+        merged: List[Tuple[float, float]] = []
+        cumulative = 0.0
+        mean, weight = points[0]
+        for next_mean, next_weight in points[1:]:
+            q = (cumulative + weight + next_weight / 2) / total
+            # Scale function k1: centroids near the tails stay small
+            limit = 4 * total * q * (1 - q) / self.compression
+            if weight + next_weight <= max(limit, 1):
+                mean = (mean * weight + next_mean * next_weight) / (weight + next_weight)
+                weight += next_weight
+            else:
+                merged.append((mean, weight))
+                cumulative += weight
+                mean, weight = next_mean, next_weight
+        merged.append((mean, weight))
+        self.centroids = merged
+
+    def quantile(self, q: float) -> Optional[float]:
+        self._compress()
+        if not self.centroids:
+            return None
+        if len(self.centroids) == 1:
+            return self.centroids[0][0]
+        total = sum(w for _, w in self.centroids)
+        target = q * total
+        # Centre of each centroid in cumulative-weight space, then interpolate
+        centres = []
+        cumulative = 0.0
+        for _, w in self.centroids:
+            centres.append(cumulative + w / 2)
+            cumulative += w
+        if target <= centres[0]:
+            return self.centroids[0][0]
+        if target >= centres[-1]:
+            return self.centroids[-1][0]
+        i = bisect_left(centres, target)
+        left, right = self.centroids[i - 1][0], self.centroids[i][0]
+        fraction = (target - centres[i - 1]) / (centres[i] - centres[i - 1])
+        return left + (right - left) * fraction
+
+    def to_list(self) -> List[List[float]]:
+        self._compress()
+        return [[m, w] for m, w in self.centroids]
+
+
+def _normalize_key(value: Any) -> str:
+    return str(value or 'unknown').strip().lower()[:64] or 'unknown'
+
+
+class SketchRegistry:
+    """Per-worker sketches; `_pending_*` holds what has not been persisted yet"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hll: Dict[str, HyperLogLog] = {}
+        self._digests: Dict[str, TDigest] = {}
+        self._pending_hll: Dict[str, HyperLogLog] = {}
+        self._pending_digests: Dict[str, TDigest] = {}
+        self._keys_per_dimension: Dict[str, set] = {}
+        self._snapshot: Dict[str, Any] = {}
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # Pending observations belong to the parent; the child keeps the merged view only
+        self._lock = threading.Lock()
+        self._pending_hll = {}
+        self._pending_digests = {}
+
+    def _bounded(self, dimension: str, key: str) -> str:
+        keys = self._keys_per_dimension.setdefault(dimension, set())
+        if key not in keys:
+            if len(keys) >= MAX_KEYS_PER_DIMENSION:
+                return 'other'
+            keys.add(key)
+        return key
+
+    def observe(self, user_id: str, career: str, education: str, score: float):
+        """Record one saved simulation"""
+        with self._lock:
+            career_key = f"career:{self._bounded('career', _normalize_key(career))}"
+            education_key = f"education:{self._bounded('education', _normalize_key(education))}"
+            for name in ('all', career_key):
+                for sketches in (self._hll, self._pending_hll):
+                    sketches.setdefault(name, HyperLogLog()).add(user_id or 'anonymous')
+            for name in ('all', career_key, education_key):
+                for digests in (self._digests, self._pending_digests):
+                    digests.setdefault(name, TDigest()).add(score)
+
+    def summary(self) -> Dict[str, Any]:
+        """Approximate unique users and p50/p90 scores, recomputed at most every SUMMARY_MAX_AGE seconds"""
+        snapshot = self._snapshot
+        if snapshot and time.monotonic() - snapshot['_computed_at'] < SUMMARY_MAX_AGE:
+            return {k: v for k, v in snapshot.items() if k != '_computed_at'}
+        with self._lock:
+            unique = {name: hll.count() for name, hll in self._hll.items()}
+            percentiles = {}
+            for name, digest in self._digests.items():
+                percentiles[name] = {
+                    'p50': round(digest.quantile(0.5), 1),
+                    'p90': round(digest.quantile(0.9), 1),
+                    'count': int(digest.count)
+                }
+            snapshot = {
+                'unique_users': unique.pop('all', 0),
+                'unique_users_by_career': {k.split(':', 1)[1]: v for k, v in unique.items()},
+                'score_percentiles': percentiles.pop('all', {}),
+                'score_percentiles_by_career': {
+                    k.split(':', 1)[1]: v for k, v in percentiles.items() if k.startswith('career:')
+                },
+                'score_percentiles_by_education': {
+                    k.split(':', 1)[1]: v for k, v in percentiles.items() if k.startswith('education:')
+                },
+                'approximate': True
+            }
+            self._snapshot = {**snapshot, '_computed_at': time.monotonic()}
+        return snapshot
+
+    def persist(self) -> Dict[str, int]:
+        """Merge pending observations into Mongo and refresh the local view from the merged state"""
+        collection = get_sketches_collection()
+        if collection is None:
+            return {'persisted': 0}
+        with self._lock:
+            pending_hll, self._pending_hll = self._pending_hll, {}
+            pending_digests, self._pending_digests = self._pending_digests, {}
+
+        persisted = 0
+        for name, hll in pending_hll.items():
+            if self._merge_into(collection, f"hll:{name}", hll, kind='hll') is None:
+                with self._lock:
+                    self._pending_hll.setdefault(name, HyperLogLog()).merge(hll)
+                continue
+            persisted += 1
+        for name, digest in pending_digests.items():
+            if self._merge_into(collection, f"tdigest:{name}", digest, kind='tdigest') is None:
+                with self._lock:
+                    self._pending_digests.setdefault(name, TDigest()).merge(digest)
+                continue
+            persisted += 1
+        # Other workers add to dimensions this one saw nothing for, so pull back every sketch
+        self._refresh(collection)
+        return {'persisted': persisted}
+
+    def _merge_into(self, collection, doc_id: str, local, kind: str):
+        # Optimistic concurrency: other workers merge into the same documents
+        for _ in range(MAX_PERSIST_RETRIES):
+            doc = collection.find_one({'_id': doc_id})
+            version = doc.get('version', 0) if doc else 0
+            if kind == 'hll':
+                merged = HyperLogLog(registers=doc['registers']) if doc else HyperLogLog()
+                merged.merge(local)
+                body = {'kind': kind, 'registers': Binary(merged.to_bytes())}
+            else:
+                merged = TDigest(centroids=doc['centroids']) if doc else TDigest()
+                merged.merge(_copy_digest(local))
+                body = {'kind': kind, 'centroids': merged.to_list(), 'count': merged.count}
+            body['version'] = version + 1
+            try:
+                if doc:
+                    result = collection.replace_one({'_id': doc_id, 'version': version}, body)
+                    if result.modified_count:
+                        return merged
+                else:
+                    collection.insert_one({'_id': doc_id, **body})
+                    return merged
+            except Exception as e:
+                if getattr(e, 'code', None) != 11000:
+                    logger.warning(f"Sketch persist for {doc_id} failed: {e}")
+                    return None
+        logger.warning(f"Sketch persist for {doc_id} gave up after {MAX_PERSIST_RETRIES} conflicts")
+        return None
+
+    def _refresh(self, collection):
+        """Replace the local view with the persisted sketches plus what is still pending here"""
+        hll, digests = {}, {}
+        for doc in collection.find({}):
+            kind, name = doc['_id'].split(':', 1)
+            if kind == 'hll':
+                hll[name] = HyperLogLog(registers=doc['registers'])
+            elif kind == 'tdigest':
+                digests[name] = TDigest(centroids=doc['centroids'])
+        with self._lock:
+            # Observations made since the pending sketches were swapped out; keep them visible
+            for name, pending in self._pending_hll.items():
+                hll.setdefault(name, HyperLogLog()).merge(pending)
+            for name, pending in self._pending_digests.items():
+                digests.setdefault(name, TDigest()).merge(_copy_digest(pending))
+            for name in list(hll) + list(digests):
+                dimension, _, key = name.partition(':')
+                if key:
+                    self._keys_per_dimension.setdefault(dimension, set()).add(key)
+            self._hll.update(hll)
+            self._digests.update(digests)
+            self._snapshot = {}
+
+    def load(self):
+        """Seed the in-memory view from the persisted sketches (worker startup)"""
+        collection = get_sketches_collection()
+        if collection is None:
+            return
+        self._refresh(collection)
+
+
+def _copy_digest(digest: TDigest) -> TDigest:
+    return TDigest(digest.compression, centroids=digest.to_list())
+
+
+# Global sketch registry (per worker process)
+sketch_registry = SketchRegistry()
+sketch_persist_job = PeriodicJob('sketch_persist', sketch_registry.persist, SKETCH_PERSIST_INTERVAL)
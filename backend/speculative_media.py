@@ -0,0 +1,250 @@
+"""
+Speculative media pre-generation
+Parallel You: AI-Generated Personalized Reality Simulator
+
+Creating or updating a profile tells us the age, career and name that the
+user's first /predict will render an avatar and a "future you" image from.
+Those images are generated in the background right away, at low priority
+(one worker thread, a bounded queue that drops work rather than growing).
+Results are stored under a hash of the exact generation inputs, in the host's
+shared-memory cache and in `speculative_media`, and predict() looks there
+before calling a provider. Speculation is capped per
+user and per day through counters in `speculation_budget`, and each cached
+entry counts its hits so the report shows how much of the spend pays off.
+"""
+
+import hashlib
+import os
+import queue
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+import logging
+
+from pymongo import ReturnDocument
+
+from ai_media import generate_avatar_image, generate_image_fastest, future_image_prompt, avatar_prompt
+from database import get_speculative_media_collection, get_speculation_budget_collection
+from singleflight import normalize_prompt
+from shm_cache import shared_cache
+
+logger = logging.getLogger(__name__)
+
+SPECULATION_ENABLED = os.getenv('SPECULATION_ENABLED', '1') == '1'
+SPECULATION_WORKERS = int(os.getenv('SPECULATION_WORKERS', '1'))
+SPECULATION_QUEUE_SIZE = int(os.getenv('SPECULATION_QUEUE_SIZE', '100'))
+# Provider generations spent on speculation, per user and for the whole service, per day
+SPECULATION_PER_USER_DAILY = int(os.getenv('SPECULATION_PER_USER_DAILY', '4'))
+SPECULATION_DAILY_BUDGET = int(os.getenv('SPECULATION_DAILY_BUDGET', '1000'))
+SPECULATION_TTL = int(os.getenv('SPECULATION_TTL_SECONDS', str(24 * 3600)))
+# Fields of a profile that change what would be generated
+MEDIA_FIELDS = ('name', 'age', 'dreamCareer')
+KINDS = {
+    'avatar': (avatar_prompt, generate_avatar_image),
+    'image': (future_image_prompt, lambda data: generate_image_fastest(future_image_prompt(data), data))
+}
+
+
+def media_key(kind: str, data: Dict[str, Any]) -> str:
+    """Hash of everything the generated media depends on"""
+    prompt_for, _ = KINDS[kind]
+    parts = [kind, normalize_prompt(prompt_for(data)), str(data.get('age', 25)).strip(),
+             normalize_prompt(str(data.get('dreamCareer', 'professional')))]
+    return hashlib.sha256('\x1f'.join(parts).encode()).hexdigest()
+
+
+def _today() -> str:
+    return datetime.now().strftime('%Y-%m-%d')
+
+
+class SpeculativeMediaCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue = None
+        self._threads = []
+        self._queued = set()
+        self._budget_local: Dict[str, int] = {}
+        self._stats = {'requested': 0, 'enqueued': 0, 'queue_full': 0, 'already_cached': 0,
+                       'budget_exhausted': 0, 'generated': 0, 'failed': 0,
+                       'lookups': 0, 'hits': 0, 'misses': 0}
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # Worker threads and queued work belong to the parent
+        self._lock = threading.Lock()
+        self._queue = None
+        self._threads = []
+        self._queued = set()
+
+    def _ensure_workers(self) -> queue.Queue:
+        with self._lock:
+            if self._queue is None:
+                self._queue = queue.Queue(maxsize=SPECULATION_QUEUE_SIZE)
+                for i in range(SPECULATION_WORKERS):
+                    thread = threading.Thread(target=self._worker, name=f"speculation-{i}", daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+            return self._queue
+
+    def _count(self, field: str, amount: int = 1):
+        with self._lock:
+            self._stats[field] += amount
+
+    def speculate(self, user_id: str, profile: Dict[str, Any]) -> int:
+        """Queue background generation of the media a first /predict would ask for; returns jobs queued"""
+        if not SPECULATION_ENABLED or not profile or not profile.get('dreamCareer'):
+            return 0
+        work = self._ensure_workers()
+        queued = 0
+        for kind in KINDS:
+            key = media_key(kind, profile)
+            self._count('requested')
+            with self._lock:
+                if key in self._queued:
+                    continue
+                self._queued.add(key)
+            try:
+                work.put_nowait((kind, key, str(user_id), dict(profile)))
+                queued += 1
+            except queue.Full:
+                with self._lock:
+                    self._queued.discard(key)
+                self._count('queue_full')
+        self._count('enqueued', queued)
+        return queued
+
+    def _worker(self):
+        work = self._queue
+        while True:
+            kind, key, user_id, profile = work.get()
+            try:
+                self._generate(kind, key, user_id, profile)
+            except Exception as e:
+                self._count('failed')
+                logger.warning(f"Speculative {kind} generation failed: {e}")
+            finally:
+                with self._lock:
+                    self._queued.discard(key)
+
+    def _generate(self, kind: str, key: str, user_id: str, profile: Dict[str, Any]):
+        if self._lookup(key) is not None:
+            self._count('already_cached')
+            return
+        if not self._take_budget(user_id):
+            self._count('budget_exhausted')
+            return
+        _, generate = KINDS[kind]
+        result = generate(profile)
+        if not result or result.get('fallback'):
+            # Placeholders are cheap to make on demand; only real provider output is worth keeping
+            self._count('failed')
+            return
+        self._store(kind, key, user_id, result)
+        self._count('generated')
+
+    def _take_budget(self, user_id: str) -> bool:
+        """Spend one generation from the user's and the service's daily allowance"""
+        day = _today()
+        limits = ((f"{day}:user:{user_id}", SPECULATION_PER_USER_DAILY), (f"{day}:total", SPECULATION_DAILY_BUDGET))
+        collection = get_speculation_budget_collection()
+        if collection is None:
+            with self._lock:
+                if any(self._budget_local.get(counter, 0) >= limit for counter, limit in limits):
+                    return False
+                for counter, _ in limits:
+                    self._budget_local[counter] = self._budget_local.get(counter, 0) + 1
+            return True
+        expires_at = datetime.now() + timedelta(days=2)
+        taken = []
+        for counter, limit in limits:
+            doc = collection.find_one_and_update(
+                {'_id': counter},
+                {'$inc': {'used': 1}, '$setOnInsert': {'expires_at': expires_at}},
+                upsert=True, return_document=ReturnDocument.AFTER
+            )
+            taken.append(counter)
+            if doc['used'] > limit:
+                # Give back everything taken so far, so an exhausted total does not use up users' allowance
+                collection.update_many({'_id': {'$in': taken}}, {'$inc': {'used': -1}})
+                return False
+        return True
+
+    def _store(self, kind: str, key: str, user_id: str, result: Dict[str, Any]):
+        shared_cache.set(f"speculative:{key}", result, SPECULATION_TTL)
+        collection = get_speculative_media_collection()
+        if collection is not None:
+            collection.replace_one(
+                {'_id': key},
+                {'_id': key, 'kind': kind, 'user_id': user_id, 'result': result,
+                 'created_at': datetime.now(), 'hits': 0},
+                upsert=True
+            )
+
+    def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        result = shared_cache.get(f"speculative:{key}")
+        if result is not None:
+            return result
+        collection = get_speculative_media_collection()
+        if collection is None:
+            return None
+        doc = collection.find_one({'_id': key}, {'result': 1})
+        return doc['result'] if doc else None
+
+    def take(self, kind: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Pre-generated media for this request's inputs, or None to generate it now"""
+        if not SPECULATION_ENABLED:
+            return None
+        key = media_key(kind, data)
+        self._count('lookups')
+        try:
+            result = self._lookup(key)
+            if result is not None:
+                collection = get_speculative_media_collection()
+                if collection is not None:
+                    collection.update_one({'_id': key}, {'$inc': {'hits': 1}, '$set': {'last_hit_at': datetime.now()}})
+        except Exception as e:
+            logger.warning(f"Speculative media lookup failed: {e}")
+            result = None
+        self._count('hits' if result is not None else 'misses')
+        return {**result, 'speculative': True} if result is not None else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['queued'] = len(self._queued)
+        stats['hit_rate'] = round(stats['hits'] / stats['lookups'], 4) if stats['lookups'] else 0.0
+        return stats
+
+    def report(self) -> Dict[str, Any]:
+        """Whether speculation pays off: share of generated media that a /predict went on to use"""
+        report = {'worker': self.get_stats(), 'budget': {
+            'per_user_daily': SPECULATION_PER_USER_DAILY, 'daily': SPECULATION_DAILY_BUDGET
+        }}
+        collection = get_speculative_media_collection()
+        budget = get_speculation_budget_collection()
+        if collection is None or budget is None:
+            return report
+        by_kind = {}
+        for row in collection.aggregate([{'$group': {
+            '_id': '$kind', 'generated': {'$sum': 1}, 'hits': {'$sum': '$hits'},
+            'used': {'$sum': {'$cond': [{'$gt': ['$hits', 0]}, 1, 0]}}
+        }}]):
+            kind = row.pop('_id')
+            row['use_rate'] = round(row['used'] / row['generated'], 4) if row['generated'] else 0.0
+            by_kind[kind] = row
+        generated = sum(row['generated'] for row in by_kind.values())
+        used = sum(row['used'] for row in by_kind.values())
+        today = budget.find_one({'_id': f"{_today()}:total"}) or {}
+        report.update({
+            'cached': by_kind,
+            'generated': generated,
+            'used': used,
+            'use_rate': round(used / generated, 4) if generated else 0.0,
+            'wasted': generated - used,
+            'spent_today': today.get('used', 0)
+        })
+        return report
+
+
+# Global cache (per worker process; entries are shared through Mongo)
+speculative_media = SpeculativeMediaCache()
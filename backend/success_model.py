@@ -0,0 +1,305 @@
+"""
+Learned success-score model
+Parallel You: AI-Generated Personalized Reality Simulator
+
+Training runs offline over stored simulations (and reported outcomes, when a
+simulation has one in `feedback`) and writes a versioned artifact of plain
+.npy weights plus JSON metadata. Workers memory-map the current artifact,
+swap to a new version without restarting, and score concurrent requests in
+micro-batches. The rule-based formula in scoring.py stays as the fallback.
+
+    python backend/success_model.py train
+"""
+
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import logging
+
+import numpy as np
+
+from scoring import CAREER_FACTORS, EDUCATION_BONUS, HABIT_BONUSES, match_career_key, calculate_success_score
+from jobs import PeriodicJob
+import deadline
+
+logger = logging.getLogger(__name__)
+
+MODEL_DIR = os.path.abspath(os.getenv('MODEL_DIR', os.path.join(os.path.dirname(__file__), 'models_store')))
+MODEL_RELOAD_INTERVAL = float(os.getenv('MODEL_RELOAD_INTERVAL_SECONDS', '30'))
+BATCH_MAX_SIZE = int(os.getenv('MODEL_BATCH_MAX_SIZE', '64'))
+BATCH_MAX_WAIT = float(os.getenv('MODEL_BATCH_MAX_WAIT_MS', '5')) / 1000
+PREDICT_TIMEOUT = float(os.getenv('MODEL_PREDICT_TIMEOUT_MS', '200')) / 1000
+MIN_TRAINING_ROWS = 50
+
+# Featurization is shared by training and serving; bump when the layout changes
+FEATURE_VERSION = 1
+CAREER_KEYS = list(CAREER_FACTORS) + ['other']
+EDUCATION_KEYS = list(EDUCATION_BONUS) + ['unknown']
+HABIT_KEYS = list(HABIT_BONUSES)
+AGE_BANDS = (25, 30, 50)
+FEATURE_NAMES = (
+    [f"career={c}" for c in CAREER_KEYS] + [f"education={e}" for e in EDUCATION_KEYS]
+    + [f"habit={h}" for h in HABIT_KEYS]
+    + ['age_scaled', 'age_under_25', 'age_25_29', 'age_over_50', 'habit_count']
+)
+_CAREER_INDEX = {c: i for i, c in enumerate(CAREER_KEYS)}
+_EDUCATION_INDEX = {e: len(CAREER_KEYS) + i for i, e in enumerate(EDUCATION_KEYS)}
+_HABIT_INDEX = {h: len(CAREER_KEYS) + len(EDUCATION_KEYS) + i for i, h in enumerate(HABIT_KEYS)}
+_NUMERIC_OFFSET = len(CAREER_KEYS) + len(EDUCATION_KEYS) + len(HABIT_KEYS)
+
+
+def featurize(data: Dict[str, Any]) -> np.ndarray:
+    """Fixed-length float32 vector for one profile"""
+    vector = np.zeros(len(FEATURE_NAMES), dtype=np.float32)
+    vector[_CAREER_INDEX[match_career_key(data.get('dreamCareer', '')) or 'other']] = 1
+    vector[_EDUCATION_INDEX.get(data.get('education', ''), _EDUCATION_INDEX['unknown'])] = 1
+    habits = data.get('habits') or []
+    for habit in habits:
+        if habit in _HABIT_INDEX:
+            vector[_HABIT_INDEX[habit]] = 1
+    try:
+        age = float(data.get('age', 25))
+    except (TypeError, ValueError):
+        age = 25.0
+    vector[_NUMERIC_OFFSET:] = (
+        (age - 35) / 15, age < AGE_BANDS[0], AGE_BANDS[0] <= age < AGE_BANDS[1], age > AGE_BANDS[2], len(habits)
+    )
+    return vector
+
+
+def featurize_many(rows: List[Dict[str, Any]]) -> np.ndarray:
+    return np.stack([featurize(row) for row in rows]) if rows else np.zeros((0, len(FEATURE_NAMES)), np.float32)
+
+
+def _load_training_data(limit: Optional[int] = None):
+    from database import get_simulations_collection, get_feedback_collection
+
+    simulations = get_simulations_collection()
+    if simulations is None:
+        raise RuntimeError("Database not connected")
+
+    # Reported outcomes override the score the simulation predicted at the time. Without one, a
+    # score is only a usable target if the rule formula produced it: a row scored by an earlier
+    # model would teach the next model to copy its own predictions.
+    outcomes = {}
+    feedback = get_feedback_collection()
+    if feedback is not None:
+        for doc in feedback.find({'outcome_score': {'$exists': True}}, {'_id': 0, 'simulation_id': 1, 'outcome_score': 1}):
+            outcomes[doc['simulation_id']] = doc['outcome_score']
+
+    cursor = simulations.find(
+        {}, {'_id': 0, 'simulation_id': 1, 'confidence_score': 1, 'model_version': 1, 'input_data.dreamCareer': 1,
+             'input_data.education': 1, 'input_data.age': 1, 'input_data.habits': 1}
+    ).batch_size(2000)
+    if limit:
+        cursor = cursor.limit(limit)
+    rows, targets = [], []
+    model_scored = 0
+    for doc in cursor:
+        outcome = outcomes.get(doc.get('simulation_id'))
+        if outcome is None:
+            if doc.get('model_version') not in (None, 'rules'):
+                model_scored += 1
+                continue
+            outcome = doc.get('confidence_score', 0)
+        rows.append(doc.get('input_data', {}))
+        targets.append(outcome)
+    return featurize_many(rows), np.asarray(targets, dtype=np.float32), len(outcomes), model_scored
+
+
+def train(alpha: float = 1.0, limit: Optional[int] = None) -> Dict[str, Any]:
+    """Fit a ridge regression and publish it as the new current version"""
+    from sklearn.linear_model import Ridge
+    from sklearn.model_selection import train_test_split
+
+    X, y, outcome_count, model_scored = _load_training_data(limit)
+    if len(y) < MIN_TRAINING_ROWS:
+        raise RuntimeError(f"Need at least {MIN_TRAINING_ROWS} simulations to train, found {len(y)}")
+
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    model = Ridge(alpha=alpha).fit(X_train, y_train)
+    mae = float(np.mean(np.abs(model.predict(X_test) - y_test)))
+
+    version = datetime.now().strftime('%Y%m%d%H%M%S')
+    version_dir = os.path.join(MODEL_DIR, 'versions', version)
+    os.makedirs(version_dir, exist_ok=True)
+    np.save(os.path.join(version_dir, 'weights.npy'), model.coef_.astype(np.float32))
+    meta = {
+        'version': version,
+        'feature_version': FEATURE_VERSION,
+        'feature_names': FEATURE_NAMES,
+        'intercept': float(model.intercept_),
+        'rows': int(len(y)),
+        'outcome_rows': outcome_count,
+        'skipped_model_scored': model_scored,
+        'test_mae': round(mae, 3),
+        'trained_at': datetime.now().isoformat()
+    }
+    with open(os.path.join(version_dir, 'meta.json'), 'w') as handle:
+        json.dump(meta, handle, indent=2)
+    publish(version)
+    return meta
+
+
+def publish(version: str):
+    """Point CURRENT at a version; workers pick it up on their next reload check"""
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    tmp = os.path.join(MODEL_DIR, f".CURRENT.{os.getpid()}")
+    with open(tmp, 'w') as handle:
+        handle.write(version)
+    os.replace(tmp, os.path.join(MODEL_DIR, 'CURRENT'))
+
+
+class LinearModel:
+    def __init__(self, version: str, weights: np.ndarray, intercept: float):
+        self.version = version
+        self.weights = weights
+        self.intercept = intercept
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return X @ self.weights + self.intercept
+
+    @classmethod
+    def load(cls, version: str) -> 'LinearModel':
+        version_dir = os.path.join(MODEL_DIR, 'versions', version)
+        with open(os.path.join(version_dir, 'meta.json')) as handle:
+            meta = json.load(handle)
+        if meta.get('feature_version') != FEATURE_VERSION:
+            raise ValueError(f"Model {version} uses feature version {meta.get('feature_version')}, expected {FEATURE_VERSION}")
+        # Memory-mapped: pages are shared between worker processes through the page cache
+        weights = np.load(os.path.join(version_dir, 'weights.npy'), mmap_mode='r')
+        if weights.shape != (len(FEATURE_NAMES),):
+            raise ValueError(f"Model {version} has {weights.shape} weights, expected {len(FEATURE_NAMES)}")
+        return cls(version, weights, meta['intercept'])
+
+
+class MicroBatcher:
+    """Groups concurrent predict calls that arrive within a short window into one matrix product"""
+
+    def __init__(self, predict_fn, max_batch: int = BATCH_MAX_SIZE, max_wait: float = BATCH_MAX_WAIT):
+        self.predict_fn = predict_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'batches': 0, 'max_batch_seen': 0}
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, features: np.ndarray) -> Future:
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='model-batcher', daemon=True)
+                    self._thread.start()
+        future = Future()
+        self._queue.put((features, future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            flush_at = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = flush_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                predictions = self.predict_fn(np.stack([features for features, _ in batch]))
+                for (_, future), prediction in zip(batch, predictions):
+                    future.set_result(float(prediction))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            with self._lock:
+                self._stats['requests'] += len(batch)
+                self._stats['batches'] += 1
+                self._stats['max_batch_seen'] = max(self._stats['max_batch_seen'], len(batch))
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats['avg_batch'] = round(stats['requests'] / stats['batches'], 2) if stats['batches'] else 0
+        return stats
+
+
+class ModelServer:
+    def __init__(self):
+        self.model: Optional[LinearModel] = None
+        self._current_marker = None
+        self.batcher = MicroBatcher(self._predict_batch)
+        self._stats = {'model_scores': 0, 'fallback_scores': 0, 'reloads': 0, 'reload_failures': 0}
+
+    def _predict_batch(self, X: np.ndarray) -> np.ndarray:
+        # Read the reference once so a concurrent swap cannot mix two versions in one batch
+        model = self.model
+        return model.predict(X)
+
+    def reload(self) -> Optional[str]:
+        """Load CURRENT if it changed since the last check; the swap is a single reference assignment"""
+        marker_path = os.path.join(MODEL_DIR, 'CURRENT')
+        try:
+            with open(marker_path) as handle:
+                version = handle.read().strip()
+        except FileNotFoundError:
+            return None
+        if not version or version == self._current_marker:
+            return self.model.version if self.model else None
+        try:
+            model = LinearModel.load(version)
+        except Exception as e:
+            self._stats['reload_failures'] += 1
+            logger.error(f"Failed to load model {version}: {e}")
+            self._current_marker = version
+            return self.model.version if self.model else None
+        self.model = model
+        self._current_marker = version
+        self._stats['reloads'] += 1
+        logger.info(f"Success model {version} loaded")
+        return version
+
+    def score(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Model score when a model is loaded and answers in time, otherwise the rule-based formula"""
+        if self.model is not None:
+            try:
+                prediction = self.batcher.submit(featurize(data)).result(timeout=deadline.timeout_for(PREDICT_TIMEOUT))
+                self._stats['model_scores'] += 1
+                return {'score': int(round(min(100, max(0, prediction)))), 'model_version': self.model.version}
+            except Exception as e:
+                logger.warning(f"Model scoring failed, using formula: {e}")
+        self._stats['fallback_scores'] += 1
+        return {'score': calculate_success_score(data), 'model_version': 'rules'}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            'model_version': self.model.version if self.model else None,
+            'batching': self.batcher.get_stats()
+        }
+
+
+# Global model server (per worker process)
+model_server = ModelServer()
+model_reload_job = PeriodicJob('model_reload', model_server.reload, MODEL_RELOAD_INTERVAL)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'train':
+        print(json.dumps(train(), indent=2))
+    else:
+        print("usage: python backend/success_model.py train")
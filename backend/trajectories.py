@@ -0,0 +1,250 @@
+"""
+Monte Carlo "parallel lives" trajectory engine
+Parallel You: AI-Generated Personalized Reality Simulator
+
+Runs thousands of year-by-year career trajectories for one profile with
+NumPy. Each trajectory draws whether further education is pursued and
+finished, how well each habit is kept up, and career-switch shocks; the
+result is a score distribution per year with percentile bands.
+
+Trajectories are simulated in fixed-size chunks, each with its own seed
+spawned from the request seed, so the output is identical whether chunks
+run inline or in the process pool. Chunks return per-year histograms of
+integer scores rather than raw paths, which keeps inter-process traffic
+small and percentiles exact.
+
+    python backend/trajectories.py bench [trajectories]
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional
+import logging
+
+import numpy as np
+
+from scoring import EDUCATION_BONUS, HABIT_BONUSES, rule_based_score
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = int(os.getenv('TRAJECTORY_CHUNK_SIZE', '10000'))
+# Requests above this many trajectories are spread over the process pool
+PARALLEL_THRESHOLD = int(os.getenv('TRAJECTORY_PARALLEL_THRESHOLD', '20000'))
+TRAJECTORY_WORKERS = int(os.getenv('TRAJECTORY_WORKERS', str(max(1, (os.cpu_count() or 2) // 2))))
+TRAJECTORY_BUDGET_MS = float(os.getenv('TRAJECTORY_BUDGET_MS', '1500'))
+MAX_TRAJECTORIES = 100000
+MAX_YEARS = 30
+MODES = {'fast': 1000, 'standard': 5000, 'large': MAX_TRAJECTORIES}
+PERCENTILES = (10, 25, 50, 75, 90)
+
+EDUCATION_LADDER = ('high-school', 'associate', 'bachelor', 'master', 'phd')
+# Yearly dynamics
+CATCH_UP_RATE = 0.25
+YEARLY_VOLATILITY = 3.0
+EDUCATION_PURSUE_PROBABILITY = 0.25
+EDUCATION_COMPLETION_PROBABILITY = 0.35
+EDUCATION_DROPOUT_PROBABILITY = 0.15
+CAREER_SWITCH_PROBABILITY = 0.06
+CAREER_SWITCH_RETAINED = 0.75
+CAREER_SWITCH_POTENTIAL_SD = 8.0
+HABIT_ADHERENCE_PRIOR = (7.0, 3.0)
+
+
+def profile_seed(data: Dict[str, Any]) -> int:
+    """Seed derived from the profile so the same inputs give the same distribution"""
+    fields = {k: data.get(k) for k in ('dreamCareer', 'education', 'education_goal', 'age', 'habits')}
+    return int(hashlib.sha256(json.dumps(fields, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16], 16)
+
+
+def build_params(data: Dict[str, Any], years: int) -> Dict[str, Any]:
+    """Deterministic inputs to the simulation, derived from the scoring rules"""
+    habits = [h for h in (data.get('habits') or []) if h in HABIT_BONUSES]
+    structural = rule_based_score({**data, 'habits': []})
+
+    education = data.get('education', '')
+    goal = data.get('education_goal')
+    if goal in EDUCATION_BONUS and EDUCATION_BONUS[goal] > EDUCATION_BONUS.get(education, 0):
+        target, pursue = goal, 1.0
+    elif education in EDUCATION_LADDER[:-1]:
+        target, pursue = EDUCATION_LADDER[EDUCATION_LADDER.index(education) + 1], EDUCATION_PURSUE_PROBABILITY
+    else:
+        target, pursue = education, 0.0
+
+    return {
+        'years': years,
+        'structural': float(structural),
+        'education_gain': float(EDUCATION_BONUS.get(target, 0) - EDUCATION_BONUS.get(education, 0)),
+        'education_target': target,
+        'pursue_probability': pursue,
+        'habit_bonuses': [float(HABIT_BONUSES[h]) for h in habits]
+    }
+
+
+def simulate_chunk(params: Dict[str, Any], n: int, seed: np.random.SeedSequence) -> Dict[str, Any]:
+    """Simulate n trajectories; returns per-year score histograms and event counts"""
+    rng = np.random.default_rng(seed)
+    years = params['years']
+    bonuses = np.asarray(params['habit_bonuses'], dtype=np.float32)
+
+    # Where each life starts relative to its structural potential
+    current = (params['structural'] * rng.uniform(0.5, 0.7, n)).astype(np.float32)
+    potential = np.full(n, params['structural'], dtype=np.float32)
+
+    # Further education: pursued, then finished after a geometric number of years unless dropped
+    pursued = rng.random(n) < params['pursue_probability']
+    finished = pursued & (rng.random(n) >= EDUCATION_DROPOUT_PROBABILITY)
+    finish_year = rng.geometric(EDUCATION_COMPLETION_PROBABILITY, n)
+
+    # Per-trajectory habit adherence, then kept/not kept each year
+    adherence = rng.beta(*HABIT_ADHERENCE_PRIOR, size=(n, len(bonuses))).astype(np.float32)
+    kept = np.zeros((n, len(bonuses)), dtype=np.float32)
+    switched = np.zeros(n, dtype=bool)
+
+    scores = np.empty((years + 1, n), dtype=np.float32)
+    scores[0] = current
+    for year in range(1, years + 1):
+        kept += rng.random((n, len(bonuses)), dtype=np.float32) < adherence
+        habit_term = (kept / year) @ bonuses if len(bonuses) else 0
+        education_term = params['education_gain'] * (finished & (finish_year <= year))
+
+        switch = rng.random(n) < CAREER_SWITCH_PROBABILITY
+        switched |= switch
+        current = np.where(switch, current * CAREER_SWITCH_RETAINED, current)
+        potential = potential + switch * rng.normal(0, CAREER_SWITCH_POTENTIAL_SD, n).astype(np.float32)
+
+        target = potential + education_term + habit_term
+        current = current + CATCH_UP_RATE * (target - current) + rng.normal(0, YEARLY_VOLATILITY, n).astype(np.float32)
+        scores[year] = current
+
+    bins = np.clip(np.rint(scores), 0, 100).astype(np.int64)
+    bins += (np.arange(years + 1) * 101)[:, None]
+    counts = np.bincount(bins.ravel(), minlength=(years + 1) * 101).reshape(years + 1, 101)
+    return {
+        'counts': counts,
+        'education_completed': int((finished & (finish_year <= years)).sum()),
+        'career_switched': int(switched.sum())
+    }
+
+
+def _percentile(cumulative: np.ndarray, total: int, q: float) -> int:
+    return int(np.searchsorted(cumulative, total * q / 100, side='left'))
+
+
+def summarize(counts: np.ndarray, total: int) -> Dict[str, Any]:
+    values = np.arange(101)
+    bands = []
+    for year, row in enumerate(counts):
+        cumulative = np.cumsum(row)
+        band = {'year': year, 'mean': round(float(row @ values / total), 1)}
+        band.update({f"p{q}": _percentile(cumulative, total, q) for q in PERCENTILES})
+        bands.append(band)
+
+    final = counts[-1]
+    return {
+        'bands': bands,
+        'final_distribution': [
+            {'range': f"{low}-{min(low + 9, 100) if low < 90 else 100}",
+             'share': round(float(final[low:low + 10 if low < 90 else 101].sum() / total), 4)}
+            for low in range(0, 100, 10)
+        ],
+        'probabilities': {
+            f"reach_{threshold}": round(float(final[threshold:].sum() / total), 4) for threshold in (60, 80, 90)
+        }
+    }
+
+
+class TrajectoryEngine:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pool = None
+        self._stats = {'requests': 0, 'trajectories': 0, 'parallel_requests': 0, 'over_budget': 0}
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=TRAJECTORY_WORKERS)
+            return self._pool
+
+    def simulate(self, data: Dict[str, Any], trajectories: Optional[int] = None, years: int = 10,
+                 seed: Optional[int] = None, mode: str = 'standard') -> Dict[str, Any]:
+        """Outcome distribution over `years` for one profile"""
+        n = max(1, min(int(trajectories or MODES.get(mode, MODES['standard'])), MAX_TRAJECTORIES))
+        years = max(1, min(int(years), MAX_YEARS))
+        seed = profile_seed(data) if seed is None else int(seed)
+        params = build_params(data, years)
+
+        sizes = [CHUNK_SIZE] * (n // CHUNK_SIZE) + ([n % CHUNK_SIZE] if n % CHUNK_SIZE else [])
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+        parallel = n > PARALLEL_THRESHOLD and TRAJECTORY_WORKERS > 1
+
+        start = time.perf_counter()
+        if parallel:
+            pool = self._executor()
+            chunks = list(pool.map(simulate_chunk, [params] * len(sizes), sizes, seeds))
+        else:
+            chunks = [simulate_chunk(params, size, chunk_seed) for size, chunk_seed in zip(sizes, seeds)]
+        counts = sum(chunk['counts'] for chunk in chunks)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        with self._lock:
+            self._stats['requests'] += 1
+            self._stats['trajectories'] += n
+            self._stats['parallel_requests'] += parallel
+            self._stats['over_budget'] += elapsed_ms > TRAJECTORY_BUDGET_MS
+
+        return {
+            'trajectories': n,
+            'years': years,
+            'seed': seed,
+            'chunks': len(sizes),
+            'parallel': parallel,
+            'elapsed_ms': round(elapsed_ms, 1),
+            'assumptions': {
+                'starting_potential': params['structural'],
+                'education_target': params['education_target'],
+                'education_pursue_probability': params['pursue_probability'],
+                'habits_modeled': len(params['habit_bonuses'])
+            },
+            **summarize(counts, n),
+            'events': {
+                'education_completed_pct': round(100 * sum(c['education_completed'] for c in chunks) / n, 1),
+                'career_switch_pct': round(100 * sum(c['career_switched'] for c in chunks) / n, 1)
+            }
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, 'workers': TRAJECTORY_WORKERS, 'budget_ms': TRAJECTORY_BUDGET_MS}
+
+
+# Global engine (per worker process)
+trajectory_engine = TrajectoryEngine()
+
+
+def benchmark(trajectories: int = MAX_TRAJECTORIES) -> Dict[str, Any]:
+    profile = {'dreamCareer': 'Software Engineer', 'education': 'bachelor', 'age': 27,
+               'habits': ['Exercise regularly', 'Learn new skills', 'Network actively']}
+    trajectory_engine.simulate(profile, 1000)
+    results = []
+    for n in sorted({1000, MODES['standard'], trajectories}):
+        run = trajectory_engine.simulate(profile, n)
+        results.append({'trajectories': n, 'parallel': run['parallel'], 'elapsed_ms': run['elapsed_ms'],
+                        'within_budget': run['elapsed_ms'] <= TRAJECTORY_BUDGET_MS})
+    return {'budget_ms': TRAJECTORY_BUDGET_MS, 'workers': TRAJECTORY_WORKERS, 'runs': results}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        print(json.dumps(benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else MAX_TRAJECTORIES), indent=2))
+    else:
+        print("usage: python backend/trajectories.py bench [trajectories]")
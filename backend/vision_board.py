@@ -0,0 +1,322 @@
+"""
+Rendered vision boards
+Parallel You: AI-Generated Personalized Reality Simulator
+
+Boards are composed with Pillow in a process pool so rendering never runs on
+a request thread. Each worker process caches its fonts and backgrounds, and
+finished boards are cached on disk under a hash of everything drawn on them,
+so the same goals, career and score are rendered once. The career image is
+usually still being copied into the media store when /predict asks for the
+board, so the spec may name the provider URL instead and the render process
+fetches it itself.
+
+    python backend/vision_board.py bench [renders] [processes]
+"""
+
+import hashlib
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+import logging
+
+from media_store import MEDIA_STORE_DIR, media_url
+
+logger = logging.getLogger(__name__)
+
+BOARD_DIR = os.path.join(MEDIA_STORE_DIR, 'boards')
+RENDER_WORKERS = int(os.getenv('VISION_BOARD_WORKERS', str(max(1, (os.cpu_count() or 2) // 2))))
+BOARD_FONT = os.getenv('VISION_BOARD_FONT')
+BOARD_FORMATS = {'png': 'PNG', 'webp': 'WEBP'}
+BOARD_SIZE = (1200, 800)
+# Bump when the layout changes so cached boards are not reused
+LAYOUT_VERSION = 1
+MAX_GOALS = 8
+CAREER_IMAGE_TIMEOUT = float(os.getenv('VISION_BOARD_IMAGE_TIMEOUT', '15'))
+CAREER_IMAGE_MAX_BYTES = 20 * 1024 * 1024
+
+FONT_CANDIDATES = (
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+    '/usr/share/fonts/dejavu/DejaVuSans.ttf',
+    '/Library/Fonts/Arial.ttf',
+    'C:\\Windows\\Fonts\\arial.ttf',
+)
+
+PALETTES = {
+    'high': ((24, 24, 64), (88, 40, 160), (255, 215, 90)),
+    'medium': ((16, 40, 64), (30, 110, 140), (120, 230, 200)),
+    'low': ((40, 24, 32), (140, 60, 80), (255, 170, 120)),
+}
+
+
+def _plain_text(text: Any, limit: int = 120) -> str:
+    # Bundled fonts have no emoji glyphs; drop anything outside the BMP
+    return ''.join(ch for ch in str(text or '') if ord(ch) < 0x10000).strip()[:limit]
+
+
+def _career_image_ref(career_image: Optional[str]) -> Optional[str]:
+    """A local file that exists, or a remote URL for the render process to fetch"""
+    if not career_image:
+        return None
+    if career_image.startswith(('http://', 'https://')):
+        return career_image
+    return career_image if os.path.exists(career_image) else None
+
+
+def build_spec(user_data: Dict[str, Any], goals: Dict[str, List[str]], fmt: str = 'png',
+               career_image: Optional[str] = None) -> Dict[str, Any]:
+    """Everything that affects the rendered pixels, and nothing else"""
+    score = int(user_data.get('score', 75))
+    return {
+        'layout': LAYOUT_VERSION,
+        'format': fmt if fmt in BOARD_FORMATS else 'png',
+        'name': _plain_text(user_data.get('name', 'Your'), 40),
+        'career': _plain_text(user_data.get('dreamCareer'), 60),
+        'score': score,
+        'palette': 'high' if score >= 80 else 'medium' if score >= 60 else 'low',
+        'personal': [_plain_text(g) for g in goals.get('personal', [])][:MAX_GOALS],
+        'professional': [_plain_text(g) for g in goals.get('professional', [])][:MAX_GOALS],
+        'career_image': _career_image_ref(career_image)
+    }
+
+
+def board_key(spec: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def board_path(key: str, fmt: str) -> str:
+    return os.path.join(BOARD_DIR, key[:2], f"{key}.{fmt}")
+
+
+@lru_cache(maxsize=16)
+def _font(size: int):
+    from PIL import ImageFont
+
+    for candidate in ((BOARD_FONT,) if BOARD_FONT else ()) + FONT_CANDIDATES:
+        if candidate and os.path.exists(candidate):
+            return ImageFont.truetype(candidate, size)
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        return ImageFont.load_default()
+
+
+@lru_cache(maxsize=8)
+def _background(palette: str, size: tuple):
+    from PIL import Image
+
+    top, bottom, _ = PALETTES[palette]
+    width, height = size
+    gradient = Image.new('RGB', (1, height))
+    for y in range(height):
+        t = y / max(height - 1, 1)
+        gradient.putpixel((0, y), tuple(int(a + (b - a) * t) for a, b in zip(top, bottom)))
+    return gradient.resize(size)
+
+
+def _wrap(draw, text: str, font, width: int) -> List[str]:
+    lines, line = [], ''
+    for word in text.split():
+        candidate = f"{line} {word}".strip()
+        if draw.textlength(candidate, font=font) <= width:
+            line = candidate
+        else:
+            if line:
+                lines.append(line)
+            line = word
+    if line:
+        lines.append(line)
+    return lines[:3]
+
+
+def _load_career_image(source: str):
+    """The career image as RGB, or None if it cannot be read (the board is drawn without it)"""
+    from PIL import Image
+
+    try:
+        if source.startswith(('http://', 'https://')):
+            import requests
+
+            response = requests.get(source, timeout=CAREER_IMAGE_TIMEOUT)
+            response.raise_for_status()
+            if len(response.content) > CAREER_IMAGE_MAX_BYTES:
+                raise ValueError(f"image exceeds {CAREER_IMAGE_MAX_BYTES} bytes")
+            handle = io.BytesIO(response.content)
+        else:
+            handle = open(source, 'rb')
+        with handle, Image.open(handle) as image:
+            return image.convert('RGB')
+    except Exception as e:
+        logger.warning(f"Could not load career image for vision board: {e}")
+        return None
+
+
+def _render(spec: Dict[str, Any]):
+    from PIL import ImageDraw
+
+    width, height = BOARD_SIZE
+    _, _, accent = PALETTES[spec['palette']]
+    board = _background(spec['palette'], BOARD_SIZE).copy()
+    draw = ImageDraw.Draw(board, 'RGBA')
+
+    draw.text((60, 50), f"{spec['name']} - Future Self", font=_font(48), fill=(255, 255, 255))
+    if spec['career']:
+        draw.text((60, 115), f"Career: {spec['career']}", font=_font(30), fill=accent)
+
+    # Score ring
+    cx, cy, r = width - 160, 130, 90
+    draw.ellipse((cx - r, cy - r, cx + r, cy + r), outline=(255, 255, 255, 60), width=14)
+    draw.arc((cx - r, cy - r, cx + r, cy + r), -90, -90 + 360 * spec['score'] / 100, fill=accent, width=14)
+    label = f"{spec['score']}%"
+    draw.text((cx - draw.textlength(label, font=_font(40)) / 2, cy - 24), label, font=_font(40), fill=(255, 255, 255))
+
+    top = 260
+    career_image = _load_career_image(spec['career_image']) if spec['career_image'] else None
+    if career_image is not None:
+        career_image.thumbnail((360, 360))
+        board.paste(career_image, (width - 60 - career_image.width, top))
+        columns_width = width - 120 - 380
+    else:
+        columns_width = width - 120
+
+    # Goal cards in two columns: personal, professional
+    card_width = (columns_width - 30) // 2
+    for column, (title, goals) in enumerate((('Personal', spec['personal']), ('Professional', spec['professional']))):
+        x = 60 + column * (card_width + 30)
+        draw.text((x, top), title, font=_font(28), fill=accent)
+        y = top + 45
+        for goal in goals:
+            lines = _wrap(draw, goal, _font(22), card_width - 30)
+            card_height = 20 + 28 * max(len(lines), 1)
+            if y + card_height > height - 40:
+                break
+            draw.rounded_rectangle((x, y, x + card_width, y + card_height), radius=12, fill=(255, 255, 255, 28))
+            for i, line in enumerate(lines):
+                draw.text((x + 15, y + 10 + 28 * i), line, font=_font(22), fill=(255, 255, 255))
+            y += card_height + 12
+    return board
+
+
+def _render_to_file(spec: Dict[str, Any], target: str) -> str:
+    """Runs in a worker process"""
+    if os.path.exists(target):
+        return target
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    board = _render(spec)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as handle:
+        board.save(handle, BOARD_FORMATS[spec['format']], **({'quality': 85} if spec['format'] == 'webp' else {'optimize': False}))
+    os.replace(tmp, target)
+    return target
+
+
+class VisionBoardRenderer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pending: Dict[str, Any] = {}
+        self._stats = {'requests': 0, 'cache_hits': 0, 'renders': 0, 'failures': 0}
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pending = {}
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS)
+        return self._pool
+
+    def submit(self, spec: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue a render unless the board is cached or already rendering"""
+        key = board_key(spec)
+        fmt = spec['format']
+        target = board_path(key, fmt)
+        with self._lock:
+            self._stats['requests'] += 1
+            if os.path.exists(target):
+                self._stats['cache_hits'] += 1
+                return self._status(key, fmt, 'ready')
+            if key in self._pending:
+                return self._status(key, fmt, 'pending')
+            future = self._executor().submit(_render_to_file, spec, target)
+            self._pending[key] = future
+        # Outside the lock: the callback runs inline if the render already finished
+        future.add_done_callback(lambda f: self._done(key, f))
+        return self._status(key, fmt, 'pending')
+
+    def _done(self, key: str, future):
+        with self._lock:
+            self._pending.pop(key, None)
+            if future.exception():
+                self._stats['failures'] += 1
+                logger.warning(f"Vision board render {key} failed: {future.exception()}")
+            else:
+                self._stats['renders'] += 1
+
+    def status(self, key: str, fmt: str) -> Dict[str, Any]:
+        if os.path.exists(board_path(key, fmt)):
+            return self._status(key, fmt, 'ready')
+        with self._lock:
+            if key in self._pending:
+                return self._status(key, fmt, 'pending')
+        return self._status(key, fmt, 'missing')
+
+    @staticmethod
+    def _status(key: str, fmt: str, state: str) -> Dict[str, Any]:
+        status = {'board_id': key, 'format': fmt, 'status': state,
+                  'status_url': f"/api/vision-boards/{key}?format={fmt}"}
+        if state == 'ready':
+            status['image_url'] = media_url(f"/media/boards/{key}.{fmt}")
+        return status
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, 'rendering': len(self._pending), 'workers': RENDER_WORKERS}
+
+
+# Global renderer (per worker process)
+vision_board_renderer = VisionBoardRenderer()
+
+
+def _render_encoded(spec: Dict[str, Any]) -> int:
+    from io import BytesIO
+
+    buffer = BytesIO()
+    _render(spec).save(buffer, BOARD_FORMATS[spec['format']])
+    return buffer.tell()
+
+
+def benchmark(renders: int = 200, processes: int = RENDER_WORKERS) -> Dict[str, Any]:
+    """Renders (including encoding) per second per core; bypasses the disk cache"""
+    specs = [
+        build_spec({'name': f'Bench {i}', 'dreamCareer': 'Software Engineer', 'score': 50 + i % 50},
+                   {'personal': ['Run a marathon', 'Learn Spanish', 'Travel to Japan'],
+                    'professional': ['Ship a product used by millions', 'Mentor junior engineers', f'Goal {i}']})
+        for i in range(renders)
+    ]
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        list(pool.map(_render_encoded, specs, chunksize=max(1, renders // (processes * 4))))
+    elapsed = time.perf_counter() - start
+    return {
+        'renders': renders,
+        'processes': processes,
+        'seconds': round(elapsed, 3),
+        'renders_per_second': round(renders / elapsed, 1),
+        'renders_per_second_per_core': round(renders / elapsed / processes, 1)
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+        workers = int(sys.argv[3]) if len(sys.argv) > 3 else RENDER_WORKERS
+        print(benchmark(count, workers))
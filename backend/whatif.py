@@ -0,0 +1,139 @@
+"""
+What-if sweeps
+Parallel You: AI-Generated Personalized Reality Simulator
+
+Scores a base profile against every combination of alternative careers,
+education levels and habit toggles in one pass. The scoring rules are
+additive, so each axis becomes a vector of contributions and the grid is
+their broadcast sum. Only a summary of the sweep is stored.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import logging
+
+import numpy as np
+
+from scoring import EDUCATION_BONUS, HABIT_BONUSES, career_base_score, age_adjustment, rule_based_score
+from database import get_sweeps_collection
+from ids import new_id
+
+logger = logging.getLogger(__name__)
+
+MAX_CAREERS = 12
+MAX_HABIT_TOGGLES = 6
+MAX_SWEEP_CELLS = 4096
+DEFAULT_TOP = 20
+
+
+def _clamp(scores):
+    return np.clip(scores, 0, 100)
+
+
+def _unique(values: List[Any]) -> List[Any]:
+    return list(dict.fromkeys(values))
+
+
+def _axis(axes: Dict[str, Any], name: str) -> List[str]:
+    values = axes.get(name) or []
+    if not isinstance(values, list) or not all(isinstance(v, str) and v.strip() for v in values):
+        raise ValueError(f"axes.{name} must be a list of non-empty strings")
+    return values
+
+
+def build_axes(base: Dict[str, Any], axes: Dict[str, Any]) -> Dict[str, List[Any]]:
+    """Validate the requested axes; a missing axis keeps the base profile's value"""
+    if not isinstance(axes, dict):
+        raise ValueError("axes must be an object")
+    careers = _unique(_axis(axes, 'careers') or [str(base.get('dreamCareer') or '')])
+    educations = _unique(_axis(axes, 'education') or [str(base.get('education') or '')])
+    toggles = _unique(_axis(axes, 'habits'))
+
+    unknown_education = [e for e in educations if e not in EDUCATION_BONUS and e != base.get('education', '')]
+    if unknown_education:
+        raise ValueError(f"Unknown education levels: {unknown_education}")
+    unknown_habits = [h for h in toggles if h not in HABIT_BONUSES]
+    if unknown_habits:
+        raise ValueError(f"Unknown habits: {unknown_habits}")
+    if len(careers) > MAX_CAREERS:
+        raise ValueError(f"At most {MAX_CAREERS} careers per sweep")
+    if len(toggles) > MAX_HABIT_TOGGLES:
+        raise ValueError(f"At most {MAX_HABIT_TOGGLES} habit toggles per sweep")
+    cells = len(careers) * len(educations) * 2 ** len(toggles)
+    if cells > MAX_SWEEP_CELLS:
+        raise ValueError(f"Sweep has {cells} combinations, limit is {MAX_SWEEP_CELLS}")
+    return {'careers': careers, 'education': educations, 'habits': toggles}
+
+
+def run_sweep(base: Dict[str, Any], axes: Dict[str, Any], top: int = DEFAULT_TOP) -> Dict[str, Any]:
+    """Score the full careers x education x habit-toggle grid against the base profile"""
+    axes = build_axes(base, axes)
+    toggles = axes['habits']
+    fixed_habits = [h for h in base.get('habits', []) if h not in toggles]
+
+    career_scores = np.array([career_base_score(c) for c in axes['careers']], dtype=np.int32)
+    education_scores = np.array([EDUCATION_BONUS.get(e, 0) for e in axes['education']], dtype=np.int32)
+    # Row i of masks says which toggled habits are on in habit variant i
+    masks = (np.arange(2 ** len(toggles))[:, None] >> np.arange(len(toggles))) & 1
+    habit_scores = masks @ np.array([HABIT_BONUSES[h] for h in toggles], dtype=np.int32)
+    constant = age_adjustment(base.get('age', 25)) + sum(HABIT_BONUSES.get(h, 0) for h in fixed_habits)
+
+    scores = _clamp(career_scores[:, None, None] + education_scores[None, :, None]
+                    + habit_scores[None, None, :] + constant)
+    baseline = int(_clamp(rule_based_score(base)))
+    deltas = scores - baseline
+
+    base_habits = set(base.get('habits', []))
+    variants = []
+    for mask in masks:
+        on = {h for h, flag in zip(toggles, mask) if flag}
+        variants.append({'added': sorted(on - base_habits), 'removed': sorted((set(toggles) - on) & base_habits)})
+
+    flat = scores.ravel()
+    order = np.argsort(-flat, kind='stable')[:max(1, top)]
+    ranked = []
+    for rank, index in enumerate(order, 1):
+        c, e, h = np.unravel_index(index, scores.shape)
+        ranked.append({
+            'rank': rank,
+            'career': axes['careers'][c],
+            'education': axes['education'][e],
+            'habits': variants[h],
+            'score': int(flat[index]),
+            'delta': int(flat[index] - baseline)
+        })
+
+    return {
+        'baseline': baseline,
+        'axes': {**axes, 'habit_variants': variants},
+        'shape': list(scores.shape),
+        'scores': scores.tolist(),
+        'deltas': deltas.tolist(),
+        'ranked': ranked,
+        'cells': int(flat.size)
+    }
+
+
+def save_sweep_summary(user_id: Optional[str], base: Dict[str, Any], sweep: Dict[str, Any]) -> Optional[str]:
+    """Persist the axes, baseline and best/worst cells; the grid itself is not stored"""
+    collection = get_sweeps_collection()
+    if collection is None:
+        return None
+    sweep_id = new_id('sweep')
+    try:
+        collection.insert_one({
+            'sweep_id': sweep_id,
+            'user_id': user_id,
+            'base': {k: base.get(k) for k in ('dreamCareer', 'education', 'age', 'habits')},
+            'axes': {k: sweep['axes'][k] for k in ('careers', 'education', 'habits')},
+            'cells': sweep['cells'],
+            'baseline': sweep['baseline'],
+            'best': sweep['ranked'][0],
+            'max_delta': int(np.max(sweep['deltas'])),
+            'min_delta': int(np.min(sweep['deltas'])),
+            'created_at': datetime.now()
+        })
+    except Exception as e:
+        logger.warning(f"Failed to save sweep summary: {e}")
+        return None
+    return sweep_id
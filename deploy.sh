@@ -23,6 +23,10 @@ docker-compose up --build -d
 echo "⏳ Waiting for services to start..."
 sleep 30
 
+# Indexes are created once per deploy, not by every worker
+echo "🗂️  Creating database indexes..."
+docker-compose exec -T backend python backend/manage.py migrate
+
 # Check if services are running
 echo "🔍 Checking service status..."
 docker-compose ps